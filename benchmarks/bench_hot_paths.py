@@ -0,0 +1,88 @@
+import asyncio
+
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymonad.maybe import Just
+
+from tesp_api.utils.docker import docker_run_command
+from tesp_api.service.event_handler import LocalHandler
+from tesp_api.service.task_context import StagedFile
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.api.endpoints.endpoint_utils import get_view
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskView, TesTaskExecutor, TesTaskResources
+
+from benchmarks.harness import measure, run_suite
+from benchmarks.fixtures import registered_task, task_document
+
+SUITE = 'hot_paths'
+
+
+def run_command(volumes: int):
+    executor = TesTaskExecutor(image='alpine', command=['md5sum', '/data/file0'], stdin='/data/file0',
+                               stdout='/data/outfile0', env={'BLASTDB': '/data/GRC38'})
+    inputs = [StagedFile(f'/data/file{i}', f'/pulsar/staging/1/inputs/file{i}') for i in range(0, volumes // 2)]
+    outputs = [StagedFile(f'/data/outfile{i}', f'/pulsar/staging/1/outputs/outfile{i}')
+               for i in range(0, volumes - volumes // 2)]
+    resources = Just(TesTaskResources(cpu_cores=2, ram_gb=4.0))
+    return lambda: docker_run_command(executor, inputs, outputs, resources)
+
+
+def validation(executors: int):
+    document = task_document(executors=executors, inputs=executors, outputs=executors, executor_logs=executors)
+    return lambda: RegisteredTesTask(**document)
+
+
+def view_serialization(view: TesTaskView):
+    task = registered_task(executors=10, inputs=10, outputs=10, executor_logs=10)
+    return lambda: task.json(**get_view(view), by_alias=False)
+
+
+def log_encoding(executor_logs: int):
+    logs = registered_task(executor_logs=executor_logs, log_size=256).logs
+    return lambda: jsonable_encoder(logs)
+
+
+def event_routing():
+    # the same number of patterns the service registers, half of them wildcards
+    handler = LocalHandler()
+    for event_name in ('queued_task', 'initialize_task', 'run_task', 'finalize_task', 'cancel_task',
+                       'queued_*', 'run_*', 'finalize_*', '*_task', '*'):
+        handler.register(lambda event: None, event_name=event_name)
+    return lambda: handler._get_handlers_for_event('run_task')
+
+
+class CollectionStub:
+
+    def __init__(self, document: dict):
+        self.document = document
+
+    async def find_one(self, search_query, projection=None):
+        return self.document
+
+
+def repository_read(loop: asyncio.AbstractEventLoop):
+    # Promise chain of an internal read against a collection answering immediately, measures the chain alone
+    document = task_document(executors=3)
+    repository = TaskRepository()
+    repository._tasks = CollectionStub({'_id': document['_id'], 'state': document['state']})
+    return lambda: loop.run_until_complete(repository.get_task_view({'_id': ObjectId()}, ['state']))
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    run_suite(SUITE, {
+        **{f'docker run command [volumes: {volumes}]': lambda volumes=volumes: measure(run_command(volumes))
+           for volumes in (2, 20, 200)},
+        **{f'task validation [executors: {executors}]': lambda executors=executors: measure(
+            validation(executors), number=100) for executors in (1, 10, 100)},
+        **{f'task serialization [view: {view.value}]': lambda view=view: measure(
+            view_serialization(view), number=200) for view in TesTaskView},
+        **{f'log encoding [executor logs: {logs}]': lambda logs=logs: measure(log_encoding(logs), number=20)
+           for logs in (10, 100, 1000)},
+        'event routing [patterns: 10]': lambda: measure(event_routing(), number=10000),
+        'repository read promise chain': lambda: measure(repository_read(loop), number=2000)})
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
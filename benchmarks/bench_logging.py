@@ -0,0 +1,69 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from loguru import logger
+
+from tesp_api.config.log_config import InterceptLogHandler, RateLimitFilter, BackgroundStreamSink
+from benchmarks.harness import measure, report
+
+POLLS_PER_REQUEST = 10
+PARAMS = {'method': 'GET', 'url': 'http://localhost:8913/jobs/6256a3b8c0e3ab1bb4a6ac1e/status', 'headers': {}}
+
+
+def request_logging(params: dict, eager: bool):
+    # logging done while orchestrating one task request: status poll traces plus stdlib records of the server
+    for _ in range(POLLS_PER_REQUEST):
+        if eager:
+            logger.debug(f'Sending request to pulsar <{params}>')
+        else:
+            logger.opt(lazy=True).debug('Sending request to pulsar <{params}>', params=lambda: params)
+    logging.getLogger('uvicorn.access').info('127.0.0.1 - "GET /v1/tasks HTTP/1.1" 200')
+
+
+@contextmanager
+def stdout_pipe(read_delay: float = 0):
+    # container runtimes read stdout of unbuffered python (PYTHONUNBUFFERED=1) through a pipe,
+    # each record costs a write syscall and waits whenever the reader falls behind
+    read_fd, write_fd = os.pipe()
+
+    def read():
+        while os.read(read_fd, 4096):
+            time.sleep(read_delay)
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    with os.fdopen(write_fd, 'w', buffering=1) as stream:
+        yield stream
+    reader.join()
+    os.close(read_fd)
+
+
+def configure(sink, level: str, rate_limits: dict = None) -> None:
+    logger.configure(handlers=[{'sink': sink, 'level': level, 'filter': RateLimitFilter(rate_limits or {})}])
+
+
+def main():
+    stdlib_logger = logging.getLogger('uvicorn.access')
+    stdlib_logger.handlers, stdlib_logger.propagate = [InterceptLogHandler()], False
+    stdlib_logger.setLevel(logging.INFO)
+    for reader, read_delay in (('fast reader', 0), ('slow reader', 0.001)):
+        with stdout_pipe(read_delay) as stdout:
+            background_sink = BackgroundStreamSink(stdout)
+            scenarios = [
+                ('DEBUG, synchronous sink, eager formatting', stdout, 'DEBUG', None, True),
+                ('DEBUG, background sink, eager formatting', background_sink, 'DEBUG', None, True),
+                ('DEBUG, background sink, poll traces limited', background_sink, 'DEBUG', {__name__: 1}, False),
+                ('INFO, synchronous sink, eager formatting', stdout, 'INFO', None, True),
+                ('INFO, background sink, lazy formatting', background_sink, 'INFO', None, False)]
+            for name, sink, level, rate_limits, eager in scenarios:
+                configure(sink, level, rate_limits)
+                report(f'request [{POLLS_PER_REQUEST} polls, {reader}] {name}',
+                       measure(lambda: request_logging(PARAMS, eager), number=100, repeat=3))
+            logger.remove()
+            background_sink.stop()
+
+
+if __name__ == '__main__':
+    main()
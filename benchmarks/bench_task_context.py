@@ -0,0 +1,74 @@
+import time
+import tracemalloc
+
+from bson.objectid import ObjectId
+
+from tesp_api.utils.types import TransferUrl
+from tesp_api.service.task_context import TaskContext, StagedFile
+
+IN_FLIGHT_TASKS = 10000
+FILES = 5
+# operations are shared by all tasks placed onto the same node
+PULSAR_OPERATIONS = object()
+
+
+def setup_job_result(task_id: ObjectId) -> dict:
+    # job configuration returned by Pulsar for a new job
+    job_directory = f'/opt/pulsar/files/staging/{task_id}'
+    return {'working_directory': f'{job_directory}/working', 'outputs_directory': f'{job_directory}/outputs',
+            'configs_directory': f'{job_directory}/configs', 'tool_files_directory': f'{job_directory}/tool_files',
+            'unstructured_files_directory': f'{job_directory}/unstructured', 'system_properties': {'separator': '/'},
+            'metadata_directory': f'{job_directory}/metadata', 'job_directory': job_directory}
+
+
+def files(task_id: ObjectId):
+    return ([(f'/data/file{i}', f'/opt/pulsar/files/staging/{task_id}/inputs/file{i}', None) for i in range(FILES)],
+            [(f'/data/outfile{i}', f'/opt/pulsar/files/staging/{task_id}/outputs/outfile{i}',
+              TransferUrl(f'ftp://ftpserver:2121/output_{i}', scheme='ftp')) for i in range(FILES)])
+
+
+def payload(task_id: ObjectId) -> dict:
+    # payload of the run phase as it used to be built, each phase extended a copy of the previous one
+    inputs, outputs = files(task_id)
+    return {'task_id': task_id, 'queued_at': time.monotonic(), 'call_cache_key': None,
+            'pulsar_operations': PULSAR_OPERATIONS, 'task_config': setup_job_result(task_id),
+            'input_confs': [{'container_path': container_path, 'pulsar_path': pulsar_path}
+                            for container_path, pulsar_path, _ in inputs],
+            'output_confs': [{'container_path': container_path, 'pulsar_path': pulsar_path, 'url': url}
+                             for container_path, pulsar_path, url in outputs]}
+
+
+def context(task_id: ObjectId) -> TaskContext:
+    inputs, outputs = files(task_id)
+    task_context = TaskContext(task_id)
+    task_context.queued_at = time.monotonic()
+    task_context.pulsar_operations = PULSAR_OPERATIONS
+    task_context.outputs_directory = setup_job_result(task_id)['outputs_directory']
+    task_context.inputs = tuple(StagedFile(*staged_file) for staged_file in inputs)
+    task_context.outputs = tuple(StagedFile(*staged_file) for staged_file in outputs)
+    return task_context
+
+
+def bytes_per_task(build) -> float:
+    # memory retained by the payloads of all in-flight tasks, task ids exist regardless of the payload
+    task_ids = [ObjectId() for _ in range(IN_FLIGHT_TASKS)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    payloads = [build(task_id) for task_id in task_ids]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del payloads
+    return (after - before) / IN_FLIGHT_TASKS
+
+
+def main():
+    dict_payload, task_context = bytes_per_task(payload), bytes_per_task(context)
+    print(f'{f"run phase payload [tasks: {IN_FLIGHT_TASKS}, files: {FILES}+{FILES}] dict":<60} '
+          f'{dict_payload:>12.0f} B/task')
+    print(f'{f"run phase payload [tasks: {IN_FLIGHT_TASKS}, files: {FILES}+{FILES}] task context":<60} '
+          f'{task_context:>12.0f} B/task')
+    print(f'{"":<60} {dict_payload / task_context:>12.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+from tesp_api.repository.model.task import RegisteredTesTask
+from tesp_api.repository.model.task_view import construct_task_view
+
+from benchmarks.harness import measure, report
+from benchmarks.fixtures import task_document
+
+
+def projected(document: dict, fields: list) -> dict:
+    return {'_id': document['_id'], **{field: document[field] for field in fields}}
+
+
+def lifecycle_documents(executors: int) -> list:
+    # documents returned by the repository to event handlers during one task lifecycle, the first
+    # element is the full document (formerly always returned), the second its projection used now
+    document = task_document(executors=executors, executor_logs=executors)
+    reads = [['inputs', 'outputs'], ['executors'], ['logs'], []]  # initialize, run, update start time
+    reads += [['logs'], []] * executors  # executor log append: read and update
+    reads += [[]]  # finalize
+    return [(document, projected(document, fields)) for fields in reads]
+
+
+def main():
+    for executors in (1, 3, 10):
+        documents = lifecycle_documents(executors)
+        validated = measure(lambda: [RegisteredTesTask(**full) for full, _ in documents], number=200)
+        constructed = measure(lambda: [construct_task_view(view) for _, view in documents], number=200)
+        report(f'task lifecycle [executors: {executors}] validated full documents', validated)
+        report(f'task lifecycle [executors: {executors}] constructed projected views', constructed)
+        print(f'{"":<60} {validated / constructed:>12.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
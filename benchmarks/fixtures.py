@@ -0,0 +1,36 @@
+import datetime
+
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskExecutor, TesTaskInput, TesTaskOutput,\
+    TesTaskLog, TesTaskExecutorLog, TesTaskState, TesTaskIOType
+
+
+def registered_task(executors: int = 3, inputs: int = 5, outputs: int = 3, executor_logs: int = 0,
+                    log_size: int = 1024) -> RegisteredTesTask:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return RegisteredTesTask(
+        name='benchmark-task',
+        state=TesTaskState.RUNNING,
+        creation_time=now,
+        executors=[TesTaskExecutor(image='alpine', command=['md5sum', f'/data/file{i}'], stdin=f'/data/file{i}',
+                                   stdout=f'/data/outfile{i}', env={'BLASTDB': '/data/GRC38'})
+                   for i in range(0, executors)],
+        inputs=[TesTaskInput(url=f'ftp://ftpserver:2121/input_{i}', path=f'/data/file{i}', type=TesTaskIOType.FILE)
+                for i in range(0, inputs)],
+        outputs=[TesTaskOutput(url=f'ftp://ftpserver:2121/output_{i}', path=f'/data/outfile{i}',
+                               type=TesTaskIOType.FILE)
+                 for i in range(0, outputs)],
+        tags={'WORKFLOW_ID': 'cwl-01234', 'PROJECT_GROUP': 'alice-lab'},
+        logs=[TesTaskLog(
+            start_time=now, outputs=[], system_logs=[],
+            logs=[TesTaskExecutorLog(start_time=now, end_time=now, stdout='o' * log_size, stderr='e' * log_size,
+                                     exit_code=0)
+                  for _ in range(0, executor_logs)])])
+
+
+def task_document(**kwargs) -> dict:
+    # the same shape as the document stored by TaskRepository
+    document = jsonable_encoder(registered_task(**kwargs), by_alias=True, exclude={"id"})
+    return {'_id': ObjectId(), **document}
@@ -0,0 +1,64 @@
+import sys
+import json
+import timeit
+import argparse
+from pathlib import Path
+from typing import Callable, Dict
+
+BASELINES_PATH = Path(__file__).parent / 'baselines.json'
+
+
+def measure(function: Callable[[], object], number: int = 1000, repeat: int = 5) -> float:
+    # best of the repeats is the least disturbed by the rest of the system, returns seconds per call
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def report(name: str, seconds: float) -> None:
+    print(f'{name:<60} {seconds * 1e6:>12.2f} us/op')
+
+
+def load_baselines(path: Path = BASELINES_PATH) -> Dict[str, Dict[str, float]]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baselines(suite: str, results: Dict[str, float], path: Path = BASELINES_PATH) -> None:
+    baselines = load_baselines(path)
+    baselines[suite] = {name: round(seconds, 9) for name, seconds in sorted(results.items())}
+    path.write_text(json.dumps(baselines, indent=2) + '\n')
+
+
+def regressions(results: Dict[str, float], baselines: Dict[str, float], threshold: float) -> Dict[str, float]:
+    # relative slowdowns above the threshold, benchmarks without a baseline are never regressions
+    return {name: seconds / baselines[name] - 1 for name, seconds in results.items()
+            if baselines.get(name) and seconds > baselines[name] * (1 + threshold)}
+
+
+def run_suite(suite: str, benchmarks: Dict[str, Callable[[], float]]) -> None:
+    # measures the suite, then either stores the results as its baseline or compares them against it
+    # and exits with an error if any benchmark got slower than the threshold allows
+    parser = argparse.ArgumentParser(description=f'{suite} benchmarks')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown, 0.25 is 25%%')
+    parser.add_argument('--baselines', type=Path, default=BASELINES_PATH, help='baselines file')
+    parser.add_argument('-k', dest='selected', default='', help='run only benchmarks containing this text')
+    args = parser.parse_args()
+
+    baselines = load_baselines(args.baselines).get(suite, {})
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if args.selected not in name:
+            continue
+        results[name] = benchmark()
+        baseline = baselines.get(name)
+        change = f'{(results[name] / baseline - 1) * 100:>+8.1f}%' if baseline else f'{"new":>9}'
+        print(f'{name:<60} {results[name] * 1e6:>12.2f} us/op {change}')
+
+    if args.save_baseline:
+        save_baselines(suite, {**baselines, **results}, args.baselines)
+        print(f'Baseline of {suite} saved to {args.baselines}')
+        return
+    slower = regressions(results, baselines, args.threshold)
+    for name, slowdown in slower.items():
+        print(f'REGRESSION {name} is {slowdown * 100:.1f}% slower than its baseline', file=sys.stderr)
+    if slower:
+        sys.exit(1)
@@ -11,6 +11,7 @@ web_concurrency_str = os.getenv("WEB_CONCURRENCY", None)
 host = os.getenv("HOST", "0.0.0.0")
 port = os.getenv("PORT", "8000")
 bind_env = os.getenv("BIND", None)
+graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "30")
 if bind_env:
     use_bind = bind_env
 else:
@@ -28,6 +29,8 @@ else:
 workers = web_concurrency
 bind = use_bind
 keepalive = 120
+# must leave enough time for the worker to drain in-flight events (see shutdown.drain_timeout property)
+graceful_timeout = int(graceful_timeout_str)
 accesslog = "-"
 errorlog = "-"
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -37,6 +40,7 @@ logger_class = gunicorn_logger.StubbedGunicornLogger
 log_data = {
     "workers": workers,
     "bind": bind,
+    "graceful_timeout": graceful_timeout,
     # Additional, non-gunicorn variables
     "workers_per_core": workers_per_core,
     "host": host,
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
 
-from tesp_api.api.endpoints import task_endpoints
+from tesp_api.api.endpoints import task_endpoints, admin_endpoints
 
 
 api_router = APIRouter()
 api_router.include_router(task_endpoints.router, prefix="/v1", tags=["TaskService"])
+api_router.include_router(admin_endpoints.router, prefix="/admin", tags=["Admin"])
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from tesp_api.service.event_dispatcher import describe_in_flight_events
+from tesp_api.api.model.response_models import InFlightEventsResponseModel
+from tesp_api.api.endpoints.endpoint_utils import response_from_model, descriptions
+
+router = APIRouter()
+
+
+@router.get("/events",
+            responses={200: {"description": "Ok"}},
+            response_model=InFlightEventsResponseModel,
+            description=descriptions["admin-events"])
+async def get_in_flight_events() -> Response:
+    return response_from_model(InFlightEventsResponseModel(events=describe_in_flight_events()))
@@ -1,13 +1,24 @@
+import re
+import json
 import time
-from typing import Optional
+import base64
+import hashlib
+import binascii
+from typing import Optional, List, Tuple, Dict, Any
 
 from fastapi import status
 from fastapi.responses import Response
 from pydantic.main import BaseModel
-from pymonad.maybe import Nothing, Maybe
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymonad.maybe import Nothing, Maybe, Just
 from fastapi.params import Query, Depends
 
-from tesp_api.repository.model.task import TesTaskView
+from tesp_api.api.error import InvalidRequestError
+from tesp_api.config.properties import properties
+from tesp_api.utils.functional import maybe_of
+from tesp_api.repository.model.task import TesTaskView, TesTaskState
+from tesp_api.api.model.request_models import TesTasksFilterModel
 from tesp_api.api.model.response_models import ErrorResponseModel
 
 descriptions = {
@@ -18,11 +29,18 @@ descriptions = {
                      " and completed tasks. How long completed tasks are stored by the"
                      " system may be dependent on the underlying implementation.",
     "tasks-delete":  "Cancel a task based on providing an exact task ID.",
+    "tasks-get-batch": "Get tasks based on providing their exact task ID strings, with one database query.",
+    "tasks-cancel-batch": "Cancel all queued, initializing and running tasks matching the filter at once. Respective"
+                          " Pulsar jobs are erased in the background. At least one filter criterion is required.",
     "service-info":  "Provides information about the service"
                      ", this structure is based on the standardized GA4GH"
                      " service info structure. In addition, this endpoint"
                      " will also provide information about customized storage"
-                     " endpoints offered by the TES server."
+                     " endpoints offered by the TES server.",
+    "tasks-stats":   "Provides counts of tasks in each state and for each value of the requested tags, together"
+                     " with duration percentiles of tasks created within the time window.",
+    "admin-events":  "Lists task events currently being processed by this worker, oldest first, together with"
+                     " the operation each of them is executing and the coroutine it is awaiting."
 }
 
 query_descriptions = {
@@ -36,13 +54,29 @@ query_descriptions = {
                    " - MINIMAL: Task message will include ONLY the fields: Task.Id Task.State"
                    " - BASIC: Task message will include all fields EXCEPT: Task.ExecutorLog.stdout"
                    " Task.ExecutorLog.stderr Input.content TaskLog.system_logs"
-                   " - FULL: Task message includes all fields."
+                   " - FULL: Task message includes all fields.",
+    "state":       "OPTIONAL. Filter tasks by state. If unspecified, no task state filtering is done.",
+    "tag_key":     "OPTIONAL. Provide key tag to filter. The field tag_key is an array of key values, and will be"
+                   " zipped with an optional tag_value array. Tasks are filtered to those containing all of the"
+                   " given tag keys and, where the corresponding tag_value is given and not empty, the given values.",
+    "tag_value":   "OPTIONAL. The companion value field for tag_key.",
+    "ids":         "Task IDs to get, the id parameter is repeated for each of them.",
+    "stats_tag_key": "OPTIONAL. Tag keys whose values are counted. Only indexed tag keys are allowed."
+                     " Defaults to all indexed tag keys.",
+    "window_hours": "OPTIONAL. Size of the time window in hours, for which task durations are calculated."
+                    " Defaults to 24."
 }
 
 qry_var_name_prefix = Query(None, description=query_descriptions['name_prefix'])
-qry_var_page_size = Query(256, description=query_descriptions['page_size'])
+qry_var_page_size = Query(256, gt=0, lt=2048, description=query_descriptions['page_size'])
 qry_var_page_token = Query(None, description=query_descriptions['page_token'])
 qry_var_view = Query(TesTaskView.MINIMAL, description=query_descriptions['view'])
+qry_var_state = Query(None, description=query_descriptions['state'])
+qry_var_tag_key = Query(None, description=query_descriptions['tag_key'])
+qry_var_tag_value = Query(None, description=query_descriptions['tag_value'])
+qry_var_stats_tag_keys = Query(None, description=query_descriptions['stats_tag_key'])
+qry_var_window_hours = Query(24, gt=0, description=query_descriptions['window_hours'])
+qry_var_ids = Query(..., alias='id', description=query_descriptions['ids'])
 
 
 async def view_query_params(view: Optional[TesTaskView] = qry_var_view):
@@ -50,17 +84,107 @@ async def view_query_params(view: Optional[TesTaskView] = qry_var_view):
 
 
 async def list_query_params(name_prefix: Optional[str] = qry_var_name_prefix,
+                            state: Optional[TesTaskState] = qry_var_state,
+                            tag_key: Optional[List[str]] = qry_var_tag_key,
+                            tag_value: Optional[List[str]] = qry_var_tag_value,
                             page_size: int = qry_var_page_size,
                             page_token: Optional[str] = qry_var_page_token,
                             view: dict = Depends(view_query_params)):
     return {
         "name_prefix": name_prefix,
+        "state": state,
+        "tag_key": tag_key,
+        "tag_value": tag_value,
         "page_size": page_size,
         "page_token": page_token,
         **view
     }
 
 
+def get_list_filter(query_params: dict) -> Dict[str, Any]:
+    list_filter = {
+        "name_prefix": query_params["name_prefix"],
+        "state": query_params["state"].value if query_params["state"] else None,
+        "tag_key": query_params["tag_key"],
+        "tag_value": query_params["tag_value"]
+    }
+    return {key: value for key, value in list_filter.items() if value}
+
+
+def get_list_filter_query(list_filter: Dict[str, Any]) -> Dict[str, Any]:
+    tag_keys: List[str] = list_filter.get("tag_key", [])
+    tag_values: List[str] = list_filter.get("tag_value", [])
+    if len(tag_values) > len(tag_keys):
+        raise InvalidRequestError("Each tag_value must have its companion tag_key")
+    if any(tag_key.startswith("$") or "." in tag_key for tag_key in tag_keys):
+        raise InvalidRequestError("Tag key must not start with '$' or contain '.'")
+
+    tag_values = tag_values + [""] * (len(tag_keys) - len(tag_values))
+    return {
+        **({"name": {"$regex": f"^{re.escape(list_filter['name_prefix'])}"}} if "name_prefix" in list_filter else {}),
+        **({"state": list_filter["state"]} if "state" in list_filter else {}),
+        **{f"tags.{tag_key}": tag_value if tag_value else {"$exists": True}
+           for tag_key, tag_value in zip(tag_keys, tag_values)}
+    }
+
+
+def encode_page_token(last_id: ObjectId, list_filter: Dict[str, Any]) -> str:
+    # token is opaque to the client, it carries the filter as well so that pages can not be mixed up
+    token = json.dumps({"last_id": str(last_id), "filter": list_filter}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+def decode_page_token(page_token: str, list_filter: Dict[str, Any]) -> Tuple[Maybe[ObjectId], Dict[str, Any]]:
+    try:
+        token = json.loads(base64.urlsafe_b64decode(page_token.encode()))
+        last_id, token_filter = ObjectId(token["last_id"]), token["filter"]
+    except (ValueError, KeyError, TypeError, InvalidId, binascii.Error):
+        raise InvalidRequestError("Invalid page token")
+    if list_filter and list_filter != token_filter:
+        raise InvalidRequestError("Page token was issued for a different filter")
+    return Just(last_id), token_filter
+
+
+def get_page_token_and_filter(query_params: dict) -> Tuple[Maybe[ObjectId], Dict[str, Any]]:
+    list_filter = get_list_filter(query_params)
+    return maybe_of(query_params["page_token"]).maybe(
+        (Nothing, list_filter),
+        lambda page_token: decode_page_token(page_token, list_filter))
+
+
+def parse_task_ids(ids: List[str]) -> List[ObjectId]:
+    if len(ids) > properties.bulk.max_ids:
+        raise InvalidRequestError(f'At most {properties.bulk.max_ids} task IDs can be requested at once')
+    return [ObjectId(task_id) for task_id in ids]
+
+
+async def batch_query_params(ids: List[str] = qry_var_ids, view: dict = Depends(view_query_params)):
+    return {
+        "ids": ids,
+        **view
+    }
+
+
+def get_tasks_filter_query(tasks_filter: TesTasksFilterModel) -> Dict[str, Any]:
+    # unlike list filter, empty filter is refused since it would match all the tasks
+    if not (tasks_filter.ids or tasks_filter.state or tasks_filter.name_prefix or tasks_filter.tag_key):
+        raise InvalidRequestError("At least one of ids, state, name_prefix or tag_key must be given")
+    list_filter = {"name_prefix": tasks_filter.name_prefix, "tag_key": tasks_filter.tag_key,
+                   "tag_value": tasks_filter.tag_value}
+    return {
+        **({"_id": {"$in": parse_task_ids(tasks_filter.ids)}} if tasks_filter.ids else {}),
+        **get_list_filter_query({key: value for key, value in list_filter.items() if value})
+    }
+
+
+async def stats_query_params(tag_key: Optional[List[str]] = qry_var_stats_tag_keys,
+                             window_hours: int = qry_var_window_hours):
+    return {
+        "tag_keys": tag_key,
+        "window_hours": window_hours
+    }
+
+
 def get_view(view: Optional[TesTaskView]) -> dict:
     return {
         TesTaskView.BASIC: {'exclude':
@@ -70,6 +194,33 @@ def get_view(view: Optional[TesTaskView]) -> dict:
     }.get(view, {'exclude': {}})
 
 
+def task_etag(version: int, view: Optional[TesTaskView]) -> str:
+    # representation differs by view, so does its tag
+    return f'"{version}-{view.value if view else TesTaskView.FULL.value}"'
+
+
+def tasks_etag(versions: List[Tuple[ObjectId, int]], has_next_page: bool, view: Optional[TesTaskView]) -> str:
+    page = ','.join(f'{task_id}:{version}' for task_id, version in versions)
+    digest = hashlib.blake2b(f'{page}|{has_next_page}'.encode(), digest_size=16).hexdigest()
+    return f'"{digest}-{view.value if view else TesTaskView.FULL.value}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # weak comparison as required for If-None-Match
+    if not if_none_match:
+        return False
+    return any(tag.strip() == '*' or tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers['ETag'] = etag
+    return response
+
+
 def resource_not_found_response(message: Maybe[str] = Nothing):
     error = ErrorResponseModel(
         timestamp=int(time.time()),
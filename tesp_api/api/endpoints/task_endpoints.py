@@ -1,21 +1,29 @@
 import datetime
+from typing import List, Optional
 
 from pymonad.maybe import Just
 from bson.objectid import ObjectId
 from pymonad.promise import Promise
 from fastapi.params import Depends
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Header
 from fastapi.responses import Response
 
-from tesp_api.api.error import api_handle_error
-from tesp_api.service.event_dispatcher import dispatch_event
+from tesp_api.config.properties import properties
+from tesp_api.api.error import api_handle_error, InvalidRequestError
+from tesp_api.service.event_dispatcher import ensure_admission_open
+from tesp_api.service.task_canceller import task_canceller
+from tesp_api.service.fair_share_scheduler import fair_share_scheduler
 from tesp_api.repository.task_repository import task_repository
 from tesp_api.repository.model.task import TesTask, RegisteredTesTask, TesTaskState, TesTaskLog
 from tesp_api.utils.functional import maybe_of, identity_with_side_effect
+from tesp_api.api.model.request_models import TesTasksFilterModel
 from tesp_api.api.model.task_service_info import TesServiceInfo, TesServiceType, TesServiceOrganization
 from tesp_api.api.model.response_models import \
     TesGetAllTasksResponseModel,\
     TesCreateTaskResponseModel, \
+    TesTaskStatsResponseModel, \
+    TesGetTasksResponseModel, \
+    TesCancelTasksResponseModel, \
     RegisteredTesTaskSchema,\
     TesGetAllTasksResponseSchema
 from tesp_api.api.endpoints.endpoint_utils import \
@@ -23,7 +31,10 @@ from tesp_api.api.endpoints.endpoint_utils import \
     descriptions, \
     view_query_params, \
     get_view, \
-    list_query_params, resource_not_found_response
+    list_query_params, resource_not_found_response, stats_query_params, \
+    get_page_token_and_filter, get_list_filter_query, encode_page_token, \
+    batch_query_params, parse_task_ids, get_tasks_filter_query, \
+    task_etag, tasks_etag, etag_matches, not_modified_response, with_etag
 
 router = APIRouter()
 
@@ -38,43 +49,109 @@ async def create_task(tes_task: TesTask = Body(...)) -> Response:
         state=TesTaskState.QUEUED,
         logs=[TesTaskLog(logs=[], outputs=[], system_logs=[])],
         creation_time=datetime.datetime.now(datetime.timezone.utc).isoformat())
-    return await task_repository.create_task(task_to_create)\
-        .map(lambda task_id: identity_with_side_effect(
-            task_id, lambda _task_id: dispatch_event("queued_task", payload={"task_id": _task_id}))
-        ).map(lambda task_id: response_from_model(TesCreateTaskResponseModel(id=str(task_id))))\
+    return await Promise(lambda resolve, reject: resolve(task_to_create))\
+        .map(lambda task: identity_with_side_effect(task, lambda _task: ensure_admission_open()))\
+        .then(lambda task: task_repository.create_task(task, fair_share_scheduler.queue_fields(task)))\
+        .map(lambda task_id: identity_with_side_effect(task_id, fair_share_scheduler.submit))\
+        .map(lambda task_id: response_from_model(TesCreateTaskResponseModel(id=str(task_id))))\
         .catch(api_handle_error)
 
 
 @router.get("/tasks/{id}",
             responses={
                 200: {"description": "Ok"},
+                304: {"description": "Not modified"},
                 404: {"description": "Not found"}},
             response_model=RegisteredTesTaskSchema,
             description=descriptions["tasks-get"])
-async def get_task(id: str, query_params: dict = Depends(view_query_params)) -> Response:
-    return await Promise(lambda resolve, reject: resolve(id))\
-        .then(lambda _id: task_repository.get_task({'_id': ObjectId(_id)}))\
-        .map(lambda found_task: found_task.maybe(
+async def get_task(id: str, query_params: dict = Depends(view_query_params),
+                   if_none_match: Optional[str] = Header(None)) -> Response:
+    # version is checked first, unchanged task is neither fetched nor serialized
+    def get_changed_task(task_id: ObjectId, version: int):
+        etag = task_etag(version, query_params['view'])
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+        return task_repository.get_task({'_id': task_id}).map(lambda found_task: found_task.maybe(
             resource_not_found_response(Just(f"Task[{id}] not found")),
-            lambda _task: response_from_model(_task, get_view(query_params['view']))
-        )).catch(api_handle_error)
+            lambda _task: with_etag(response_from_model(_task, get_view(query_params['view'])), etag)))
+
+    return await Promise(lambda resolve, reject: resolve(id))\
+        .map(ObjectId)\
+        .then(lambda task_id: task_repository.get_task_version({'_id': task_id})
+              .then(lambda found_version: found_version.maybe(
+                  resource_not_found_response(Just(f"Task[{id}] not found")),
+                  lambda version: get_changed_task(task_id, version))))\
+        .catch(api_handle_error)
 
 
 @router.get("/tasks",
-            responses={200: {"description": "Ok"}},
+            responses={
+                200: {"description": "Ok"},
+                304: {"description": "Not modified"}},
             response_model=TesGetAllTasksResponseSchema,
             description=descriptions["tasks-get-all"])
-async def get_tasks(query_params: dict = Depends(list_query_params)) -> Response:
-    return await Promise(lambda resolve, reject: resolve((
-            maybe_of(query_params['page_size']),
-            maybe_of(query_params['page_token']).map(lambda _p_token: ObjectId(_p_token)),
-            maybe_of(query_params['name_prefix']).map(lambda _name_prefix: {'name': {'$regex': f"^{_name_prefix}"}}))))\
-        .then(lambda get_tasks_args: task_repository.get_tasks(*get_tasks_args))\
-        .map(lambda tasks_and_token: response_from_model(
+async def get_tasks(query_params: dict = Depends(list_query_params),
+                    if_none_match: Optional[str] = Header(None)) -> Response:
+    def get_changed_tasks(token_and_filter, versions_and_next_page):
+        etag = tasks_etag(*versions_and_next_page, query_params['view'])
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+        return task_repository.get_tasks(
+            maybe_of(query_params['page_size']), token_and_filter[0],
+            Just(get_list_filter_query(token_and_filter[1]))
+        ).map(lambda tasks_and_last_id: with_etag(response_from_model(
             TesGetAllTasksResponseModel(
-                next_page_token=str(tasks_and_token[1]),
-                tasks=list(map(lambda task: task.dict(**get_view(query_params['view'])), tasks_and_token[0])))
-        )).catch(api_handle_error)
+                next_page_token=maybe_of(tasks_and_last_id[1]).maybe(
+                    "", lambda last_id: encode_page_token(last_id, token_and_filter[1])),
+                tasks=list(map(lambda task: task.dict(**get_view(query_params['view'])), tasks_and_last_id[0])))
+        ), etag))
+
+    return await Promise(lambda resolve, reject: resolve(query_params))\
+        .map(get_page_token_and_filter)\
+        .then(lambda token_and_filter: task_repository.get_task_versions(
+            maybe_of(query_params['page_size']), token_and_filter[0],
+            Just(get_list_filter_query(token_and_filter[1]))
+        ).then(lambda versions_and_next_page: get_changed_tasks(token_and_filter, versions_and_next_page)))\
+        .catch(api_handle_error)
+
+
+@router.get("/tasks:batch",
+            responses={200: {"description": "Ok"}},
+            response_model=TesGetTasksResponseModel,
+            description=descriptions["tasks-get-batch"])
+async def get_tasks_batch(query_params: dict = Depends(batch_query_params)) -> Response:
+    def to_response(task_ids: List[ObjectId], tasks: List[RegisteredTesTask]) -> Response:
+        found_tasks = {task.id: task for task in tasks}
+        return response_from_model(TesGetTasksResponseModel(
+            tasks=[found_tasks[task_id].dict(**get_view(query_params['view']))
+                   for task_id in task_ids if task_id in found_tasks],
+            not_found=[str(task_id) for task_id in task_ids if task_id not in found_tasks]))
+
+    return await Promise(lambda resolve, reject: resolve(query_params['ids']))\
+        .map(parse_task_ids)\
+        .then(lambda task_ids: task_repository.get_tasks_by_ids(task_ids)
+              .map(lambda tasks: to_response(task_ids, tasks)))\
+        .catch(api_handle_error)
+
+
+@router.get("/tasks:stats",
+            responses={200: {"description": "Ok"}},
+            response_model=TesTaskStatsResponseModel,
+            description=descriptions["tasks-stats"])
+async def get_tasks_stats(query_params: dict = Depends(stats_query_params)) -> Response:
+    def indexed_tag_keys(tag_keys: List[str]) -> List[str]:
+        not_indexed = set(tag_keys) - set(properties.db.indexed_tag_keys)
+        if not_indexed:
+            raise InvalidRequestError(f'Statistics are available only for indexed tag keys '
+                                      f'[not indexed: {", ".join(sorted(not_indexed))}]')
+        return tag_keys
+
+    window_start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=query_params['window_hours'])
+    return await Promise(lambda resolve, reject: resolve(query_params['tag_keys']))\
+        .map(lambda tag_keys: maybe_of(tag_keys).maybe(list(properties.db.indexed_tag_keys), indexed_tag_keys))\
+        .then(lambda tag_keys: task_repository.get_task_stats(tag_keys, window_start))\
+        .map(lambda stats: response_from_model(TesTaskStatsResponseModel(**stats, window_start=window_start)))\
+        .catch(api_handle_error)
 
 
 @router.post("/tasks/{id}:cancel",
@@ -82,8 +159,20 @@ async def get_tasks(query_params: dict = Depends(list_query_params)) -> Response
              description=descriptions["tasks-delete"],)
 async def cancel_task(id: str) -> Response:
     return await Promise(lambda resolve, reject: resolve(id))\
-        .then(lambda task_id: task_repository.cancel_task(ObjectId(task_id)))\
-        .map(lambda task_id: Response(status_code=200, media_type="application/json"))\
+        .then(lambda task_id: task_canceller.cancel_tasks({'_id': ObjectId(task_id)}, None))\
+        .map(lambda counts: Response(status_code=200, media_type="application/json"))\
+        .catch(api_handle_error)
+
+
+@router.post("/tasks:cancel",
+             responses={200: {"description": "Ok"}},
+             response_model=TesCancelTasksResponseModel,
+             description=descriptions["tasks-cancel-batch"])
+async def cancel_tasks(tasks_filter: TesTasksFilterModel = Body(...)) -> Response:
+    return await Promise(lambda resolve, reject: resolve(tasks_filter))\
+        .map(get_tasks_filter_query)\
+        .then(lambda search_query: task_canceller.cancel_tasks(search_query, tasks_filter.state))\
+        .map(lambda counts: response_from_model(TesCancelTasksResponseModel(**counts)))\
         .catch(api_handle_error)
 
 
@@ -7,9 +7,20 @@ from fastapi.responses import Response
 from pydantic.error_wrappers import ValidationError
 
 from tesp_api.repository.error import CustomDataLayerError
+from tesp_api.service.event_dispatcher import EventAdmissionClosedError
 from tesp_api.api.model.response_models import ErrorResponseModel
 
 
+class InvalidRequestError(Exception):
+
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+    def __repr__(self):
+        return f'InvalidRequestError [message: {self.message}]'
+
+
 def get_error_response_model(error_status: HTTPStatus, message: str) -> ErrorResponseModel:
     return ErrorResponseModel(
         timestamp=int(time.time()),
@@ -33,12 +44,22 @@ def api_handle_error(error: Exception) -> Response:
             error_model = get_error_response_model(HTTPStatus.INTERNAL_SERVER_ERROR, message=str(data_layer_error))
             return get_response_for_error_model(error_model)
 
+        # Service is starting up or shutting down, client is expected to retry later
+        case EventAdmissionClosedError() as admission_closed_error:
+            error_model = get_error_response_model(HTTPStatus.SERVICE_UNAVAILABLE, message=str(admission_closed_error))
+            return get_response_for_error_model(error_model)
+
         # Model validation exception, client's failure therefore not logged
         case ValidationError() as request_validation_error:
             exc_str = f'{request_validation_error}'.replace('\n', ' ').replace('   ', ' ')
             error_model = get_error_response_model(HTTPStatus.UNPROCESSABLE_ENTITY, message=exc_str)
             return get_response_for_error_model(error_model)
 
+        # Request parameters validation exception, client's failure therefore not logged
+        case InvalidRequestError() as invalid_request_error:
+            error_model = get_error_response_model(HTTPStatus.BAD_REQUEST, message=str(invalid_request_error))
+            return get_response_for_error_model(error_model)
+
         # ID validation exception, client's failure therefore not logged
         case InvalidId() as invalid_id_error:
             error_model = get_error_response_model(HTTPStatus.BAD_REQUEST, message=str(invalid_id_error))
@@ -0,0 +1,13 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from tesp_api.repository.model.task import TesTaskState
+
+
+class TesTasksFilterModel(BaseModel):
+    ids: List[str] = Field(None, description='Identifiers of the tasks.')
+    state: List[TesTaskState] = Field(None, description='States the tasks must be in.')
+    name_prefix: str = Field(None, description='Prefix the names of the tasks must start with.')
+    tag_key: List[str] = Field(None, description='Tag keys the tasks must have, zipped with tag_value.')
+    tag_value: List[str] = Field(None, description='Companion values of tag_key, empty value matches any value.')
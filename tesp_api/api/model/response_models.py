@@ -1,9 +1,10 @@
-from typing import List
+from typing import List, Dict
+from datetime import datetime
 
 from bson.objectid import ObjectId
 from pydantic import BaseModel, Field
 
-from tesp_api.repository.model.task import RegisteredTesTask
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskState
 
 
 class ErrorResponseModel(BaseModel):
@@ -36,3 +37,45 @@ class TesGetAllTasksResponseModel(BaseModel):
 
     class Config:
         json_encoders = {ObjectId: str}
+
+
+class TesGetTasksResponseModel(BaseModel):
+    tasks: List[dict] = Field(..., description='Found tasks in the order of requested identifiers.')
+    not_found: List[str] = Field(..., description='Requested identifiers of tasks which do not exist.')
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+
+class TesCancelTasksResponseModel(BaseModel):
+    matched: int = Field(..., description='Number of queued, initializing or running tasks matching the filter.')
+    canceled: int = Field(..., description='Number of tasks canceled, tasks finished in the meantime are left out.')
+
+
+class InFlightEventModel(BaseModel):
+    event_name: str = Field(..., description='Name of the event being processed.')
+    task_id: str = Field(None, description='Identifier of the task the event belongs to.')
+    elapsed_seconds: float = Field(..., description='Time since the event was dispatched.')
+    operation: str = Field(None, description='Innermost traced operation the event handler is executing.')
+    awaiting: str = Field(..., description='Innermost coroutine of the event handler and the object it awaits.')
+
+
+class InFlightEventsResponseModel(BaseModel):
+    events: List[InFlightEventModel] = Field(...)
+
+
+class TesTaskDurationStatsModel(BaseModel):
+    count: int = Field(..., description='Number of finished tasks created within the time window.')
+    p50: float = Field(None, description='Median task duration in seconds.')
+    p90: float = Field(None, description='90th percentile of task duration in seconds.')
+    p99: float = Field(None, description='99th percentile of task duration in seconds.')
+
+
+class TesTaskStatsResponseModel(BaseModel):
+    states: Dict[TesTaskState, int] = Field(..., description='Number of tasks in each of the task states.')
+    tags: Dict[str, Dict[str, int]] = Field(..., example={"PROJECT_GROUP": {"alice-lab": 42}},
+                                            description='Number of tasks for each value of the requested tag keys.')
+    durations: TesTaskDurationStatsModel = Field(..., description='Duration percentiles of tasks created within the'
+                                                                  ' time window. Duration spans from task creation'
+                                                                  ' up to the end of its last executor.')
+    window_start: datetime = Field(..., description='Start of the time window, in RFC 3339 format.')
@@ -1,27 +1,108 @@
 import sys
+import time
+import queue
 import logging
+import threading
+from typing import Dict, List, Optional, TextIO, Union
 
 from loguru import logger
 
+from tesp_api.utils.metrics import metrics
 from tesp_api.config.properties import properties
 
+dropped_records = metrics.counter('tesp_log_records_dropped_total', 'Log records dropped before being written',
+                                  ['reason', 'logger'])
+
 
 class InterceptLogHandler(logging.Handler):
 
+    def __init__(self):
+        super().__init__()
+        self._levels: Dict[int, Union[str, int]] = {}
+        self._emitting = threading.local()
+        # stdlib already resolved where the record originates from, copying it over is much cheaper
+        # than walking the stack to find the caller for loguru
+        self._logger = logger.patch(self._patch_origin)
+
+    def _patch_origin(self, loguru_record):
+        record = self._emitting.record
+        loguru_record.update(name=record.name, module=record.module, function=record.funcName, line=record.lineno)
+
+    def _loguru_level(self, record: logging.LogRecord) -> Union[str, int]:
+        # Get corresponding Loguru level if it exists, lookups are cached since there are only few levels
+        if record.levelno not in self._levels:
+            try:
+                self._levels[record.levelno] = logger.level(record.levelname).name
+            except ValueError:
+                self._levels[record.levelno] = record.levelno
+        return self._levels[record.levelno]
+
     def emit(self, record):
+        self._emitting.record = record
+        self._logger.opt(exception=record.exc_info).log(self._loguru_level(record), record.getMessage())
+
+
+class RateLimitFilter:
+    # token bucket per logger, records at WARNING level and above are never dropped
+
+    def __init__(self, limits: Dict[str, float], clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self._buckets: Dict[str, List[float]] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def __call__(self, record) -> bool:
+        name = record['name']
+        rate = self.limits.get(name)
+        if rate is None or record['level'].no >= logging.WARNING:
+            return True
+        now = self.clock()
+        tokens, last_refill = self._buckets.get(name, (rate, now))
+        tokens = min(rate, tokens + (now - last_refill) * rate)
+        if tokens < 1:
+            self._buckets[name] = [tokens, now]
+            self.dropped[name] = self.dropped.get(name, 0) + 1
+            dropped_records.inc(reason='rate_limit', logger=name)
+            return False
+        self._buckets[name] = [tokens - 1, now]
+        return True
+
+
+class BackgroundStreamSink:
+    # formatted messages are handed over to a thread doing the blocking writes, when the buffer is full
+    # messages below WARNING level are dropped rather than stalling the event loop, the rest waits for free space
+
+    def __init__(self, stream: TextIO, max_buffered: int = 10000):
+        self.stream = stream
+        self.dropped = 0
+        self._buffer: queue.Queue = queue.Queue(maxsize=max_buffered)
+        self._thread = threading.Thread(target=self._write, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def __call__(self, message: str):
         try:
-            # Get corresponding Loguru level if it exists
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
+            self._buffer.put_nowait(message)
+        except queue.Full:
+            record = getattr(message, 'record', None)
+            if record and record['level'].no >= logging.WARNING:
+                self._buffer.put(message)
+                return
+            self.dropped += 1
+            dropped_records.inc(reason='buffer_full', logger=record['name'] if record else '')
 
-        # Find caller from where originated the logged message
-        frame, depth = logging.currentframe(), 2
-        while frame.f_code.co_filename == logging.__file__:
-            frame = frame.f_back
-            depth += 1
+    def _write(self):
+        while (message := self._buffer.get()) is not None:
+            self.stream.write(message)
+            if self._buffer.empty():
+                self.stream.flush()
 
-        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+    def stop(self):
+        self._buffer.put(None)
+        self._thread.join()
+        self.stream.flush()
+
+
+_background_sink: Optional[BackgroundStreamSink] = None
 
 
 def get_subsequent_loggers(logger_name):
@@ -30,6 +111,7 @@ def get_subsequent_loggers(logger_name):
 
 
 def logg_configure():
+    global _background_sink
     intercept_handler = InterceptLogHandler()
     logging.root.setLevel(properties.logging.level)
     visited = set()
@@ -44,4 +126,19 @@ def logg_configure():
                 visited.add(subsequent)
             logging.getLogger(name).handlers = [intercept_handler]
 
-    logger.configure(handlers=[{"sink": sys.stdout, "serialize": properties.logging.output_json}])
+    if properties.logging.background and not _background_sink:
+        _background_sink = BackgroundStreamSink(sys.stdout)
+    rate_limits = {limit['logger']: limit['records_per_second'] for limit in properties.logging.rate_limits}
+    logger.configure(handlers=[{
+        "sink": _background_sink if properties.logging.background else sys.stdout,
+        "serialize": properties.logging.output_json,
+        "level": properties.logging.level,
+        "filter": RateLimitFilter(rate_limits)}])
+
+
+def logg_shutdown():
+    global _background_sink
+    if _background_sink:
+        logger.remove()
+        _background_sink.stop()
+        _background_sink = None
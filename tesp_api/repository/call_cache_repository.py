@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from typing import Dict, Any
+
+from pymongo import ASCENDING
+from pymonad.promise import Promise
+
+from tesp_api.utils.functional import maybe_of
+from tesp_api.config.properties import properties
+from tesp_api.repository.error import handle_data_layer_error
+from tesp_api.repository.task_repository import get_mongo_client
+
+
+class CallCacheRepository:
+
+    def __init__(self):
+        self._client = None
+        self._entries = None
+
+    async def init(self):
+        self._client = await get_mongo_client()
+        self._entries = self._client.tesp["call_cache"]
+        # entries are keyed by the task hash itself, expiring ones are removed by mongo
+        await self._entries.create_index([('created_at', ASCENDING)],
+                                         expireAfterSeconds=int(properties.call_cache.ttl_days * 24 * 3600))
+
+    def close(self):
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    def get_entry(self, key: str) -> Promise:
+        return Promise(lambda resolve, reject: resolve(key))\
+            .then(lambda _key: self._entries.find_one({'_id': _key}))\
+            .map(maybe_of)\
+            .catch(handle_data_layer_error)
+
+    def save_entry(self, key: str, entry: Dict[str, Any]) -> Promise:
+        return Promise(lambda resolve, reject: resolve(key))\
+            .then(lambda _key: self._entries.replace_one(
+                {'_id': _key}, {**entry, 'created_at': datetime.now(timezone.utc)}, upsert=True))\
+            .catch(handle_data_layer_error)
+
+    def delete_entry(self, key: str) -> Promise:
+        return Promise(lambda resolve, reject: resolve(key))\
+            .then(lambda _key: self._entries.delete_one({'_id': _key}))\
+            .catch(handle_data_layer_error)
+
+
+call_cache_repository = CallCacheRepository()
@@ -0,0 +1,57 @@
+from urllib.parse import urlsplit
+from typing import Any, Dict, List, Optional
+
+from tesp_api.utils.types import TransferUrl
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskExecutor, TesTaskInput, TesTaskOutput,\
+    TesTaskLog, TesTaskExecutorLog, TesTaskOutputFileLog, TesTaskResources
+
+
+# Documents read by internal event handlers were already validated when the task was created, so they are
+# hydrated with pydantic `construct` which skips validation altogether. Views must never reach API responses.
+
+def _construct_url(url: Optional[str]) -> Optional[TransferUrl]:
+    if url is None:
+        return None
+    parts = urlsplit(url)
+    return TransferUrl(url, scheme=parts.scheme, user=parts.username, password=parts.password, host=parts.hostname,
+                  port=str(parts.port) if parts.port else None, path=parts.path or None,
+                  query=parts.query or None, fragment=parts.fragment or None)
+
+
+def _construct_list(documents: Optional[List[Dict[str, Any]]], construct) -> Optional[list]:
+    return None if documents is None else [construct(document) for document in documents]
+
+
+def _construct_input(document: Dict[str, Any]) -> TesTaskInput:
+    return TesTaskInput.construct(**{**document, 'url': _construct_url(document.get('url'))})
+
+
+def _construct_output(document: Dict[str, Any]) -> TesTaskOutput:
+    return TesTaskOutput.construct(**{**document, 'url': _construct_url(document.get('url'))})
+
+
+def _construct_log(document: Dict[str, Any]) -> TesTaskLog:
+    return TesTaskLog.construct(**{
+        **document,
+        'logs': _construct_list(document.get('logs'), lambda log: TesTaskExecutorLog.construct(**log)),
+        'outputs': _construct_list(document.get('outputs'), lambda output: TesTaskOutputFileLog.construct(**{
+            **output, 'url': _construct_url(output.get('url'))}))})
+
+
+_field_constructors = {
+    'inputs': lambda inputs: _construct_list(inputs, _construct_input),
+    'outputs': lambda outputs: _construct_list(outputs, _construct_output),
+    'executors': lambda executors: _construct_list(executors, lambda executor: TesTaskExecutor.construct(**executor)),
+    'logs': lambda logs: _construct_list(logs, _construct_log),
+    'resources': lambda resources: None if resources is None else TesTaskResources.construct(**resources)
+}
+
+
+def construct_task_view(document: Dict[str, Any]) -> RegisteredTesTask:
+    fields = {field: _field_constructors.get(field, lambda value: value)(value)
+              for field, value in document.items() if field != '_id'}
+    fields_set = set(fields.keys())
+    if '_id' in document:
+        fields['id'] = document['_id']
+        fields_set.add('id')
+    return RegisteredTesTask.construct(_fields_set=fields_set, **fields)
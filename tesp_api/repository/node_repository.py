@@ -0,0 +1,91 @@
+from typing import Dict, List
+
+from bson.objectid import ObjectId
+from pymonad.promise import Promise
+from pymongo import ReturnDocument
+
+from tesp_api.utils.functional import maybe_of
+from tesp_api.repository.error import handle_data_layer_error
+from tesp_api.repository.task_repository import get_mongo_client
+
+
+class NodeRepository:
+    # Usage of backend nodes is shared by all service workers. Tasks placed onto a node are recorded in its document
+    # along their requested resources, so a placement and the usage of the node change by one atomic update.
+
+    def __init__(self):
+        self._client = None
+        self._nodes = None
+
+    async def init(self):
+        self._client = await get_mongo_client()
+        self._nodes = self._client.tesp["nodes"]
+
+    def close(self):
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    def register_nodes(self, node_names: List[str], unused: Dict[str, float]) -> Promise:
+        async def register():
+            for node_name in node_names:
+                await self._nodes.update_one(
+                    {'_id': node_name}, {'$setOnInsert': {'used': unused, 'tasks': {}}}, upsert=True)
+
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: register())\
+            .catch(handle_data_layer_error)
+
+    def get_usage(self) -> Promise:
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: self._nodes.find({}, {'used': 1}).to_list(None))\
+            .map(lambda nodes: {node['_id']: node['used'] for node in nodes})\
+            .catch(handle_data_layer_error)
+
+    def get_placed_task_ids(self) -> Promise:
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: self._nodes.find({}, {'tasks': 1}).to_list(None))\
+            .map(lambda nodes: [ObjectId(task_id) for node in nodes for task_id in node.get('tasks', {})])\
+            .catch(handle_data_layer_error)
+
+    def claim(self, node_name: str, task_id: ObjectId, requested: Dict[str, float],
+              used_limits: Dict[str, float]) -> Promise:
+        # task is placed only if the node still has the requested resources free, regardless of which worker
+        # took the rest of them meanwhile
+        search_query = {'_id': node_name, f'tasks.{str(task_id)}': {'$exists': False},
+                        **{f'used.{dimension}': {'$lte': limit} for dimension, limit in used_limits.items()}}
+        update_query = {'$inc': {f'used.{dimension}': amount for dimension, amount in requested.items()},
+                        '$set': {f'tasks.{str(task_id)}': requested}}
+        return Promise(lambda resolve, reject: resolve(search_query))\
+            .then(lambda _search_query: self._nodes.find_one_and_update(
+                _search_query, update_query, {'_id': 1}, return_document=ReturnDocument.AFTER))\
+            .map(maybe_of)\
+            .catch(handle_data_layer_error)
+
+    def get_placement(self, task_id: ObjectId) -> Promise:
+        return Promise(lambda resolve, reject: resolve(task_id))\
+            .then(lambda _task_id: self._nodes.find_one({f'tasks.{str(_task_id)}': {'$exists': True}}, {'_id': 1}))\
+            .map(lambda node: maybe_of(node).map(lambda _node: _node['_id']))\
+            .catch(handle_data_layer_error)
+
+    def release(self, task_id: ObjectId) -> Promise:
+        # requested resources of the placement never change, only the release removing it frees them
+        async def release():
+            key = f'tasks.{str(task_id)}'
+            node = await self._nodes.find_one({key: {'$exists': True}}, {key: 1})
+            if node is None:
+                return None
+            requested = node['tasks'][str(task_id)]
+            released = await self._nodes.update_one(
+                {'_id': node['_id'], key: {'$exists': True}},
+                {'$inc': {f'used.{dimension}': -amount for dimension, amount in requested.items()},
+                 '$unset': {key: ''}})
+            return node['_id'] if released.modified_count else None
+
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: release())\
+            .map(maybe_of)\
+            .catch(handle_data_layer_error)
+
+
+node_repository = NodeRepository()
@@ -1,15 +1,21 @@
-from typing import Dict, Any
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Tuple, Union
 
 from pymonad.maybe import Maybe, Nothing
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
 from pymonad.promise import Promise
 from bson.objectid import ObjectId
 from fastapi.encoders import jsonable_encoder
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCursor
 
 from tesp_api.repository.error import handle_data_layer_error
+from tesp_api.repository.write_coalescer import WriteCoalescer
+from tesp_api.utils.tracing import traced
 from tesp_api.utils.functional import maybe_of
 from tesp_api.config.properties import properties
+from tesp_api.repository.model.task_view import construct_task_view
 from tesp_api.repository.model.task import RegisteredTesTask, TesTaskState
 
 
@@ -18,18 +24,80 @@ async def get_mongo_client() -> AsyncIOMotorClient:
     return mongo_client
 
 
+UpdateQuery = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+
+def versioned(update_query: UpdateQuery) -> UpdateQuery:
+    # every update of the task increments its version, API derives ETags of tasks from it
+    if isinstance(update_query, list):
+        return [*update_query, {'$set': {'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}}}]
+    return {**update_query, '$inc': {**update_query.get('$inc', {}), 'version': 1}}
+
+
+# seconds, bounds of task duration histogram percentiles are estimated from on MongoDB older than 7.0
+DURATION_BUCKETS = (0, 1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+
+def _estimate_percentiles(buckets: List[Dict[str, Any]], percentiles: List[float]) -> Dict[str, Any]:
+    # linear interpolation between the smallest and the largest duration of the bucket the percentile falls into
+    buckets = sorted(buckets, key=lambda bucket: bucket['min'])
+    count = sum(bucket['count'] for bucket in buckets)
+    estimates = {'count': count}
+    for percentile in percentiles if count else []:
+        rank, preceding = percentile * count, 0
+        for bucket in buckets:
+            if preceding + bucket['count'] >= rank:
+                break
+            preceding += bucket['count']
+        fraction = (rank - preceding) / bucket['count']
+        estimates[f'p{round(percentile * 100)}'] = bucket['min'] + fraction * (bucket['max'] - bucket['min'])
+    return estimates
+
+
 class TaskRepository:
 
     def __init__(self):
         self._client = None
         self._tasks = None
+        self._percentile_supported = True
+        self.write_coalescer = WriteCoalescer(
+            properties.db.write_behind.window,
+            properties.db.write_behind.max_batch,
+            properties.db.write_behind.max_pending)
 
     async def init(self):
         self._client = await get_mongo_client()
         self._tasks = self._client.tesp["tasks"]
+        self._percentile_supported = (await self._client.server_info())['versionArray'][:2] >= [7, 0]
+        await self._create_indexes()
+        self.write_coalescer.start(self._tasks)
+
+    async def _create_indexes(self):
+        # compound indexes with _id turn filtered pages into index range scans
+        await self._tasks.create_index([('state', ASCENDING), ('_id', ASCENDING)])
+        await self._tasks.create_index('creation_time')
+        for tag_key in properties.db.indexed_tag_keys:
+            await self._tasks.create_index([(f'tags.{tag_key}', ASCENDING), ('_id', ASCENDING)])
+        # heads of the fair share queues, by priority and by age
+        await self._tasks.create_index([('state', ASCENDING), ('queue.group', ASCENDING),
+                                        ('queue.priority', DESCENDING), ('creation_time', ASCENDING)])
+        await self._tasks.create_index([('state', ASCENDING), ('queue.group', ASCENDING), ('creation_time', ASCENDING)])
+        # execution slot is held by at most one task, across all service workers
+        await self._tasks.create_index('queue.slot', unique=True,
+                                       partialFilterExpression={'queue.slot': {'$exists': True}})
+        # only tasks with not yet erased Pulsar job are indexed
+        await self._tasks.create_index([('pulsar_job.node', ASCENDING), ('state', ASCENDING)], sparse=True)
+        await self._tasks.create_index('cancel_batch', sparse=True)
+        await self._tasks.create_index('requeued', sparse=True)
 
-    def create_task(self, task: RegisteredTesTask) -> Promise:
-        task = jsonable_encoder(task, by_alias=True, exclude={"id"})
+    def close(self):
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    def create_task(self, task: RegisteredTesTask, internal_fields: Dict[str, Any] = None) -> Promise:
+        # internal fields are stored along the task but never make it to the model
+        task = {**jsonable_encoder(task, by_alias=True, exclude={"id"}), **(internal_fields or {}), 'version': 1}
         return Promise(lambda resolve, reject: resolve(task)) \
             .then(self._tasks.insert_one) \
             .map(lambda created_task: created_task.inserted_id)\
@@ -40,12 +108,52 @@ class TaskRepository:
         return Promise(lambda resolve, reject: resolve((search_query, update_query)))\
             .then(lambda search_and_update_query: self._tasks.find_one_and_update(
                 search_and_update_query[0],
-                search_and_update_query[1],
+                versioned(search_and_update_query[1]),
                 return_document=ReturnDocument.AFTER
             )).map(lambda task: maybe_of(task)
                    .map(lambda _task: RegisteredTesTask(**task)))\
             .catch(handle_data_layer_error)
 
+    @staticmethod
+    def _projection(fields: List[str]) -> Dict[str, int]:
+        return {'_id': 1, **{field: 1 for field in fields}}
+
+    async def _settled(self, search_query: Dict[str, Any]) -> Dict[str, Any]:
+        # internal readers and writers of the task must see its coalesced updates
+        await self.write_coalescer.settle(search_query.get('_id'))
+        return search_query
+
+    def update_task_view_later(self, search_query: Dict[str, Any], update_query: UpdateQuery) -> Promise:
+        # non-critical update is flushed along updates of other tasks, whether it matched is never known
+        return Promise(lambda resolve, reject: resolve((search_query, update_query)))\
+            .then(lambda search_and_update_query: self.write_coalescer.submit(
+                search_and_update_query[0]['_id'], search_and_update_query[0],
+                versioned(search_and_update_query[1])))\
+            .catch(handle_data_layer_error)
+
+    def update_task_view(self, search_query: Dict[str, Any], update_query: Dict[str, Any],
+                         projection: List[str]) -> Promise:
+        # internal counterpart of update_task, returns only projected fields without validation
+        return Promise(lambda resolve, reject: resolve(search_query))\
+            .then(self._settled)\
+            .map(lambda _search_query: (_search_query, update_query))\
+            .then(lambda search_and_update_query: traced('mongo.find_one_and_update', self._tasks.find_one_and_update(
+                search_and_update_query[0],
+                versioned(search_and_update_query[1]),
+                projection=self._projection(projection),
+                return_document=ReturnDocument.AFTER
+            ))).map(lambda task: maybe_of(task).map(construct_task_view))\
+            .catch(handle_data_layer_error)
+
+    def get_task_view(self, search_query: Dict[str, Any], projection: List[str]) -> Promise:
+        # internal counterpart of get_task, returns only projected fields without validation
+        return Promise(lambda resolve, reject: resolve(search_query))\
+            .then(self._settled)\
+            .then(lambda _search_query: traced(
+                'mongo.find_one', self._tasks.find_one(_search_query, self._projection(projection))))\
+            .map(lambda task: maybe_of(task).map(construct_task_view))\
+            .catch(handle_data_layer_error)
+
     def get_task(self, search_query: Dict[str, Any]) -> Promise:
         return Promise(lambda resolve, reject: resolve(search_query)) \
             .then(self._tasks.find_one) \
@@ -53,30 +161,239 @@ class TaskRepository:
                  .map(lambda _task: RegisteredTesTask(**_task)))\
             .catch(handle_data_layer_error)
 
+    def get_task_version(self, search_query: Dict[str, Any]) -> Promise:
+        # only the version is read, unchanged task does not have to be fetched whole
+        return Promise(lambda resolve, reject: resolve(search_query))\
+            .then(lambda _search_query: self._tasks.find_one(_search_query, {'version': 1}))\
+            .map(lambda task: maybe_of(task).map(lambda _task: _task.get('version', 0)))\
+            .catch(handle_data_layer_error)
+
+    def _find_page(self, p_size: Maybe[int], p_token: Maybe[ObjectId], search_query: Maybe[Dict[str, Any]],
+                   projection: Dict[str, int] = None):
+        # keyset pagination over explicitly sorted ids, one extra task is read to find out whether next page exists
+        token_query = p_token.maybe({}, lambda _p_token: {'_id': {'$gt': _p_token}})
+        cursor = self._tasks.find({**token_query, **search_query.maybe({}, lambda x: x)}, projection)\
+            .sort('_id', ASCENDING)
+        return p_size.maybe(cursor, lambda x: cursor.limit(x + 1)).to_list(None)
+
     def get_tasks(self, p_size: Maybe[int] = Nothing,
                   p_token: Maybe[ObjectId] = Nothing,
                   search_query: Maybe[Dict[str, Any]] = Nothing) -> Promise:
-        def to_size_and_query():
-            token_query = p_token.maybe({}, lambda _p_token: {'_id': {'$gt': _p_token}})
-            _search_query = search_query.maybe({}, lambda x: x)
-            return p_size, {**token_query, **_search_query}
-        return Promise(lambda resolve, reject: resolve(to_size_and_query())) \
-            .then(lambda size_and_query: size_and_query[0].maybe(
-                    self._tasks.find(size_and_query[1]),
-                    lambda x: self._tasks.find(size_and_query[1]).limit(x)
-                 ).to_list(None)
-            ).map(lambda found_tasks: list(map(lambda task: RegisteredTesTask(**task), found_tasks))) \
-            .map(lambda found_tasks: (found_tasks, found_tasks[-1].id if found_tasks else None))\
-            .catch(handle_data_layer_error)
-
-    def cancel_task(self, task_id: ObjectId) -> Promise:
+        def to_page(found_tasks):
+            return p_size.maybe(
+                (found_tasks, None),
+                lambda x: (found_tasks[:x], found_tasks[x - 1].id if len(found_tasks) > x else None))
+
+        return Promise(lambda resolve, reject: resolve(search_query)) \
+            .then(lambda _search_query: self._find_page(p_size, p_token, _search_query)) \
+            .map(lambda found_tasks: list(map(lambda task: RegisteredTesTask(**task), found_tasks))) \
+            .map(to_page)\
+            .catch(handle_data_layer_error)
+
+    def get_task_versions(self, p_size: Maybe[int] = Nothing,
+                          p_token: Maybe[ObjectId] = Nothing,
+                          search_query: Maybe[Dict[str, Any]] = Nothing) -> Promise:
+        # ids and versions of the tasks get_tasks would return, together with whether next page exists
+        def to_page(found_tasks) -> Tuple[List[Tuple[ObjectId, int]], bool]:
+            versions = [(task['_id'], task.get('version', 0)) for task in found_tasks]
+            return p_size.maybe((versions, False), lambda x: (versions[:x], len(versions) > x))
+
+        return Promise(lambda resolve, reject: resolve(search_query)) \
+            .then(lambda _search_query: self._find_page(p_size, p_token, _search_query, {'version': 1})) \
+            .map(to_page)\
+            .catch(handle_data_layer_error)
+
+    def get_task_stats(self, tag_keys: List[str], window_start: datetime,
+                       percentiles: List[float] = (0.5, 0.9, 0.99)) -> Promise:
+        async def count_by_state():
+            counts = await asyncio.gather(*[self._tasks.count_documents({'state': state}) for state in TesTaskState])
+            return {state: count for state, count in zip(TesTaskState, counts)}
+
+        async def count_by_tag(tag_key: str):
+            counts = await self._tasks.aggregate([
+                {'$match': {f'tags.{tag_key}': {'$exists': True}}},
+                {'$group': {'_id': f'$tags.{tag_key}', 'count': {'$sum': 1}}}
+            ]).to_list(None)
+            return {count['_id']: count['count'] for count in counts}
+
+        async def duration_percentiles():
+            # task duration spans from its creation up to the end of its last executor. Percentiles are estimated
+            # by the database in bounded memory (MongoDB 7.0+) or from its histogram of durations, only the summary
+            # leaves it
+            durations = [
+                {'$match': {'creation_time': {'$gte': window_start.isoformat()}}},
+                {'$project': {'duration': {'$divide': [{'$subtract': [
+                    {'$dateFromString': {'dateString': {'$last': '$logs.end_time'}, 'onNull': None, 'onError': None}},
+                    {'$dateFromString': {'dateString': '$creation_time', 'onNull': None, 'onError': None}}]}, 1000]}}},
+                {'$match': {'duration': {'$type': 'number'}}}]
+            if not self._percentile_supported:
+                buckets = await self._tasks.aggregate([*durations, {'$bucket': {
+                    'groupBy': '$duration', 'boundaries': list(DURATION_BUCKETS), 'default': 'overflow',
+                    'output': {'count': {'$sum': 1}, 'min': {'$min': '$duration'}, 'max': {'$max': '$duration'}}}}
+                ]).to_list(None)
+                return _estimate_percentiles(buckets, percentiles)
+            summary = await self._tasks.aggregate([
+                *durations,
+                {'$group': {'_id': None, 'count': {'$sum': 1}, 'percentiles': {'$percentile': {
+                    'input': '$duration', 'p': list(percentiles), 'method': 'approximate'}}}},
+                {'$project': {'_id': 0, 'count': 1, **{
+                    f'p{round(percentile * 100)}': {'$arrayElemAt': ['$percentiles', index]}
+                    for index, percentile in enumerate(percentiles)}}}
+            ]).to_list(None)
+            return summary[0] if summary else {'count': 0}
+
+        return Promise(lambda resolve, reject: resolve(tag_keys))\
+            .then(lambda _tag_keys: asyncio.gather(
+                count_by_state(), duration_percentiles(), *[count_by_tag(tag_key) for tag_key in _tag_keys]))\
+            .map(lambda stats: {
+                'states': stats[0],
+                'durations': stats[1],
+                'tags': {tag_key: tag_counts for tag_key, tag_counts in zip(tag_keys, stats[2:])}})\
+            .catch(handle_data_layer_error)
+
+    def backfill_queue_fields(self, queue_fields: Dict[str, Any]) -> Promise:
+        return Promise(lambda resolve, reject: resolve(queue_fields))\
+            .then(lambda _queue_fields: self._tasks.update_many(
+                {'state': TesTaskState.QUEUED, 'queue': {'$exists': False}}, {'$set': _queue_fields}))\
+            .catch(handle_data_layer_error)
+
+    def get_queue_summary(self) -> Promise:
+        # queued tasks holding execution slot wait for their retry
+        async def group_summary(group: str):
+            query = {'state': TesTaskState.QUEUED, 'queue.group': group, 'queue.slot': {'$exists': False}}
+            depth, oldest = await asyncio.gather(
+                self._tasks.count_documents(query),
+                self._tasks.find_one(query, {'creation_time': 1}, sort=[('creation_time', ASCENDING)]))
+            return {'group': group, 'depth': depth, 'oldest': oldest.get('creation_time') if oldest else None}
+
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: self._tasks.distinct('queue.group', {'state': TesTaskState.QUEUED}))\
+            .then(lambda groups: asyncio.gather(*[group_summary(group) for group in groups]))\
+            .map(lambda summaries: [summary for summary in summaries if summary['depth'] > 0])\
+            .catch(handle_data_layer_error)
+
+    def get_queue_heads(self, group: str) -> Promise:
+        # highest priority and the oldest task of the group, both read by index
+        query = {'state': TesTaskState.QUEUED, 'queue.group': group, 'queue.slot': {'$exists': False}}
+        projection = {'queue': 1, 'creation_time': 1}
+        return Promise(lambda resolve, reject: resolve(query))\
+            .then(lambda _query: asyncio.gather(
+                self._tasks.find_one(_query, projection, sort=[('queue.priority', DESCENDING),
+                                                               ('creation_time', ASCENDING)]),
+                self._tasks.find_one(_query, projection, sort=[('creation_time', ASCENDING)])))\
+            .map(lambda heads: [head for head in heads if head is not None])\
+            .catch(handle_data_layer_error)
+
+    def get_slot_holders(self) -> Promise:
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: self._tasks.find({'queue.slot': {'$exists': True}}, {'queue': 1}).to_list(None))\
+            .catch(handle_data_layer_error)
+
+    def claim_slot(self, task_id: ObjectId, slot: int) -> Promise:
+        # task is granted the slot only if it is still queued and neither the task nor the slot was claimed meanwhile
+        async def claim():
+            try:
+                return maybe_of(await self._tasks.find_one_and_update(
+                    {'_id': task_id, 'state': TesTaskState.QUEUED, 'queue.slot': {'$exists': False}},
+                    {'$set': {'queue.slot': slot, 'heartbeat_time': datetime.now(timezone.utc).isoformat()}},
+                    {'_id': 1}))
+            except DuplicateKeyError:
+                return Nothing
+
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: claim())\
+            .catch(handle_data_layer_error)
+
+    def claim_requeued_task(self) -> Promise:
+        # task queued again after shutdown of its service worker is resumed by exactly one of the other workers
+        return Promise(lambda resolve, reject: resolve(None))\
+            .then(lambda nothing: self._tasks.find_one_and_update(
+                {'requeued': True, 'state': TesTaskState.QUEUED}, {'$unset': {'requeued': ''}}, {'_id': 1}))\
+            .map(maybe_of)\
+            .catch(handle_data_layer_error)
+
+    def release_slot(self, task_id: ObjectId) -> Promise:
         return Promise(lambda resolve, reject: resolve(task_id))\
-            .then(lambda _task_id: self.update_task(
-                {'_id': task_id},
-                {'$set': {'state': TesTaskState.CANCELED}}
-            )).map(lambda updated_task: updated_task
-                   .map(lambda _updated_task: _updated_task.id))\
+            .then(lambda _task_id: self._tasks.update_one({'_id': _task_id}, {'$unset': {'queue.slot': ''}}))\
+            .catch(handle_data_layer_error)
+
+    def release_finished_slots(self) -> Promise:
+        # slots of tasks which finished without releasing them, e.g. when processed by crashed service worker
+        query = {'queue.slot': {'$exists': True},
+                 'state': {'$nin': [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]}}
+        return Promise(lambda resolve, reject: resolve(query))\
+            .then(lambda _query: self._tasks.update_many(_query, {'$unset': {'queue.slot': ''}}))\
+            .map(lambda update_result: update_result.modified_count)\
             .catch(handle_data_layer_error)
 
+    def get_orphaned_jobs(self, unprocessed_since: datetime, limit: int) -> Promise:
+        # Pulsar jobs recorded by tasks which are no longer processed, owning worker may still be finishing recent ones
+        query = {'pulsar_job.node': {'$exists': True},
+                 'state': {'$nin': [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]},
+                 '$or': [{'heartbeat_time': {'$lt': unprocessed_since.isoformat()}},
+                         {'heartbeat_time': {'$exists': False}}]}
+        return Promise(lambda resolve, reject: resolve(query))\
+            .then(lambda _query: self._tasks.find(_query, {'pulsar_job': 1})
+                  .sort('erase_attempt_time', ASCENDING).limit(limit).to_list(None))\
+            .catch(handle_data_layer_error)
+
+    def record_failed_erase(self, task_id: ObjectId, now: datetime) -> Promise:
+        # jobs never attempted to be erased sort first, jobs failing repeatedly do not keep the others waiting
+        return Promise(lambda resolve, reject: resolve(task_id))\
+            .then(lambda _task_id: self._tasks.update_one(
+                {'_id': _task_id}, {'$set': {'erase_attempt_time': now.isoformat()}}))\
+            .catch(handle_data_layer_error)
+
+    def refresh_heartbeats(self, task_ids: List[ObjectId], now: datetime) -> Promise:
+        # service worker processing the tasks keeps them from being considered stale by the other workers
+        query = {'_id': {'$in': task_ids},
+                 'state': {'$in': [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]}}
+        return Promise(lambda resolve, reject: resolve(query))\
+            .then(lambda _query: self._tasks.update_many(_query, {'$set': {'heartbeat_time': now.isoformat()}}))\
+            .catch(handle_data_layer_error)
+
+    @staticmethod
+    def stale_tasks_query(unprocessed_since: datetime) -> Dict[str, Any]:
+        # tasks started or holding execution slot without heartbeat of their worker, tasks never refreshed by any
+        # worker are measured from their creation
+        return {'$and': [
+            {'$or': [{'state': {'$in': [TesTaskState.INITIALIZING, TesTaskState.RUNNING]}},
+                     {'state': TesTaskState.QUEUED, 'queue.slot': {'$exists': True}}]},
+            {'$or': [{'heartbeat_time': {'$lt': unprocessed_since.isoformat()}},
+                     {'heartbeat_time': {'$exists': False}, 'creation_time': {'$lt': unprocessed_since.isoformat()}}]}]}
+
+    def get_stale_tasks(self, unprocessed_since: datetime, limit: int) -> Promise:
+        return Promise(lambda resolve, reject: resolve(self.stale_tasks_query(unprocessed_since)))\
+            .then(lambda _query: self._tasks.find(_query, {'state': 1}).limit(limit).to_list(None))\
+            .catch(handle_data_layer_error)
+
+    def forget_pulsar_job(self, task_id: ObjectId) -> Promise:
+        return self.update_task_view_later({'_id': task_id}, {'$unset': {'pulsar_job': '', 'erase_attempt_time': ''}})
+
+    def get_active_task_ids(self, task_ids: List[ObjectId]) -> Promise:
+        query = {'_id': {'$in': task_ids},
+                 'state': {'$in': [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]}}
+        return Promise(lambda resolve, reject: resolve(query))\
+            .then(lambda _query: self._tasks.find(_query, {'_id': 1}).to_list(None))\
+            .map(lambda found_tasks: [task['_id'] for task in found_tasks])\
+            .catch(handle_data_layer_error)
+
+    def get_tasks_by_ids(self, task_ids: List[ObjectId]) -> Promise:
+        return Promise(lambda resolve, reject: resolve(task_ids))\
+            .then(lambda _task_ids: self._tasks.find({'_id': {'$in': _task_ids}}).to_list(None))\
+            .map(lambda found_tasks: list(map(lambda task: RegisteredTesTask(**task), found_tasks)))\
+            .catch(handle_data_layer_error)
+
+    def cancel_tasks(self, search_query: Dict[str, Any], cancel_batch: ObjectId) -> Promise:
+        # tasks canceled at once are marked by their batch, so they are read back without listing them upfront
+        return Promise(lambda resolve, reject: resolve(search_query))\
+            .then(lambda _search_query: self._tasks.update_many(
+                _search_query, versioned({'$set': {'state': TesTaskState.CANCELED, 'cancel_batch': cancel_batch}})))\
+            .map(lambda update_result: (update_result.matched_count, update_result.modified_count))\
+            .catch(handle_data_layer_error)
+
+    def find_canceled_tasks(self, cancel_batch: ObjectId) -> AsyncIOMotorCursor:
+        return self._tasks.find({'cancel_batch': cancel_batch}, {'pulsar_job': 1})
+
 
 task_repository = TaskRepository()
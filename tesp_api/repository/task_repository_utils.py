@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Dict, Any
 
 from bson.objectid import ObjectId
 from fastapi.encoders import jsonable_encoder
@@ -8,30 +8,43 @@ from pymonad.maybe import Just, Maybe, Nothing
 from tesp_api.service.error import TaskNotFoundError
 from tesp_api.utils.functional import get_else_throw
 from tesp_api.repository.task_repository import task_repository
-from tesp_api.repository.model.task import RegisteredTesTask, TesTaskState, TesTaskLog, TesTaskExecutorLog
+from tesp_api.repository.model.task import TesTaskState, TesTaskExecutorLog
+
+
+def last_task_log_update(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # update pipeline merging fields into the last (current attempt) task log, so logs do not have to be read first
+    return [{'$set': {'logs': {'$concatArrays': [
+        {'$slice': ['$logs', {'$subtract': [{'$size': '$logs'}, 1]}]},
+        [{'$mergeObjects': [{'$arrayElemAt': ['$logs', -1]}, fields]}]]}}}]
 
 
 async def append_task_executor_logs(task_id: ObjectId, state: TesTaskState, command_start_time: datetime,
                                     command_end_time: datetime, stdout: str, stderr: str, exit_code: int):
-    task: RegisteredTesTask = await task_repository.get_task({'_id': task_id, 'state': state}) \
-        .map(lambda _task: get_else_throw(_task, TaskNotFoundError(task_id, Just(state))))
-    logs: List[TesTaskLog] = task.logs.copy()
-    logs[-1].end_time = command_end_time
-    logs[-1].logs.append(TesTaskExecutorLog(
+    await append_task_executor_logs_batch(task_id, state, [TesTaskExecutorLog(
         start_time=command_start_time, end_time=command_end_time,
-        stdout=stdout, stderr=stderr, exit_code=exit_code))
-    await task_repository.update_task(
-        {'_id': task_id, 'state': state},
-        {'$set': {'logs': jsonable_encoder(logs)}}
-    ).map(lambda _task: get_else_throw(_task, TaskNotFoundError(task_id, Just(state))))
+        stdout=stdout, stderr=stderr, exit_code=exit_code)])
+
+
+async def append_task_executor_logs_batch(task_id: ObjectId, state: TesTaskState,
+                                          executor_logs: List[TesTaskExecutorLog]):
+    if not executor_logs:
+        return
+    # values are literals, executor output starting with '$' would be otherwise taken for a field path
+    await task_repository.update_task_view_later({'_id': task_id, 'state': state}, last_task_log_update({
+        'logs': {'$concatArrays': [
+            {'$ifNull': [{'$arrayElemAt': ['$logs.logs', -1]}, []]},
+            {'$literal': jsonable_encoder(executor_logs)}]},
+        'end_time': {'$literal': jsonable_encoder(executor_logs[-1].end_time)}}))
 
 
 async def update_last_task_log_time(task_id: ObjectId, state: TesTaskState, start_time: Maybe[datetime] = Nothing):
-    task: RegisteredTesTask = await task_repository.get_task({'_id': task_id, 'state': state}) \
-        .map(lambda _task: get_else_throw(_task, TaskNotFoundError(task_id, Just(state))))
-    logs: List[TesTaskLog] = task.logs.copy()
-    logs[-1].start_time = start_time.maybe(logs[-1].start_time, lambda x: x)
-    await task_repository.update_task(
-        {'_id': task_id, 'state': state},
-        {'$set': {'logs': jsonable_encoder(logs)}}
-    ).map(lambda _task: get_else_throw(_task, TaskNotFoundError(task_id, Just(state))))
+    if start_time.is_nothing():
+        return
+    await task_repository.update_task_view_later({'_id': task_id, 'state': state}, last_task_log_update({
+        'start_time': {'$literal': jsonable_encoder(start_time.value)}}))
+
+
+async def ensure_task_state(task_id: ObjectId, state: TesTaskState):
+    # read waits for pending updates of the task, failure to write them is raised as well
+    await task_repository.get_task_view({'_id': task_id, 'state': state}, [])\
+        .map(lambda task: get_else_throw(task, TaskNotFoundError(task_id, Just(state))))
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from tesp_api.utils.metrics import metrics
+
+batch_sizes = metrics.histogram('tesp_mongo_write_batch_size', 'Updates flushed by one bulk write',
+                                buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+pending_writes = metrics.gauge('tesp_mongo_pending_writes', 'Updates waiting to be flushed by bulk write')
+failed_writes = metrics.counter('tesp_mongo_failed_writes_total', 'Updates lost because their bulk write failed')
+
+
+class WriteCoalescer:
+    # Non-critical updates are collected over a short window and flushed by one ordered bulk write. Updates of the
+    # same document are applied in order they were submitted, readers of the document wait for them to be flushed
+    # and get the error of the bulk write their updates were lost by
+
+    def __init__(self, window: float, max_batch: int, max_pending: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._collection = None
+        self._pending: List[Tuple[Any, UpdateOne]] = []
+        self._pending_documents: Dict[Any, asyncio.Future] = {}
+        self._batch_flushed: Optional[asyncio.Future] = None
+        self._failed_documents: Dict[Any, Exception] = {}
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def start(self, collection) -> None:
+        self._collection = collection
+        if self.enabled:
+            self._capacity = asyncio.Semaphore(self.max_pending)
+            self._wakeup = asyncio.Event()
+            self._batch_flushed = asyncio.get_running_loop().create_future()
+            self._flusher = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._flusher:
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+
+    async def submit(self, document_id: Any, search_query: Dict[str, Any],
+                     update_query: Union[Dict[str, Any], List[Dict[str, Any]]]) -> None:
+        if not self._flusher:
+            await self._collection.update_one(search_query, update_query)
+            return
+        # bounded buffer, submitters are suspended until enough of the pending updates are flushed
+        await self._capacity.acquire()
+        self._pending.append((document_id, UpdateOne(search_query, update_query)))
+        self._pending_documents[document_id] = self._batch_flushed
+        pending_writes.set(len(self._pending))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def settle(self, document_id: Any) -> None:
+        batch_flushed = self._pending_documents.get(document_id)
+        if batch_flushed is not None:
+            await asyncio.shield(batch_flushed)
+        error = self._failed_documents.pop(document_id, None)
+        if error is not None:
+            raise error
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        batch_flushed, self._batch_flushed = self._batch_flushed, asyncio.get_running_loop().create_future()
+        for start in range(0, len(pending), self.max_batch):
+            batch = pending[start:start + self.max_batch]
+            try:
+                await self._collection.bulk_write([update for _, update in batch], ordered=True)
+            except Exception as error:
+                failed_writes.inc(len(batch))
+                logger.error(f'Failed to flush coalesced updates [count: {len(batch)}, error: {error}]')
+                self._failed_documents.update((document_id, error) for document_id, _ in batch)
+                # errors of documents never read again are dropped, oldest first
+                while len(self._failed_documents) > self.max_pending:
+                    del self._failed_documents[next(iter(self._failed_documents))]
+            batch_sizes.observe(len(batch))
+            for _ in batch:
+                self._capacity.release()
+        for document_id, _ in pending:
+            if self._pending_documents.get(document_id) is batch_flushed:
+                del self._pending_documents[document_id]
+        pending_writes.set(len(self._pending))
+        batch_flushed.set_result(None)
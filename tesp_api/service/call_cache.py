@@ -0,0 +1,116 @@
+import json
+import hashlib
+import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from loguru import logger
+from pydantic import parse_obj_as
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.types import TransferUrl
+from tesp_api.utils.functional import maybe_of
+from tesp_api.repository.task_repository import task_repository
+from tesp_api.service.file_transfer_service import file_transfer_service
+from tesp_api.repository.call_cache_repository import call_cache_repository
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskState, TesTaskOutputFileLog
+
+# bump whenever the way tasks are executed changes results of otherwise identical tasks
+CALL_CACHE_VERSION = 1
+CALL_CACHE_FIELDS = ['inputs', 'outputs', 'executors', 'volumes']
+
+call_cache_lookups = metrics.counter('tesp_call_cache_lookups_total', 'Call cache lookups by result', ['result'])
+
+
+def _transfer_url(url: str) -> TransferUrl:
+    return parse_obj_as(TransferUrl, url)
+
+
+async def _input_fingerprint(url: Optional[TransferUrl]) -> Optional[Dict[str, Any]]:
+    # inputs are identified by their url, size and modification time instead of content to avoid downloading them
+    return None if url is None else {'url': str(url), **await file_transfer_service.stat_file(url)}
+
+
+async def call_cache_key(task: RegisteredTesTask) -> str:
+    inputs = maybe_of(task.inputs).maybe([], lambda x: x)
+    spec = {
+        'version': CALL_CACHE_VERSION,
+        'executors': [{field: value for field, value in jsonable_encoder(executor).items() if value is not None}
+                      for executor in task.executors],
+        'inputs': [{'path': task_input.path, 'type': task_input.type, 'content': task_input.content,
+                    'fingerprint': await _input_fingerprint(task_input.url)} for task_input in inputs],
+        'outputs': sorted([output.path, output.type] for output in maybe_of(task.outputs).maybe([], lambda x: x)),
+        'volumes': sorted(str(volume) for volume in maybe_of(task.volumes).maybe([], lambda x: x))
+    }
+    canonical = json.dumps(jsonable_encoder(spec), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def _cached_outputs_unchanged(entry: Dict[str, Any]) -> bool:
+    for output in entry['outputs']:
+        current = await file_transfer_service.stat_file(_transfer_url(output['url']))
+        if current != output['fingerprint']:
+            return False
+    return True
+
+
+async def try_reuse_cached_outputs(task_id: ObjectId, task: RegisteredTesTask) -> Tuple[bool, Optional[str]]:
+    # returns whether the task was completed from cache and key its results should be cached under otherwise.
+    # Call cache is an optimization only, failing lookup lets the task execute as usual
+    try:
+        key = await call_cache_key(task)
+    except Exception as error:
+        logger.warning(f'Failed to compute call cache key [task_id: {str(task_id)}, error: {error}]')
+        return False, None
+    try:
+        return await reuse_cached_outputs(task_id, task, key), key
+    except Exception as error:
+        logger.warning(f'Failed to reuse call cache entry [task_id: {str(task_id)}, key: {key}, error: {error}]')
+        return False, key
+
+
+async def reuse_cached_outputs(task_id: ObjectId, task: RegisteredTesTask, key: str) -> bool:
+    entry = (await call_cache_repository.get_entry(key)).maybe(None, lambda x: x)
+    if entry is None or not await _cached_outputs_unchanged(entry):
+        if entry is not None:
+            logger.info(f'Outputs of cached task changed since it completed, dropping call cache entry '
+                        f'[key: {key}, source_task_id: {entry["task_id"]}]')
+            await call_cache_repository.delete_entry(key)
+        call_cache_lookups.inc(result='miss')
+        return False
+
+    cached_outputs = {output['path']: output for output in entry['outputs']}
+    output_logs: List[TesTaskOutputFileLog] = []
+    for output in maybe_of(task.outputs).maybe([], lambda x: x):
+        cached_output = cached_outputs[output.path]
+        if cached_output['url'] != str(output.url):
+            await file_transfer_service.copy_file(_transfer_url(cached_output['url']), output.url)
+        output_logs.append(TesTaskOutputFileLog(
+            url=output.url, path=output.path, size_bytes=str(cached_output['fingerprint']['size'])))
+
+    now = jsonable_encoder(datetime.datetime.now(datetime.timezone.utc))
+    # retried task has log of every attempt, outputs belong to the current one
+    task_logs = (await task_repository.get_task_view({'_id': task_id}, ['logs'])).maybe([], lambda x: x.logs or [])
+    last_log = f'logs.{max(len(task_logs) - 1, 0)}'
+    updated_task = await task_repository.update_task_view(
+        {'_id': task_id, 'state': TesTaskState.QUEUED},
+        {'$set': {'state': TesTaskState.COMPLETE, f'{last_log}.start_time': now, f'{last_log}.end_time': now,
+                  f'{last_log}.outputs': jsonable_encoder(output_logs)},
+         '$push': {f'{last_log}.system_logs': f'Outputs reused from call cache [source_task_id: {entry["task_id"]}]'}},
+        [])
+    call_cache_lookups.inc(result='hit')
+    return updated_task.maybe(False, lambda _: True)
+
+
+async def store_call_cache_entry(task_id: ObjectId, key: Optional[str]) -> None:
+    if key is None:
+        return
+    try:
+        task = (await task_repository.get_task_view({'_id': task_id}, ['outputs'])).maybe(None, lambda x: x)
+        outputs = [{'path': output.path, 'url': str(output.url),
+                    'fingerprint': await file_transfer_service.stat_file(output.url)}
+                   for output in maybe_of(task and task.outputs).maybe([], lambda x: x)]
+        await call_cache_repository.save_entry(key, {'task_id': str(task_id), 'outputs': outputs})
+    except Exception as error:
+        logger.warning(f'Failed to store call cache entry [task_id: {str(task_id)}, error: {error}]')
@@ -3,9 +3,19 @@ from bson.objectid import ObjectId
 from pymonad.maybe import Maybe, Nothing, Just
 from pymonad.promise import Promise
 
+from tesp_api.utils.functional import maybe_of
 from tesp_api.repository.model.task import TesTaskState
 from tesp_api.repository.error import CustomDataLayerError
 from tesp_api.repository.task_repository import task_repository
+from tesp_api.service.image_prepuller import image_prepuller
+from tesp_api.service.event_dispatcher import dispatch_event
+from tesp_api.service.trace_service import complete_task_trace
+from tesp_api.service.task_context import TaskContext
+from tesp_api.service.task_deadlines import task_deadlines, TASK_DEADLINE_EXCEEDED
+from tesp_api.service.task_retry import prepare_task_retry, requeue_interrupted_task, staged_inputs, ACTIVE_STATES
+from tesp_api.service.file_transfer_service import TransferError
+from tesp_api.service.fair_share_scheduler import fair_share_scheduler
+from tesp_api.service.resource_scheduler import resource_scheduler, TaskPlacementError
 from tesp_api.service.pulsar_operations import PulsarOperations, PulsarLayerConnectionError, PulsarOperationsError
 
 
@@ -26,11 +36,16 @@ class TaskExecutorError(Exception):
         super().__init__()
 
 
+# failures of the infrastructure rather than of the task itself, new attempt of the task may succeed
+RETRYABLE_ERRORS = (PulsarLayerConnectionError, PulsarOperationsError, TransferError)
+
+
 def repo_update_error_task_promise(task_id: ObjectId, state: TesTaskState, sys_log: Maybe[str]):
     update_query = {
         '$set': {'state': state},
         **sys_log.maybe({}, lambda x: {'$push': {'logs.$[].system_logs': x}})}
-    return task_repository.update_task({'_id': task_id}, update_query)\
+    # task canceled meanwhile, possibly by another service worker erasing its job, keeps its state
+    return task_repository.update_task_view({'_id': task_id, 'state': {'$in': ACTIVE_STATES}}, update_query, [])\
         .catch(lambda _error: logger.error(
             f'Failed to update task [id: {task_id}] to reflect its real state after error '
             f'occurred while executing one of the pulsar events'
@@ -39,14 +54,108 @@ def repo_update_error_task_promise(task_id: ObjectId, state: TesTaskState, sys_l
 
 def pulsar_cancel_task_promise(task_id: str, pulsar_operations: PulsarOperations):
     return pulsar_operations.erase_job(task_id)\
+        .then(lambda ignored: task_repository.forget_pulsar_job(ObjectId(task_id)))\
         .catch(lambda _error: logger.error(
             f'Failed to cancel pulsar job [id: {task_id}, error: {str(_error)}]. '
             f'This job future is in Pulsar hands from now on.'
         ))
 
 
+def _pulsar_event_stop(task_id: ObjectId, pulsar_operations: Maybe[PulsarOperations]) -> Promise:
+    # processing of the task was stopped from outside of its event handlers, which can not clean up after it
+    image_prepuller.cancel(task_id)
+    task_deadlines.clear(task_id)
+    return Promise(lambda resolve, reject: resolve(None))\
+        .then(lambda nothing: resource_scheduler.release(task_id))\
+        .then(lambda nothing: fair_share_scheduler.release(task_id))\
+        .then(lambda nothing: staged_inputs.discard(task_id))\
+        .then(lambda nothing: pulsar_operations.maybe(
+            None, lambda _pulsar_operations: pulsar_cancel_task_promise(str(task_id), _pulsar_operations)))
+
+
+def _pulsar_event_abort(task_id: ObjectId, pulsar_operations: Maybe[PulsarOperations], sys_log: str) -> Promise:
+    return _pulsar_event_stop(task_id, pulsar_operations)\
+        .then(lambda ignored: task_repository.update_task_view(
+            {'_id': task_id, 'state': {'$in': ACTIVE_STATES}},
+            {'$set': {'state': TesTaskState.SYSTEM_ERROR}, '$push': {'logs.$[].system_logs': sys_log}}, []))\
+        .then(lambda ignored: complete_task_trace(task_id))
+
+
+def pulsar_event_handle_interrupt(task_id: ObjectId, event_name: str,
+                                  pulsar_operations: Maybe[PulsarOperations]) -> Promise:
+    logger.warning(f'Task [id: {str(task_id)}] processing was interrupted by service shutdown while executing event '
+                   f'[event_name: {event_name}]. Will try to cancel respective Pulsar job and queue the task again, '
+                   f'so it is resumed by another service worker.')
+    # trace of the interrupted attempt is stored before the task is resumed with a new one
+    return _pulsar_event_stop(task_id, pulsar_operations)\
+        .then(lambda ignored: complete_task_trace(task_id))\
+        .then(lambda ignored: requeue_interrupted_task(task_id))\
+        .catch(lambda _error: logger.error(
+            f'Failed to queue task [id: {str(task_id)}] again after service shutdown interrupted its processing '
+            f'[error: {str(_error)}]'))
+
+
+def pulsar_event_handle_cancel(task_id: ObjectId, pulsar_operations: Maybe[PulsarOperations]) -> Promise:
+    return _pulsar_event_abort(task_id, pulsar_operations, 'Task was canceled')\
+        .catch(lambda _error: logger.error(
+            f'Failed to cancel Pulsar job of canceled task [id: {str(task_id)}, error: {str(_error)}]'))
+
+
+def pulsar_event_handle_timeout(task_id: ObjectId, event_name: str,
+                                pulsar_operations: Maybe[PulsarOperations]) -> Promise:
+    limit = 'deadline' if event_name == TASK_DEADLINE_EXCEEDED else 'executor timeout'
+    logger.warning(f'Task [id: {str(task_id)}] exceeded its {limit}, its processing was stopped. Will try to cancel '
+                   f'respective Pulsar job and set task up with error message in the syslog attribute.')
+    return _pulsar_event_abort(task_id, pulsar_operations, f'Task exceeded its {limit} and was canceled')\
+        .catch(lambda _error: logger.error(
+            f'Failed to update task [id: {str(task_id)}] to reflect its real state after it exceeded its {limit}'))
+
+
 def pulsar_event_handle_error(error: Exception, task_id: ObjectId,
                               event_name: str, pulsar_operations: PulsarOperations) -> Promise:
+    image_prepuller.cancel(task_id)
+    task_deadlines.stop_executor(task_id)
+    failed_node = None
+
+    async def release_node():
+        nonlocal failed_node
+        failed_node = maybe_of(await resource_scheduler.release(task_id)).maybe(None, lambda node: node.name)
+
+    async def prepare_retry():
+        return await prepare_task_retry(task_id, error) if isinstance(error, RETRYABLE_ERRORS) else None
+
+    def handle_error(retry_delay):
+        if retry_delay is not None:
+            return pulsar_event_handle_retry(error, task_id, event_name, pulsar_operations, retry_delay, failed_node)
+        task_deadlines.clear(task_id)
+        return _pulsar_event_handle_error(error, task_id, event_name, pulsar_operations)\
+            .then(lambda ignored: fair_share_scheduler.release(task_id))\
+            .then(lambda ignored: staged_inputs.discard(task_id))
+
+    # trace of the failed attempt is stored before the retry starts a new one
+    return Promise(lambda resolve, reject: resolve(None))\
+        .then(lambda nothing: release_node())\
+        .catch(lambda _error: logger.error(f'Failed to release resources of task [id: {str(task_id)}, '
+                                           f'error: {_error}]'))\
+        .then(lambda nothing: complete_task_trace(task_id))\
+        .then(lambda nothing: prepare_retry())\
+        .catch(lambda _error: None)\
+        .then(handle_error)
+
+
+def pulsar_event_handle_retry(error: Exception, task_id: ObjectId, event_name: str,
+                              pulsar_operations: PulsarOperations, retry_delay: float, failed_node: str) -> Promise:
+    logger.warning(f'System error occurred while executing task event [event_name: {event_name}, '
+                   f'task_id: {str(task_id)}, msg: {error}]. Will try to cancel respective Pulsar job and retry the '
+                   f'task [delay: {retry_delay:.1f}s, failed_node: {failed_node}].')
+    # task keeps its execution slot while waiting for the next attempt
+    return pulsar_cancel_task_promise(str(task_id), pulsar_operations)\
+        .map(lambda ignored: dispatch_event('queued_task', TaskContext(
+            task_id, retry_delay, (failed_node,) if failed_node else ())))
+
+
+def _pulsar_event_handle_error(error: Exception, task_id: ObjectId,
+                               event_name: str, pulsar_operations: PulsarOperations) -> Promise:
     task_id_str = str(task_id)
     match error:
         case TaskExecutorError():
@@ -62,6 +171,13 @@ def pulsar_event_handle_error(error: Exception, task_id: ObjectId,
                            f'Execution will not continue')
             return Promise(lambda resolve, reject: resolve(None))
 
+        case TaskPlacementError() as task_placement_error:
+            logger.warning(f'Task can not be placed onto any backend node [msg: {task_placement_error}] while '
+                           f'executing event [event_name: {event_name}]. Task will be set up with error message in '
+                           f'the syslog attribute.')
+            syslog: Maybe[str] = Just('Requested resources can not be satisfied by any of the backend nodes')
+            return repo_update_error_task_promise(task_id, TesTaskState.SYSTEM_ERROR, syslog)
+
         case CustomDataLayerError():
             logger.error(f'Data layer error occurred while executing task event [event_name: {event_name}, '
                          f'task_id: {task_id_str}]. Will try to request Pulsar for job cancellation if possible.')
@@ -84,6 +200,14 @@ def pulsar_event_handle_error(error: Exception, task_id: ObjectId,
             return pulsar_cancel_task_promise(task_id_str, pulsar_operations)\
                 .then(lambda ignored: repo_update_error_task_promise(task_id, TesTaskState.SYSTEM_ERROR, syslog))
 
+        case TransferError() as transfer_error:
+            logger.warning(f'Failed to transfer task data from or to storage while executing task event '
+                           f'[event_name: {event_name}, task_id: {task_id_str}, msg: {transfer_error}]. Will try to '
+                           f'cancel task and respective Pulsar job.')
+            syslog: Maybe[str] = Just(f'Failed to transfer task data [msg: {transfer_error.message}]')
+            return pulsar_cancel_task_promise(task_id_str, pulsar_operations)\
+                .then(lambda ignored: repo_update_error_task_promise(task_id, TesTaskState.SYSTEM_ERROR, syslog))
+
         case _ as unknown_error:
             logger.error(f'Unknown error occurred while executing task event [event_name: {event_name}, '
                          f'task_id: {task_id_str}, msg: {unknown_error}]. Such error was not expected leading to '
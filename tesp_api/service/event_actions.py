@@ -1,102 +1,213 @@
+import time
+import asyncio
 import datetime
 from typing import List
 
-from pymonad.maybe import Just
+from pymonad.maybe import Just, Maybe
 from bson.objectid import ObjectId
 from pymonad.promise import Promise
 
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.tracing import tracer, traced_phase
 from tesp_api.utils.docker import docker_run_command
+from tesp_api.config.properties import properties
+from tesp_api.utils.executor_batch import executors_batch_script, parse_batch_manifest, \
+    BATCH_SCRIPT_FILE, BATCH_MANIFEST_FILE
 from tesp_api.service.pulsar_service import pulsar_service
-from tesp_api.service.event_dispatcher import dispatch_event
+from tesp_api.service.event_dispatcher import dispatch_event, cancel_task_events
 from tesp_api.utils.functional import get_else_throw, maybe_of
 from tesp_api.service.event_handler import Event, local_handler
 from tesp_api.repository.task_repository import task_repository
+from tesp_api.service.local_operations import LocalOperations
+from tesp_api.service.image_prepuller import image_prepuller
+from tesp_api.service.trace_service import complete_task_trace
+from tesp_api.service.task_retry import staged_inputs
+from tesp_api.service.task_context import StagedFile
+from tesp_api.service.staging_compression import staging_compression, COMPRESSED_SUFFIX
+from tesp_api.service.task_deadlines import task_deadlines, TASK_DEADLINE_EXCEEDED, EXECUTOR_TIMEOUT_EXCEEDED
+from tesp_api.service.call_cache import try_reuse_cached_outputs, store_call_cache_entry, CALL_CACHE_FIELDS
+from tesp_api.service.fair_share_scheduler import fair_share_scheduler
+from tesp_api.service.resource_scheduler import resource_scheduler, NodeCapacity
 from tesp_api.service.file_transfer_service import file_transfer_service
-from tesp_api.service.error import pulsar_event_handle_error, TaskNotFoundError, TaskExecutorError
-from tesp_api.service.pulsar_operations import PulsarRestOperations, PulsarAmpqOperations, DataType
-from tesp_api.repository.model.task import TesTaskState, TesTaskExecutor, TesTaskInput, TesTaskOutput
-from tesp_api.repository.task_repository_utils import append_task_executor_logs, update_last_task_log_time
+from tesp_api.service.error import pulsar_event_handle_error, pulsar_event_handle_timeout, TaskNotFoundError, \
+    TaskExecutorError
+from tesp_api.service.pulsar_operations import PulsarOperations, PulsarRestOperations, PulsarAmpqOperations, \
+    PulsarOperationsError, DataType
+from tesp_api.repository.model.task import TesTaskState, TesTaskExecutor, TesTaskInput, TesTaskOutput, \
+    TesTaskResources, RegisteredTesTask, TesTaskIOType
+from tesp_api.repository.task_repository_utils import append_task_executor_logs, append_task_executor_logs_batch, \
+    update_last_task_log_time, ensure_task_state
+
+time_to_first_executor = metrics.histogram(
+    'tesp_time_to_first_executor_seconds', 'Time from task admission until its first executor starts')
 
 
 @local_handler.register(event_name="queued_task")
-def handle_queued_task(event: Event) -> None:
-    event_name, payload = event
-    match pulsar_service.get_operations():
-        case PulsarRestOperations() as pulsar_rest_operations:
-            dispatch_event('queued_task_rest', {**payload, 'pulsar_operations': pulsar_rest_operations})
-        case PulsarAmpqOperations() as pulsar_ampq_operations:
-            dispatch_event('queued_task_ampq', {**payload, 'pulsar_operations': pulsar_ampq_operations})
+@traced_phase('queued')
+async def handle_queued_task(event: Event) -> None:
+    event_name, context = event
+    task_id: ObjectId = context.task_id
+    context.queued_at = time.monotonic()
+
+    def dispatch_placed_task(node: NodeCapacity, task: RegisteredTesTask):
+        executors = maybe_of(task.executors).maybe([], lambda x: x)
+        context.pulsar_operations = pulsar_service.get_operations(Just(node))
+        task_deadlines.start_task(task_id, task.tags)
+        image_prepuller.start(task_id, node.name, [executor.image for executor in executors],
+                              context.pulsar_operations)
+        match context.pulsar_operations:
+            case PulsarRestOperations(): dispatch_event('queued_task_rest', context)
+            case PulsarAmpqOperations(): dispatch_event('queued_task_ampq', context)
+            case LocalOperations(): dispatch_event('queued_task_local', context)
+
+    async def place_task(task: RegisteredTesTask):
+        if context.retry_delay:
+            with tracer.span('retry_backoff'):
+                await asyncio.sleep(context.retry_delay)
+        if properties.call_cache.enabled:
+            with tracer.span('call_cache_lookup'):
+                completed, context.call_cache_key = await try_reuse_cached_outputs(task_id, task)
+            if completed:
+                await fair_share_scheduler.release(task_id)
+                return await complete_task_trace(task_id)
+        with tracer.span('queue_wait'):
+            node = await resource_scheduler.acquire(task_id, task.resources, context.avoid_nodes)
+        dispatch_placed_task(node, task)
+
+    projection = ['resources', 'executors', 'tags', *(CALL_CACHE_FIELDS if properties.call_cache.enabled else [])]
+    await Promise(lambda resolve, reject: resolve(None))\
+        .then(lambda nothing: task_repository.get_task_view({'_id': task_id}, projection))\
+        .map(lambda task: get_else_throw(task, TaskNotFoundError(task_id)))\
+        .then(lambda task: place_task(task))\
+        .catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_service.get_operations()))\
+        .then(lambda x: x)  # invokes promise returned by error handler, otherwise acts as identity function
 
 
 @local_handler.register(event_name="queued_task_rest")
+@local_handler.register(event_name="queued_task_local")
+@traced_phase('setup')
 async def handle_queued_task_rest(event: Event):
-    event_name, payload = event
-    task_id: ObjectId = payload['task_id']
-    pulsar_operations: PulsarRestOperations = payload['pulsar_operations']
+    event_name, context = event
+    task_id: ObjectId = context.task_id
+    pulsar_operations: PulsarOperations = context.pulsar_operations
+
+    def dispatch_initialize_task(setup_job_result: dict):
+        # only the outputs directory of the job configuration is needed later on
+        context.outputs_directory = setup_job_result['outputs_directory']
+        dispatch_event('initialize_task', context)
+
     await Promise(lambda resolve, reject: resolve(None))\
         .then(lambda nothing: pulsar_operations.setup_job(task_id))\
-        .map(lambda setup_job_result: dispatch_event('initialize_task', {**payload, 'task_config': setup_job_result}))\
-        .catch(lambda error: pulsar_event_handle_error(error, payload['task_id'], event_name, pulsar_operations))\
+        .map(dispatch_initialize_task)\
+        .catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_operations))\
         .then(lambda x: x)  # invokes promise returned by error handler, otherwise acts as identity function
 
 
 @local_handler.register(event_name="initialize_task")
+@traced_phase('initialize')
 async def handle_initializing_task(event: Event) -> None:
-    event_name, payload = event
-    task_id: ObjectId = payload['task_id']
-    pulsar_operations: PulsarRestOperations = payload['pulsar_operations']
+    event_name, context = event
+    task_id: ObjectId = context.task_id
+    pulsar_operations: PulsarOperations = context.pulsar_operations
 
     async def setup_data(job_id: ObjectId, inputs: List[TesTaskInput], outputs: List[TesTaskOutput]):
-        input_confs: List[dict] = []
-        output_confs: List[dict] = []
+        staged_inputs_files: List[StagedFile] = []
+        staged_outputs_files: List[StagedFile] = []
         for i in range(0, len(inputs)):
+            if file_transfer_service.is_shared(inputs[i].url):
+                staged_inputs_files.append(StagedFile(
+                    inputs[i].path, await file_transfer_service.share_file(inputs[i].url), shared=True))
+                continue
             content = inputs[i].content
             if content is None and inputs[i].url is not None:
-                content = await file_transfer_service.ftp_download_file(inputs[i].url)
+                content = await staged_inputs.get(job_id, i)
+            if content is None and inputs[i].url is not None:
+                content = await file_transfer_service.download_file(inputs[i].url)
+                await staged_inputs.put(job_id, i, content)
+            file_path = maybe_of(inputs[i].url and inputs[i].url.path).maybe(f'input_file_{i}', lambda x: x)
+            data = content.encode() if isinstance(content, str) else content
+            compressed = data is not None and staging_compression.should_compress(data)
+            if compressed:
+                content, file_path = await staging_compression.compress(data), f'{file_path}{COMPRESSED_SUFFIX}'
             pulsar_path = await pulsar_operations.upload(
-                job_id, DataType.INPUT, file_content=Just(content),
-                file_path=maybe_of(inputs[i].url).maybe(f'input_file_{i}', lambda x: x.path))
-            input_confs.append({'container_path': inputs[i].path, 'pulsar_path': pulsar_path})
+                job_id, DataType.INPUT, file_content=Just(content), file_path=file_path)
+            staged_inputs_files.append(StagedFile(
+                inputs[i].path, pulsar_path.removesuffix(COMPRESSED_SUFFIX) if compressed else pulsar_path,
+                compressed=compressed))
         for i in range(0, len(outputs)):
             pulsar_path = await pulsar_operations.upload(
                 job_id, DataType.OUTPUT, file_path=maybe_of(outputs[i].url.path).maybe("", lambda x: x))
-            output_confs.append({
-                'container_path': outputs[i].path, 'pulsar_path': pulsar_path, 'url': outputs[i].url})
-        return input_confs, output_confs
+            shared = file_transfer_service.is_shared(outputs[i].url)
+            staged_outputs_files.append(StagedFile(
+                outputs[i].path, pulsar_path, outputs[i].url, shared=shared,
+                compressed=staging_compression.enabled and not shared and outputs[i].type != TesTaskIOType.DIRECTORY))
+        context.inputs, context.outputs = tuple(staged_inputs_files), tuple(staged_outputs_files)
 
+    # job is recorded so it is erased by reconciler if the task processing does not get to erase it
+    pulsar_job = maybe_of(await resource_scheduler.placement(task_id)).maybe(
+        {}, lambda node: {'pulsar_job': {'node': node.name}})
     await Promise(lambda resolve, reject: resolve(None))\
-        .then(lambda nothing: task_repository.update_task(
+        .then(lambda nothing: task_repository.update_task_view(
             {'_id': task_id, "state": TesTaskState.QUEUED},
-            {'$set': {'state': TesTaskState.INITIALIZING}}
+            {'$set': {'state': TesTaskState.INITIALIZING, **pulsar_job}}, ['inputs', 'outputs']
         )).map(lambda updated_task: get_else_throw(
             updated_task, TaskNotFoundError(task_id, Just(TesTaskState.QUEUED))
         )).then(lambda updated_task: setup_data(
             task_id, maybe_of(updated_task.inputs).maybe([], lambda x: x),
             maybe_of(updated_task.outputs).maybe([], lambda x: x)
-        )).map(lambda input_output_confs: dispatch_event('run_task', {
-            **payload,
-            'input_confs': input_output_confs[0],
-            'output_confs': input_output_confs[1]
-        })).catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_operations))\
+        )).map(lambda nothing: dispatch_event('run_task', context))\
+        .catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_operations))\
         .then(lambda x: x)  # invokes promise returned by error handler, otherwise acts as identity function
 
 
 @local_handler.register(event_name="run_task")
+@traced_phase('run')
 async def handle_run_task(event: Event) -> None:
-    event_name, payload = event
-    task_id: ObjectId = payload['task_id']
-    input_confs: List[dict] = payload['input_confs']
-    output_confs: List[dict] = payload['output_confs']
-    pulsar_operations: PulsarRestOperations = payload['pulsar_operations']
+    event_name, context = event
+    task_id: ObjectId = context.task_id
+    pulsar_operations: PulsarOperations = context.pulsar_operations
+
+    def run_commands(executors: List[TesTaskExecutor], resources: Maybe[TesTaskResources]) -> List[str]:
+        return staging_compression.wrap_run_commands(
+            [docker_run_command(executor, context.inputs, context.outputs, resources) for executor in executors],
+            [staged_file.pulsar_path for staged_file in context.inputs if staged_file.compressed],
+            [staged_file.pulsar_path for staged_file in context.outputs if staged_file.compressed])
 
-    async def execute_task(executors: List[TesTaskExecutor]):
+    async def execute_task_batch(executors: List[TesTaskExecutor], resources: Maybe[TesTaskResources],
+                                 executor_timeout: float):
+        manifest_path = await pulsar_operations.upload(task_id, DataType.OUTPUT, file_path=BATCH_MANIFEST_FILE)
+        script_path = await pulsar_operations.upload(
+            task_id, DataType.INPUT, file_path=BATCH_SCRIPT_FILE,
+            file_content=Just(executors_batch_script(run_commands(executors, resources), manifest_path)))
+        # executors run as one job, their timeouts add up
+        task_deadlines.start_executor(task_id, executor_timeout * len(executors))
+        await pulsar_operations.run_job(task_id, f'sh {script_path}')
+        task_deadlines.stop_executor(task_id)
+        executor_logs = parse_batch_manifest(await pulsar_operations.download_output(task_id, BATCH_MANIFEST_FILE))
+        await append_task_executor_logs_batch(task_id, TesTaskState.RUNNING, executor_logs)
+        if any(executor_log.exit_code != 0 for executor_log in executor_logs):
+            raise TaskExecutorError()
+        if len(executor_logs) != len(executors):
+            raise PulsarOperationsError(ValueError(
+                f'Executors manifest is incomplete [expected: {len(executors)}, got: {len(executor_logs)}]'))
+
+    async def execute_task(executors: List[TesTaskExecutor], resources: Maybe[TesTaskResources],
+                           executor_timeout: float):
+        await image_prepuller.wait(task_id)
+        time_to_first_executor.observe(time.monotonic() - context.queued_at)
         await update_last_task_log_time(
             task_id, TesTaskState.RUNNING,
             start_time=Just(datetime.datetime.now(datetime.timezone.utc)))
-        for executor in executors:
-            run_command = docker_run_command(executor, input_confs, output_confs)
+        if properties.pulsar.batch_executors and len(executors) > 1:
+            return await execute_task_batch(executors, resources, executor_timeout)
+        for index, run_command in enumerate(run_commands(executors, resources)):
+            if index > 0:
+                # logs of the previous executor are written and the task was not canceled meanwhile
+                await ensure_task_state(task_id, TesTaskState.RUNNING)
             command_start_time = datetime.datetime.now(datetime.timezone.utc)
+            task_deadlines.start_executor(task_id, executor_timeout)
             command_status = await pulsar_operations.run_job(task_id, run_command)
+            task_deadlines.stop_executor(task_id)
             command_end_time = datetime.datetime.now(datetime.timezone.utc)
             await append_task_executor_logs(
                 task_id, TesTaskState.RUNNING, command_start_time, command_end_time, command_status['stdout'],
@@ -105,41 +216,75 @@ async def handle_run_task(event: Event) -> None:
                 raise TaskExecutorError()
 
     await Promise(lambda resolve, reject: resolve(None))\
-        .then(lambda nothing: task_repository.update_task(
+        .then(lambda nothing: task_repository.update_task_view(
             {'_id': task_id, "state": TesTaskState.INITIALIZING},
-            {'$set': {'state': TesTaskState.RUNNING}}
+            {'$set': {'state': TesTaskState.RUNNING}}, ['executors', 'resources', 'tags']
         )).map(lambda task: get_else_throw(
             task, TaskNotFoundError(task_id, Just(TesTaskState.INITIALIZING))
-        )).then(lambda task: execute_task(task.executors)) \
-        .map(lambda nothing: dispatch_event('finalize_task', payload)) \
+        )).then(lambda task: execute_task(
+            task.executors, maybe_of(task.resources), task_deadlines.executor_timeout(task.tags))) \
+        .map(lambda nothing: dispatch_event('finalize_task', context)) \
         .catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_operations)) \
         .then(lambda x: x)  # invokes promise returned by error handler, otherwise acts as identity function
 
 
+async def download_compressed_output(pulsar_operations: PulsarOperations, task_id: ObjectId, file_name: str) -> bytes:
+    # job leaves outputs smaller than min_size uncompressed, there is no compressed copy of them to download
+    try:
+        return await staging_compression.decompress(
+            await pulsar_operations.download_output(task_id, f'{file_name}{COMPRESSED_SUFFIX}'))
+    except (PulsarOperationsError, OSError, EOFError):
+        return await pulsar_operations.download_output(task_id, file_name)
+
+
 @local_handler.register(event_name='finalize_task')
+@traced_phase('finalize')
 async def handle_finalize_task(event: Event) -> None:
-    event_name, payload = event
-    task_id: ObjectId = payload['task_id']
-    output_confs: List[dict] = payload['output_confs']
-    pulsar_outputs_dir_path: str = payload['task_config']['outputs_directory']
-    pulsar_operations: PulsarRestOperations = payload['pulsar_operations']
+    event_name, context = event
+    task_id: ObjectId = context.task_id
+    pulsar_operations: PulsarOperations = context.pulsar_operations
 
     async def transfer_files(files_to_transfer):
         for file_to_transfer in files_to_transfer:
-            file_content: bytes = await pulsar_operations.download_output(task_id, file_to_transfer['file'])
-            await file_transfer_service.ftp_upload_file(file_to_transfer['url'], file_content)
+            if file_to_transfer['shared']:
+                await file_transfer_service.move_file(file_to_transfer['path'], file_to_transfer['url'])
+                continue
+            if file_to_transfer['compressed']:
+                file_content: bytes = await download_compressed_output(
+                    pulsar_operations, task_id, file_to_transfer['file'])
+            else:
+                file_content: bytes = await pulsar_operations.download_output(task_id, file_to_transfer['file'])
+            await file_transfer_service.upload_file(file_to_transfer['url'], file_content)
 
     await Promise(lambda resolve, reject: resolve(None))\
         .map(lambda nothing: [
-            {'file': output_conf['pulsar_path'].removeprefix(f'{pulsar_outputs_dir_path}/'),
-             'url': output_conf['url']}
-            for output_conf in output_confs]
+            {'file': output.pulsar_path.removeprefix(f'{context.outputs_directory}/'), 'path': output.pulsar_path,
+             'url': output.url, 'compressed': output.compressed, 'shared': output.shared}
+            for output in context.outputs]
         ).then(lambda files_to_transfer: transfer_files(files_to_transfer))\
-        .then(lambda ignored: task_repository.update_task(
+        .then(lambda ignored: task_repository.update_task_view(
             {'_id': task_id, "state": TesTaskState.RUNNING},
-            {'$set': {'state': TesTaskState.COMPLETE}}
+            {'$set': {'state': TesTaskState.COMPLETE}}, []
         )).map(lambda task: get_else_throw(
             task, TaskNotFoundError(task_id, Just(TesTaskState.RUNNING))
         )).then(lambda ignored: pulsar_operations.erase_job(task_id))\
+        .then(lambda ignored: task_repository.forget_pulsar_job(task_id))\
+        .then(lambda ignored: resource_scheduler.release(task_id))\
+        .then(lambda ignored: fair_share_scheduler.release(task_id))\
+        .map(lambda ignored: task_deadlines.clear(task_id))\
+        .then(lambda ignored: staged_inputs.discard(task_id))\
+        .then(lambda ignored: store_call_cache_entry(task_id, context.call_cache_key))\
+        .then(lambda ignored: complete_task_trace(task_id))\
         .catch(lambda error: pulsar_event_handle_error(error, task_id, event_name, pulsar_operations)) \
         .then(lambda x: x)  # invokes promise returned by error handler, otherwise acts as identity function
+
+
+@local_handler.register(event_name=TASK_DEADLINE_EXCEEDED)
+@local_handler.register(event_name=EXECUTOR_TIMEOUT_EXCEEDED)
+async def handle_task_time_limit_exceeded(event: Event) -> None:
+    event_name, context = event
+    # task might have been retried on another node since the time limit was started
+    pulsar_operations = maybe_of(await resource_scheduler.placement(context.task_id))\
+        .map(lambda node: pulsar_service.get_operations(Just(node)))
+    await cancel_task_events(context.task_id)
+    await pulsar_event_handle_timeout(context.task_id, event_name, pulsar_operations)
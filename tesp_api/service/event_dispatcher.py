@@ -1,10 +1,13 @@
 import asyncio
+import inspect
 from enum import Enum
-from typing import Union, Optional, Any, Dict
+from typing import Union, Optional, Any, Dict, List
 
+from loguru import logger
 from pydantic.main import BaseModel
 
-from tesp_api.service.event_handler import local_handler
+from tesp_api.utils.tracing import tracer
+from tesp_api.service.event_handler import Event, local_handler
 
 
 class EventPayloadSchemaRegistry(Dict):
@@ -25,9 +28,107 @@ class EventPayloadSchemaRegistry(Dict):
 registry = EventPayloadSchemaRegistry()
 
 
+class EventAdmissionClosedError(Exception):
+
+    def __init__(self):
+        self.message = "Service is not admitting new tasks at the moment, try again later"
+        super().__init__(self.message)
+
+    def __repr__(self):
+        return f'EventAdmissionClosedError [message: {self.message}]'
+
+
+_admission = {'open': False}
+
+
+def open_admission() -> None:
+    _admission['open'] = True
+
+
+def close_admission() -> None:
+    _admission['open'] = False
+
+
+def is_admission_open() -> bool:
+    return _admission['open']
+
+
+def ensure_admission_open() -> None:
+    if not is_admission_open():
+        raise EventAdmissionClosedError()
+
+
+# keeps references to handled events, so they are not garbage collected and can be drained on shutdown
+_in_flight_events: Dict[asyncio.Task, Event] = {}
+_in_flight_started: Dict[asyncio.Task, float] = {}
+
+
+def _forget_event(done_task: asyncio.Task) -> None:
+    _in_flight_events.pop(done_task, None)
+    _in_flight_started.pop(done_task, None)
+
+
 def _dispatch(event_name: Union[str, Enum], payload: Optional[Any] = None) -> None:
     async def task(): await local_handler.handle((event_name, payload))
-    asyncio.create_task(task())
+    event_task = asyncio.create_task(task())
+    _in_flight_events[event_task] = (event_name, payload)
+    _in_flight_started[event_task] = asyncio.get_running_loop().time()
+    event_task.add_done_callback(_forget_event)
+
+
+def in_flight_task_ids() -> List[Any]:
+    return [payload.task_id for _, payload in _in_flight_events.values() if hasattr(payload, 'task_id')]
+
+
+async def cancel_task_events(task_id: Any) -> None:
+    # cancels handlers of events of the task, except the calling one, and waits until they finish
+    event_tasks = [event_task for event_task, (_, payload) in list(_in_flight_events.items())
+                   if getattr(payload, 'task_id', None) == task_id and event_task is not asyncio.current_task()]
+    for event_task in event_tasks:
+        event_task.cancel()
+    await asyncio.gather(*event_tasks, return_exceptions=True)
+
+
+def _awaited_operation(event_task: asyncio.Task) -> str:
+    # follows chain of awaited coroutines down to the innermost one and the object it waits for
+    awaitable, location = event_task.get_coro(), 'not started'
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is None and not inspect.isawaitable(awaitable):
+            return f'{location} awaiting {type(awaitable).__name__}'
+        if frame is not None:
+            location = f'{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})'
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return location
+
+
+def describe_in_flight_events() -> List[Dict[str, Any]]:
+    now = asyncio.get_running_loop().time()
+    return [{
+        'event_name': str(event_name),
+        'task_id': str(payload.task_id) if hasattr(payload, 'task_id') else None,
+        'elapsed_seconds': round(now - _in_flight_started.get(event_task, now), 3),
+        'operation': getattr(tracer.task_span(event_task), 'name', None),
+        'awaiting': _awaited_operation(event_task)
+    } for event_task, (event_name, payload) in sorted(
+        _in_flight_events.items(), key=lambda item: _in_flight_started.get(item[0], now))]
+
+
+async def drain_events(timeout: float) -> List[Event]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # handlers dispatch follow-up events, therefore waits until no event is left or deadline passes
+    while _in_flight_events and loop.time() < deadline:
+        await asyncio.wait(list(_in_flight_events.keys()), timeout=deadline - loop.time())
+
+    unfinished_events = list(_in_flight_events.items())
+    if unfinished_events:
+        logger.warning(f'Event handlers did not finish before shutdown deadline, canceling them '
+                       f'[count: {len(unfinished_events)}]')
+    for event_task, _ in unfinished_events:
+        event_task.cancel()
+    await asyncio.gather(*[event_task for event_task, _ in unfinished_events], return_exceptions=True)
+    return [event for _, event in unfinished_events]
 
 
 def dispatch_event(event_name: Union[str, Enum],
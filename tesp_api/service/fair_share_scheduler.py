@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+from collections import Counter
+from typing import Dict, Any, Optional, Callable
+
+from loguru import logger
+from bson.objectid import ObjectId
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.config.properties import properties
+from tesp_api.repository.model.task import TesTask
+from tesp_api.repository.task_repository import task_repository
+
+DEFAULT_GROUP = 'default'
+
+queue_depth = metrics.gauge('tesp_scheduler_queue_depth', 'Queued tasks waiting for execution slot', ['group'])
+oldest_wait = metrics.gauge(
+    'tesp_scheduler_oldest_wait_seconds', 'Waiting time of the oldest queued task', ['group'])
+running_tasks = metrics.gauge('tesp_scheduler_running_tasks', 'Tasks holding execution slot', ['group'])
+queue_wait = metrics.histogram(
+    'tesp_scheduler_queue_wait_seconds', 'Time tasks waited for execution slot', ['group'],
+    buckets=(0.1, 1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600))
+
+
+def _waiting_seconds(creation_time: Optional[str], now: datetime.datetime) -> float:
+    return 0 if not creation_time else max(0.0, (now - datetime.datetime.fromisoformat(creation_time)).total_seconds())
+
+
+class FairShareScheduler:
+
+    def __init__(self, max_running_tasks: int, group_tag: str, priority_tag: str,
+                 group_weights: Dict[str, float], aging_rate: float, refresh_interval: float):
+        self.max_running_tasks = max_running_tasks
+        self.group_tag = group_tag
+        self.priority_tag = priority_tag
+        self.group_weights = group_weights
+        self.aging_rate = aging_rate
+        self.refresh_interval = refresh_interval
+        self._groups: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._dispatch: Optional[Callable[[ObjectId], None]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_running_tasks > 0
+
+    def _default_queue_fields(self) -> Dict[str, Any]:
+        return {'queue': {'group': DEFAULT_GROUP, 'priority': 0}}
+
+    def queue_fields(self, task: TesTask) -> Dict[str, Any]:
+        # group and numeric priority are stored next to the task so the queue can be read with an indexed query
+        tags = task.tags or {}
+        try:
+            priority = int(tags.get(self.priority_tag, 0))
+        except ValueError:
+            priority = 0
+        return {'queue': {'group': tags.get(self.group_tag, DEFAULT_GROUP), 'priority': priority}}
+
+    async def start(self, dispatch: Callable[[ObjectId], None]) -> None:
+        self._dispatch = dispatch
+        if self.enabled:
+            # tasks queued before scheduler was enabled
+            await task_repository.backfill_queue_fields(self._default_queue_fields())
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    def submit(self, task_id: ObjectId) -> None:
+        if not self.enabled:
+            return self._dispatch(task_id)
+        self._wakeup.set()
+
+    async def release(self, task_id: ObjectId) -> None:
+        if not self.enabled:
+            return
+        # slot left held by failed release is freed by the next scheduling round once the task is finished
+        try:
+            await task_repository.release_slot(task_id)
+        except Exception as error:
+            logger.error(f'Failed to release execution slot [id: {task_id}, error: {error}]')
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._schedule()
+            except Exception as error:
+                logger.error(f'Failed to schedule queued tasks [error: {error}]')
+
+    def _share(self, group: str, running: Dict[str, int]) -> float:
+        return running.get(group, 0) / self.group_weights.get(group, 1)
+
+    async def _schedule(self) -> None:
+        # slots are held by tasks in the database, so service workers sharing it also share the limit
+        now = datetime.datetime.now(datetime.timezone.utc)
+        await task_repository.release_finished_slots()
+        holders = await task_repository.get_slot_holders()
+        running = Counter(holder['queue'].get('group', DEFAULT_GROUP) for holder in holders)
+        held_slots = {holder['queue']['slot'] for holder in holders}
+        free_slots = [slot for slot in range(self.max_running_tasks) if slot not in held_slots]
+        free_slots = free_slots[:max(0, self.max_running_tasks - len(holders))]
+
+        summary = {group['group']: group for group in await task_repository.get_queue_summary()}
+        self._groups |= set(summary) | set(running)
+        for group in self._groups:
+            queue_depth.set(summary[group]['depth'] if group in summary else 0, group=group)
+            oldest_wait.set(_waiting_seconds(summary[group]['oldest'], now) if group in summary else 0, group=group)
+            running_tasks.set(running[group], group=group)
+
+        while free_slots and summary:
+            # group furthest below its weighted share gets the slot, longest waiting group wins ties
+            group = min(summary, key=lambda _group: (self._share(_group, running), summary[_group]['oldest'] or ''))
+            heads = await task_repository.get_queue_heads(group)
+            task = max(heads, key=lambda head: self._aged_priority(head, now), default=None)
+            summary[group]['depth'] -= 1
+            if task is None or summary[group]['depth'] <= 0:
+                summary.pop(group)
+            if task is None:
+                continue
+            claimed = await task_repository.claim_slot(task['_id'], free_slots[0])
+            if not claimed.is_just():
+                # task or slot was claimed by another service worker, queue is read again
+                self._wakeup.set()
+                return
+            free_slots.pop(0)
+            running[group] += 1
+            running_tasks.inc(group=group)
+            queue_wait.observe(_waiting_seconds(task.get('creation_time'), now), group=group)
+            logger.debug('Task granted execution slot [id: {}, group: {}]', task['_id'], group)
+            self._dispatch(task['_id'])
+
+    def _aged_priority(self, task: Dict[str, Any], now: datetime.datetime) -> float:
+        # waiting raises priority of a task, the oldest task of the group is therefore eventually executed
+        # before any newer one regardless of their priorities
+        return task.get('queue', {}).get('priority', 0) + \
+            self.aging_rate * _waiting_seconds(task.get('creation_time'), now)
+
+
+fair_share_scheduler = FairShareScheduler(
+    properties.scheduler.max_running_tasks,
+    properties.scheduler.group_tag,
+    properties.scheduler.priority_tag,
+    dict(properties.scheduler.get('group_weights', {})),
+    properties.scheduler.aging_rate,
+    properties.scheduler.refresh_interval)
@@ -1,32 +1,132 @@
-import aioftp
+import time
+from typing import Dict, Optional
+from contextlib import contextmanager
 
-from tesp_api.utils.functional import maybe_of
-from tesp_api.utils.types import FtpUrl
+import aiohttp
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.tracing import tracer
+from tesp_api.utils.types import TransferUrl
+from tesp_api.config.properties import properties
+from tesp_api.service.transfer_backends import TransferBackend, TransferChunks, FtpTransferBackend,\
+    HttpTransferBackend, S3TransferBackend, FileTransferBackend, buffered, chunked
+
+transfer_bytes = metrics.counter(
+    'tesp_transfer_bytes_total', 'Bytes transferred from and to storage', ['scheme', 'direction'])
+transfer_duration = metrics.histogram(
+    'tesp_transfer_duration_seconds', 'Duration of whole file transfers from and to storage', ['scheme', 'direction'])
+
+
+class TransferError(Exception):
+
+    def __init__(self, url: TransferUrl, error: Exception):
+        port = f':{url.port}' if url.port else ''
+        self.message = f'Failed to transfer file [url: {url.scheme}://{url.host or ""}{port}{url.path or ""}, ' \
+                       f'error: {type(error).__name__}: {error}]'
+        super().__init__(self.message)
+
+    def __repr__(self):
+        return f'TransferError [message: {self.message}]'
 
 
-# TODO: Error handling
 class FileTransferService:
 
     def __init__(self):
-        self.ftp_client = aioftp.Client()
-
-    @staticmethod
-    async def ftp_download_file(ftp_url: FtpUrl):
-        async with aioftp.Client.context(
-                host=ftp_url.host, port=maybe_of(ftp_url.port).maybe(aioftp.DEFAULT_PORT, lambda x: int(x)),
-                user=maybe_of(ftp_url.user).maybe(aioftp.DEFAULT_USER, lambda x: x),
-                password=maybe_of(ftp_url.password).maybe(aioftp.DEFAULT_PASSWORD, lambda x: x)) as client:
-            async with client.download_stream(ftp_url.path) as stream:
-                return await stream.read()
-
-    @staticmethod
-    async def ftp_upload_file(ftp_url: FtpUrl, file_content: bytes):
-        async with aioftp.Client.context(
-                host=ftp_url.host, port=maybe_of(ftp_url.port).maybe(aioftp.DEFAULT_PORT, lambda x: int(x)),
-                user=maybe_of(ftp_url.user).maybe(aioftp.DEFAULT_USER, lambda x: x),
-                password=maybe_of(ftp_url.password).maybe(aioftp.DEFAULT_PASSWORD, lambda x: x)) as client:
-            async with client.upload_stream(ftp_url.path) as stream:
-                await stream.write(file_content)
+        self.session = None
+        self._backends: Dict[str, TransferBackend] = {}
+        options = {'chunk_size': properties.transfer.chunk_size, 'part_size': properties.transfer.part_size,
+                   'max_concurrency': properties.transfer.max_concurrency}
+        http_backend = HttpTransferBackend(**options)
+        self.register('file', FileTransferBackend(
+            **options, allowed_directories=properties.transfer.file.allowed_directories,
+            shared=properties.transfer.file.shared_filesystem))
+        self.register('ftp', FtpTransferBackend(**options))
+        self.register('http', http_backend)
+        self.register('https', http_backend)
+        self.register('s3', S3TransferBackend(
+            **options, endpoint_url=properties.transfer.s3.endpoint_url, region=properties.transfer.s3.region,
+            access_key=properties.transfer.s3.access_key, secret_key=properties.transfer.s3.secret_key))
+
+    def register(self, scheme: str, backend: TransferBackend) -> None:
+        self._backends[scheme] = backend
+
+    def backend(self, url: TransferUrl) -> TransferBackend:
+        return self._backends[url.scheme]
+
+    def is_shared(self, url: Optional[TransferUrl]) -> bool:
+        backend = None if url is None else self._backends.get(url.scheme)
+        return isinstance(backend, FileTransferBackend) and backend.shared
+
+    async def init(self):
+        # client session binds to the running loop, therefore it must be created from within it
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=properties.transfer.timeout,
+                                        sock_read=properties.transfer.timeout)
+        self.session = aiohttp.ClientSession(timeout=timeout)
+        for backend in set(self._backends.values()):
+            await backend.init(self.session)
+
+    async def close(self):
+        for backend in set(self._backends.values()):
+            backend.close()
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    @contextmanager
+    def _transfer(self, url: TransferUrl, operation: str, **attributes):
+        with tracer.span(f'{url.scheme}.{operation}', **{'net.peer.name': url.host, 'file.path': url.path,
+                                                         **attributes}) as span:
+            try:
+                yield span
+            except TransferError:
+                raise
+            except Exception as error:
+                raise TransferError(url, error) from error
+
+    async def _metered(self, chunks: TransferChunks, url: TransferUrl, direction: str) -> TransferChunks:
+        async for chunk in chunks:
+            transfer_bytes.inc(len(chunk), scheme=url.scheme, direction=direction)
+            yield chunk
+
+    def read(self, url: TransferUrl) -> TransferChunks:
+        return buffered(self._metered(self.backend(url).read(url), url, 'download'),
+                        properties.transfer.buffer_chunks)
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        await self.backend(url).write(url, self._metered(chunks, url, 'upload'))
+
+    async def download_file(self, url: TransferUrl) -> bytes:
+        with self._transfer(url, 'download') as span:
+            start = time.monotonic()
+            content = b''.join([chunk async for chunk in self.read(url)])
+            transfer_duration.observe(time.monotonic() - start, scheme=url.scheme, direction='download')
+            if span:
+                span.attributes['file.size'] = len(content)
+            return content
+
+    async def upload_file(self, url: TransferUrl, content: bytes) -> None:
+        with self._transfer(url, 'upload', **{'file.size': len(content)}):
+            start = time.monotonic()
+            await self.write(url, chunked(content, properties.transfer.chunk_size))
+            transfer_duration.observe(time.monotonic() - start, scheme=url.scheme, direction='upload')
+
+    async def copy_file(self, source: TransferUrl, destination: TransferUrl) -> None:
+        # content is streamed between storages, never held in memory as a whole
+        with self._transfer(destination, 'copy', **{'source.url.scheme': source.scheme}):
+            await self.write(destination, self.read(source))
+
+    async def share_file(self, url: TransferUrl) -> str:
+        # path of shared file the executor mounts as it is, nothing is transferred
+        with self._transfer(url, 'share'):
+            return await self.backend(url).share(url)
+
+    async def move_file(self, source_path: str, destination: TransferUrl) -> None:
+        with self._transfer(destination, 'move'):
+            await self.backend(destination).move(source_path, destination)
+
+    async def stat_file(self, url: TransferUrl) -> dict:
+        with self._transfer(url, 'stat'):
+            return await self.backend(url).stat(url)
 
 
 file_transfer_service = FileTransferService()
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Dict, List, Set
+
+from loguru import logger
+from bson.objectid import ObjectId
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.tracing import tracer
+from tesp_api.utils.docker import docker_pull_command
+from tesp_api.service.pulsar_operations import PulsarOperations
+
+prepulled_images = metrics.counter(
+    'tesp_prepulled_images_total', 'Container images pre-pulled onto backend nodes', ['node'])
+skipped_prepulls = metrics.counter(
+    'tesp_skipped_prepull_images_total', 'Container images already known to be warm on backend nodes', ['node'])
+
+
+def prepull_job_id(task_id: ObjectId) -> str:
+    return f'{str(task_id)}_prepull'
+
+
+class ImagePrepuller:
+
+    def __init__(self):
+        self._warm_images: Dict[str, Set[str]] = {}
+        self._prepulls: Dict[str, asyncio.Task] = {}
+
+    def start(self, task_id: ObjectId, node_name: str, images: List[str], pulsar_operations: PulsarOperations) -> None:
+        warm_images = self._warm_images.setdefault(node_name, set())
+        distinct_images = list(dict.fromkeys(images))
+        cold_images = [image for image in distinct_images if image not in warm_images]
+        skipped_prepulls.inc(len(distinct_images) - len(cold_images), node=node_name)
+        if cold_images:
+            self._prepulls[str(task_id)] = asyncio.create_task(
+                self._prepull(task_id, node_name, cold_images, pulsar_operations))
+
+    async def _prepull(self, task_id: ObjectId, node_name: str, images: List[str],
+                       pulsar_operations: PulsarOperations) -> None:
+        # pre-pull is an optimization only, executors pull missing images by themselves if it fails
+        job_id = prepull_job_id(task_id)
+        try:
+            with tracer.span('prepull', **{'container.images': ','.join(images)}):
+                await pulsar_operations.setup_job(job_id)
+                command_status = await pulsar_operations.run_job(job_id, docker_pull_command(images))
+            if command_status['returncode'] == 0:
+                self._warm_images[node_name].update(images)
+                prepulled_images.inc(len(images), node=node_name)
+            else:
+                logger.warning(f'Images pre-pull failed [task_id: {str(task_id)}, node: {node_name}, '
+                               f'stderr: {command_status["stderr"]}]')
+        except Exception as error:
+            logger.warning(f'Images pre-pull failed [task_id: {str(task_id)}, node: {node_name}, error: {error}]')
+        finally:
+            await pulsar_operations.erase_job(job_id)\
+                .catch(lambda error: logger.warning(f'Failed to erase pre-pull job [id: {job_id}, error: {error}]'))
+
+    async def wait(self, task_id: ObjectId) -> None:
+        prepull = self._prepulls.pop(str(task_id), None)
+        if prepull:
+            await prepull
+
+    def cancel(self, task_id: ObjectId) -> None:
+        prepull = self._prepulls.pop(str(task_id), None)
+        if prepull:
+            prepull.cancel()
+
+
+image_prepuller = ImagePrepuller()
@@ -0,0 +1,144 @@
+import asyncio
+import datetime
+from typing import Optional
+
+from loguru import logger
+from pymonad.maybe import Just
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.config.properties import properties
+from tesp_api.repository.model.task import TesTaskState
+from tesp_api.service.pulsar_service import pulsar_service
+from tesp_api.service.event_dispatcher import in_flight_task_ids
+from tesp_api.service.resource_scheduler import resource_scheduler
+from tesp_api.service.fair_share_scheduler import fair_share_scheduler
+from tesp_api.service.task_retry import staged_inputs
+from tesp_api.repository.task_repository import task_repository
+
+erased_jobs = metrics.counter('tesp_reconciler_erased_jobs_total', 'Pulsar jobs of finished tasks erased by reconciler',
+                              ['node'])
+failed_erases = metrics.counter('tesp_reconciler_failed_erases_total', 'Failed attempts of reconciler to erase a job',
+                                ['node'])
+stale_tasks = metrics.counter('tesp_reconciler_stale_tasks_total', 'Tasks failed by reconciler as no longer processed')
+resumed_tasks = metrics.counter('tesp_reconciler_resumed_tasks_total',
+                                'Tasks interrupted by shutdown of another service worker resumed by reconciler')
+
+
+class JobReconciler:
+    # Pulsar job of a task is recorded along the task and forgotten once erased. Jobs of tasks which finished without
+    # erasing them (canceled tasks, failures to reach Pulsar, service crash) are erased periodically, in batches and
+    # at a limited rate. Every service worker refreshes heartbeat of tasks it processes, tasks left in a live state
+    # without heartbeat by a crashed worker are failed by any of the workers, so their jobs get erased as well.
+    # Tasks queued again by a worker shutting down are resumed by one of the others.
+
+    def __init__(self, interval: float, batch_size: int, erase_rate: float, stale_after: float,
+                 heartbeat_interval: float):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.erase_rate = erase_rate
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self._loop_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._loop_task = asyncio.create_task(self._run())
+        if self.heartbeat_interval > 0:
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self) -> None:
+        for loop_task in (self._loop_task, self._heartbeat_task):
+            if loop_task:
+                loop_task.cancel()
+                await asyncio.gather(loop_task, return_exceptions=True)
+        self._loop_task = self._heartbeat_task = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception as error:
+                logger.error(f'Failed to refresh heartbeat of processed tasks [error: {error}]')
+
+    async def heartbeat(self) -> None:
+        task_ids = list(set(in_flight_task_ids()))
+        if task_ids:
+            await task_repository.refresh_heartbeats(task_ids, datetime.datetime.now(datetime.timezone.utc))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except Exception as error:
+                logger.error(f'Failed to reconcile Pulsar jobs with tasks [error: {error}]')
+
+    async def reconcile(self) -> None:
+        await self._fail_stale_tasks()
+        await self._resume_requeued_tasks()
+        await resource_scheduler.release_finished()
+        await staged_inputs.discard_finished()
+        await self._erase_orphaned_jobs()
+
+    def _unprocessed_since(self, seconds: float) -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=seconds)
+
+    async def _fail_stale_tasks(self) -> None:
+        # tasks processed by any service worker have their heartbeat refreshed, regardless of how long they take
+        unprocessed_since = self._unprocessed_since(self.stale_after)
+        for task in await task_repository.get_stale_tasks(unprocessed_since, self.batch_size):
+            # heartbeat refreshed meanwhile keeps the task from being failed
+            updated_task = await task_repository.update_task_view(
+                {'_id': task['_id'], 'state': task['state'], **task_repository.stale_tasks_query(unprocessed_since)},
+                {'$set': {'state': TesTaskState.SYSTEM_ERROR},
+                 '$push': {'logs.$[].system_logs': 'Task processing was lost, task is no longer processed'}}, [])
+            if updated_task.is_just():
+                stale_tasks.inc()
+                logger.warning(f'Task is not processed by the service anymore, setting it to system error '
+                               f'[id: {str(task["_id"])}, state: {task["state"]}]')
+
+    async def _resume_requeued_tasks(self) -> None:
+        for _ in range(self.batch_size):
+            task = await task_repository.claim_requeued_task()
+            if task.is_nothing():
+                return
+            resumed_tasks.inc()
+            logger.info(f'Resuming task interrupted by service shutdown [id: {str(task.value["_id"])}]')
+            # with fair share scheduling enabled the task waits for execution slot as any other queued task
+            fair_share_scheduler.submit(task.value['_id'])
+
+    async def _erase_orphaned_jobs(self) -> None:
+        nodes = {node.name: node for node in resource_scheduler.nodes}
+        # worker which finished the task erases its job itself, unless it stopped processing it for a while
+        unprocessed_since = self._unprocessed_since(2 * self.heartbeat_interval)
+        for task in await task_repository.get_orphaned_jobs(unprocessed_since, self.batch_size):
+            node = nodes.get(task['pulsar_job']['node'])
+            if node is None:
+                logger.warning(f'Pulsar job of task can not be erased, its node is no longer configured '
+                               f'[id: {str(task["_id"])}, node: {task["pulsar_job"]["node"]}]')
+                await task_repository.forget_pulsar_job(task['_id'])
+                continue
+            try:
+                await pulsar_service.get_operations(Just(node)).erase_job(task['_id'])
+            except Exception as error:
+                # job stays recorded and is erased by one of the next reconciliations
+                failed_erases.inc(node=node.name)
+                await task_repository.record_failed_erase(task['_id'], datetime.datetime.now(datetime.timezone.utc))
+                logger.warning(f'Failed to erase Pulsar job of task [id: {str(task["_id"])}, node: {node.name}, '
+                               f'error: {error}]')
+                continue
+            await task_repository.forget_pulsar_job(task['_id'])
+            erased_jobs.inc(node=node.name)
+            logger.info(f'Erased Pulsar job of finished task [id: {str(task["_id"])}, node: {node.name}]')
+            if self.erase_rate > 0:
+                await asyncio.sleep(1 / self.erase_rate)
+
+
+job_reconciler = JobReconciler(
+    properties.reconciler.interval,
+    properties.reconciler.batch_size,
+    properties.reconciler.erase_rate,
+    properties.reconciler.stale_after,
+    properties.reconciler.heartbeat_interval)
@@ -0,0 +1,129 @@
+import os
+import signal
+import shutil
+import asyncio
+from pathlib import Path
+from typing import Dict, Union
+
+from loguru import logger
+from bson.objectid import ObjectId
+from pymonad.promise import Promise
+from pymonad.maybe import Maybe, Nothing
+
+from tesp_api.utils.tracing import tracer
+from tesp_api.utils.functional import identity_with_side_effect
+from tesp_api.service.pulsar_operations import PulsarOperations, PulsarOperationsError, DataType
+
+OUTPUT_CHUNK_SIZE = 65536
+
+
+# Runs jobs directly on the host of TESP API while mimicking Pulsar operations. Files are staged
+# into a local job directory and exit code with output are known as soon as the process exits.
+class LocalOperations(PulsarOperations):
+
+    def __init__(self, staging_directory: str, max_output_size: int):
+        self.staging_directory = Path(staging_directory)
+        self.max_output_size = max_output_size
+        self._processes: Dict[str, asyncio.subprocess.Process] = {}
+
+    @staticmethod
+    def _reraise_custom(error: Exception):
+        match error:
+            case PulsarOperationsError() as operations_error: raise operations_error
+            case _ as any_error: raise PulsarOperationsError(any_error)
+
+    def _job_directory(self, job_id: ObjectId) -> Path:
+        return self.staging_directory / str(job_id)
+
+    def _data_directory(self, job_id: ObjectId, io_type: DataType) -> Path:
+        return self._job_directory(job_id) / f'{io_type.value}s'
+
+    def _create_job_directories(self, job_id: ObjectId) -> dict:
+        job_directory = self._job_directory(job_id)
+        directories = {
+            'working_directory': job_directory / 'working',
+            'inputs_directory': self._data_directory(job_id, DataType.INPUT),
+            'outputs_directory': self._data_directory(job_id, DataType.OUTPUT)
+        }
+        for directory in directories.values():
+            directory.mkdir(parents=True, exist_ok=True)
+        return {'job_id': str(job_id), **{key: str(value) for key, value in directories.items()}}
+
+    def _write_file(self, job_id: ObjectId, io_type: DataType, file_path: str,
+                    file_content: Union[str, bytes]) -> str:
+        # the same way as Pulsar, staged file is always flattened into respective job data directory
+        target_path = self._data_directory(job_id, io_type) / Path(file_path).name
+        match file_content:
+            case bytes() as content: target_path.write_bytes(content)
+            case _ as content: target_path.write_text(content)
+        return str(target_path)
+
+    async def _run_process(self, job_id: ObjectId, run_command: str) -> dict:
+        process = await asyncio.create_subprocess_exec(
+            '/bin/sh', '-c', run_command,
+            cwd=str(self._job_directory(job_id) / 'working'),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            # job runs in its own process group, so its children are killed along with it
+            start_new_session=True)
+        self._processes[str(job_id)] = process
+        try:
+            with tracer.span('local.run_job'):
+                stdout, stderr, returncode = await asyncio.gather(
+                    self._read_output(process.stdout), self._read_output(process.stderr), process.wait())
+        finally:
+            # run canceled before the process exited must not leave it behind
+            self._kill_process(job_id)
+        return {
+            'complete': 'true',
+            'returncode': returncode,
+            'stdout': stdout,
+            'stderr': stderr
+        }
+
+    async def _read_output(self, stream: asyncio.StreamReader) -> str:
+        # output is read as the process produces it, only its tail up to max_output_size is held in memory
+        output, truncated = bytearray(), False
+        while chunk := await stream.read(OUTPUT_CHUNK_SIZE):
+            output += chunk
+            if len(output) > self.max_output_size:
+                del output[:len(output) - self.max_output_size]
+                truncated = True
+        text = output.decode(errors='replace')
+        return f'[output truncated to last {self.max_output_size} bytes]\n{text}' if truncated else text
+
+    def _kill_process(self, job_id: ObjectId) -> None:
+        process = self._processes.pop(str(job_id), None)
+        if process and process.returncode is None:
+            logger.debug('Killing local job process [job_id: {}, pid: {}]', job_id, process.pid)
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def setup_job(self, job_id: ObjectId) -> Promise:
+        return Promise(lambda resolve, reject: resolve(job_id))\
+            .then(lambda _job_id: asyncio.to_thread(self._create_job_directories, _job_id))\
+            .catch(self._reraise_custom)
+
+    def upload(self, job_id: ObjectId, io_type: DataType, file_path: str, file_content: Maybe[str] = Nothing):
+        return Promise(lambda resolve, reject: resolve(file_content.maybe("", lambda x: x)))\
+            .then(lambda content: asyncio.to_thread(self._write_file, job_id, io_type, file_path, content))\
+            .catch(self._reraise_custom)
+
+    def run_job(self, job_id: ObjectId, run_command: str):
+        return Promise(lambda resolve, reject: resolve(run_command))\
+            .then(lambda _run_command: self._run_process(job_id, _run_command))\
+            .catch(self._reraise_custom)
+
+    def download_output(self, job_id: ObjectId, file_name: str):
+        return Promise(lambda resolve, reject: resolve(
+            self._data_directory(job_id, DataType.OUTPUT) / Path(file_name).name
+        )).then(lambda output_path: asyncio.to_thread(output_path.read_bytes))\
+            .catch(self._reraise_custom)
+
+    def erase_job(self, job_id: ObjectId):
+        return Promise(lambda resolve, reject: resolve(job_id))\
+            .map(lambda _job_id: identity_with_side_effect(_job_id, self._kill_process))\
+            .then(lambda _job_id: asyncio.to_thread(
+                shutil.rmtree, self._job_directory(_job_id), ignore_errors=True))\
+            .catch(self._reraise_custom)
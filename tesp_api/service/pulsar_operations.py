@@ -1,6 +1,6 @@
 import asyncio
 from enum import Enum
-from typing import Literal
+from typing import Literal, Optional, Callable, Awaitable
 from abc import ABC, abstractmethod
 
 from pymonad.maybe import Maybe, Nothing
@@ -8,7 +8,12 @@ from bson.objectid import ObjectId
 from pymonad.promise import Promise
 from aiohttp import ClientSession, ClientError
 
+from tesp_api.utils.tracing import tracer
 from tesp_api.repository.model.task import TesTaskIOType
+from tesp_api.utils.resilience import RetryPolicy, NO_RETRY, CircuitBreakerRegistry, CircuitBreakerOpenError
+
+# Pulsar job states reached only after the job run has been submitted
+SUBMITTED_JOB_STATES = {'preprocessing', 'queued', 'running', 'complete', 'failed', 'cancelled'}
 
 
 class DataType(str, Enum):
@@ -36,6 +41,22 @@ class PulsarOperationsError(Exception):
 
 class PulsarOperations(ABC):
 
+    @abstractmethod
+    def setup_job(self, job_id: ObjectId) -> Promise:
+        pass
+
+    @abstractmethod
+    def upload(self, job_id: ObjectId, io_type: DataType, file_path: str, file_content: Maybe[str] = Nothing):
+        pass
+
+    @abstractmethod
+    def run_job(self, job_id: ObjectId, run_command: str):
+        pass
+
+    @abstractmethod
+    def download_output(self, job_id: ObjectId, file_name: str):
+        pass
+
     @abstractmethod
     def erase_job(self, task_id: ObjectId):
         pass
@@ -44,11 +65,16 @@ class PulsarOperations(ABC):
 class PulsarRestOperations(PulsarOperations):
 
     def __init__(self, pulsar_client: ClientSession, base_url: str,
-                 status_poll_interval: int, status_max_polls: int):
+                 status_poll_interval: int, status_max_polls: int,
+                 retry_policy: RetryPolicy = NO_RETRY,
+                 circuit_breakers: Optional[CircuitBreakerRegistry] = None):
         self.pulsar_client = pulsar_client
         self.base_url = base_url
         self.status_poll_interval = status_poll_interval
         self.status_max_polls = status_max_polls
+        self.retry_policy = retry_policy
+        self.circuit_breakers = circuit_breakers if circuit_breakers is not None\
+            else CircuitBreakerRegistry(failure_threshold=5, reset_timeout=30)
 
     @staticmethod
     def _reraise_custom(error: Exception):
@@ -57,45 +83,71 @@ class PulsarRestOperations(PulsarOperations):
             case _ as any_error: raise PulsarOperationsError(any_error)
 
     async def _pulsar_request(self, path: str, method: Literal['GET', 'POST', 'PUT', 'DELETE'],
-                              response_type: Literal['JSON', 'BYTES'], params=None, data=None):
-        try:
+                              response_type: Literal['JSON', 'BYTES'], params=None, data=None,
+                              retry_policy: RetryPolicy = NO_RETRY,
+                              should_retry: Optional[Callable[[Exception], Awaitable[bool]]] = None):
+        circuit_breaker = self.circuit_breakers.get_breaker(self.base_url)
+
+        async def request():
             async with self.pulsar_client.request(
                     url=f'{self.base_url}{path}', method=method, params=params, data=data) as response:
                 match response_type:
                     case 'JSON': return await response.json(content_type='text/html')
                     case 'BYTES': return await response.read()
                     case _ as value: raise ValueError(f'Got unexpected value [{value}] for response_type parameter')
-        except ClientError as err:
+        try:
+            with tracer.span('pulsar.request', **{'http.method': method, 'http.target': path}):
+                return await retry_policy.run(
+                    lambda: circuit_breaker.call(request, failure_on=(ClientError, asyncio.TimeoutError)),
+                    should_retry=should_retry)
+        except (ClientError, asyncio.TimeoutError, CircuitBreakerOpenError) as err:
             raise PulsarLayerConnectionError(err)
 
+    async def _job_status(self, job_id: str):
+        return await self._pulsar_request(
+            path=f'/jobs/{job_id}/status', method='GET',
+            response_type='JSON', retry_policy=self.retry_policy)
+
     async def _job_status_complete(self, job_id: str):
-        for i in range(0, self.status_max_polls):
-            await asyncio.sleep(self.status_poll_interval)
+        with tracer.span('pulsar.status_poll') as span:
+            for i in range(0, self.status_max_polls):
+                await asyncio.sleep(self.status_poll_interval)
+                json_response = await self._job_status(job_id)
+                if json_response['complete'] == 'true':
+                    if span:
+                        span.attributes['pulsar.polls'] = i + 1
+                    return json_response
+            raise LookupError()
+
+    async def _job_not_submitted(self, job_id: str) -> bool:
+        # job submission is not idempotent, it is retried only once Pulsar confirms it has no record of it
+        try:
             json_response = await self._pulsar_request(
                 path=f'/jobs/{job_id}/status', method='GET', response_type='JSON')
-            if json_response['complete'] == 'true':
-                return json_response
-        raise LookupError()
+            return json_response.get('status') not in SUBMITTED_JOB_STATES
+        except Exception:
+            return False
 
     def setup_job(self, job_id: ObjectId) -> Promise:
         return Promise(lambda resolve, reject: resolve(None))\
             .then(lambda nothing: self._pulsar_request(
-                path="/jobs", method='POST',
-                response_type='JSON', params={'job_id': str(job_id)}
+                path="/jobs", method='POST', response_type='JSON',
+                params={'job_id': str(job_id)}, retry_policy=self.retry_policy
             )).catch(self._reraise_custom)
 
     def upload(self, job_id: ObjectId, io_type: TesTaskIOType, file_path: str, file_content: Maybe[str] = Nothing):
         return Promise(lambda resolve, reject: resolve({'type': io_type.value, 'name': file_path}))\
             .then(lambda query_params: self._pulsar_request(
                 path=f'/jobs/{str(job_id)}/files', method='POST', response_type='JSON',
-                params=query_params, data=file_content.maybe("", lambda x: x)
+                params=query_params, data=file_content.maybe("", lambda x: x), retry_policy=self.retry_policy
             )).map(lambda json_result: json_result['path'])
 
     def run_job(self, job_id: ObjectId, run_command: str):
         return Promise(lambda resolve, reject: resolve(None))\
             .then(lambda nothing: self._pulsar_request(
                 path=f'/jobs/{str(job_id)}/submit', method='POST', response_type='BYTES',
-                params={'command_line': run_command}
+                params={'command_line': run_command}, retry_policy=self.retry_policy,
+                should_retry=lambda error: self._job_not_submitted(str(job_id))
             )).then(lambda nothing: self._job_status_complete(str(job_id)))\
             .catch(self._reraise_custom)
 
@@ -103,18 +155,18 @@ class PulsarRestOperations(PulsarOperations):
         return Promise(lambda resolve, reject: resolve(None))\
             .then(lambda nothing: self._pulsar_request(
                 path=f'/jobs/{str(job_id)}/files', method='GET', response_type='BYTES',
-                params={'name': file_name}
+                params={'name': file_name}, retry_policy=self.retry_policy
             )).catch(self._reraise_custom)
 
     def erase_job(self, job_id: ObjectId):
         return Promise(lambda resolve, reject: resolve(None))\
             .then(lambda nothing: self._pulsar_request(
                 path=f'/jobs/{str(job_id)}/cancel',
-                method='PUT', response_type='BYTES'
+                method='PUT', response_type='BYTES', retry_policy=self.retry_policy
             )).catch(lambda error: None)\
             .then(lambda nothing: self._pulsar_request(
                 path=f'/jobs/{str(job_id)}',
-                method='DELETE', response_type='BYTES'
+                method='DELETE', response_type='BYTES', retry_policy=self.retry_policy
             )).catch(self._reraise_custom)
 
 
@@ -127,5 +179,14 @@ class PulsarAmpqOperations(PulsarOperations):
     def setup_job(self, job_id: str):
         raise NotImplementedError()
 
+    def upload(self, job_id: ObjectId, io_type: DataType, file_path: str, file_content: Maybe[str] = Nothing):
+        raise NotImplementedError()
+
+    def run_job(self, job_id: ObjectId, run_command: str):
+        raise NotImplementedError()
+
+    def download_output(self, job_id: ObjectId, file_name: str):
+        raise NotImplementedError()
+
     def erase_job(self, task_id: ObjectId):
         raise NotImplementedError()
@@ -1,31 +1,73 @@
+import asyncio
+from typing import Dict
+
 import aiohttp
 from loguru import logger
 from socket import AF_INET
+from pymonad.maybe import Maybe, Nothing
 
 from tesp_api.config.properties import properties
+from tesp_api.utils.resilience import RetryPolicy, CircuitBreakerRegistry
+from tesp_api.service.local_operations import LocalOperations
+from tesp_api.service.resource_scheduler import NodeCapacity
 from tesp_api.service.pulsar_operations import PulsarRestOperations, PulsarOperations
 
 
 # aiohttp tracing feature allows to log each request
 async def on_request_start(session, context, params):
-    logger.debug(f'Sending request to pulsar <{params}>')
+    logger.opt(lazy=True).debug('Sending request to pulsar <{params}>', params=lambda: params)
 
 
 class PulsarService:
 
     def __init__(self):
+        self.pulsar_client = None
+        self._rest_operations: Dict[str, PulsarRestOperations] = {}
+        self.local_operations = LocalOperations(
+            properties.pulsar.local.staging_directory, properties.pulsar.local.max_output_size)
+        self.retry_policy = RetryPolicy(
+            max_attempts=properties.pulsar.retry.max_attempts,
+            base_delay=properties.pulsar.retry.base_delay,
+            max_delay=properties.pulsar.retry.max_delay,
+            retry_on=(aiohttp.ClientError, asyncio.TimeoutError))
+        self.circuit_breakers = CircuitBreakerRegistry(
+            failure_threshold=properties.pulsar.circuit_breaker.failure_threshold,
+            reset_timeout=properties.pulsar.circuit_breaker.reset_timeout)
+
+    async def init(self):
+        # client session binds to the running loop, therefore it must be created from within it
         timeout = aiohttp.ClientTimeout(total=2)
         connector = aiohttp.TCPConnector(family=AF_INET, limit_per_host=100)
         trace_config = aiohttp.TraceConfig()
         trace_config.on_request_start.append(on_request_start)
-        self.pulsar_client = aiohttp.ClientSession(timeout=timeout, connector=connector, trace_configs=[trace_config])
-
-    def get_operations(self) -> PulsarOperations:
-        return PulsarRestOperations(
-            self.pulsar_client,
-            properties.pulsar.url,
-            properties.pulsar.status.poll_interval,
-            properties.pulsar.status.max_polls)
+        # request tracing would only produce records dropped by the log level
+        trace_configs = [trace_config] if properties.logging.level == 'DEBUG' else []
+        self.pulsar_client = aiohttp.ClientSession(timeout=timeout, connector=connector, trace_configs=trace_configs)
+
+    async def close(self):
+        if self.pulsar_client:
+            await self.pulsar_client.close()
+            self.pulsar_client = None
+        self._rest_operations.clear()
+
+    def get_operations(self, node: Maybe[NodeCapacity] = Nothing) -> PulsarOperations:
+        match properties.pulsar.backend:
+            case 'local': return self.local_operations
+            # nodes without own url are served by the default Pulsar
+            case _: return self._get_rest_operations(
+                node.maybe(properties.pulsar.url, lambda x: x.url or properties.pulsar.url))
+
+    def _get_rest_operations(self, base_url: str) -> PulsarRestOperations:
+        # operations are shared by all tasks placed onto the same node
+        if base_url not in self._rest_operations:
+            self._rest_operations[base_url] = PulsarRestOperations(
+                self.pulsar_client,
+                base_url,
+                properties.pulsar.status.poll_interval,
+                properties.pulsar.status.max_polls,
+                self.retry_policy,
+                self.circuit_breakers)
+        return self._rest_operations[base_url]
 
 
 pulsar_service = PulsarService()
@@ -0,0 +1,149 @@
+import asyncio
+from typing import List, Dict, Optional, Tuple, Sequence
+
+from loguru import logger
+from pydantic import BaseModel, Field
+from bson.objectid import ObjectId
+
+from tesp_api.config.properties import properties
+from tesp_api.repository.model.task import TesTaskResources
+from tesp_api.repository.node_repository import node_repository
+from tesp_api.repository.task_repository import task_repository
+
+RESOURCE_DIMENSIONS = ('cpu_cores', 'ram_gb', 'disk_gb')
+
+
+class NodeCapacity(BaseModel):
+    name: str = Field(..., description='Unique name of the backend node.')
+    url: str = Field(None, description='Url of Pulsar application running on the node.')
+    cpu_cores: int = Field(None, description='Number of CPUs available for tasks, unlimited if not set.')
+    ram_gb: float = Field(None, description='RAM in gigabytes (GB) available for tasks, unlimited if not set.')
+    disk_gb: float = Field(None, description='Disk size in gigabytes (GB) available for tasks, unlimited if not set.')
+    zones: List[str] = Field([], description='Compute zones the node belongs to.')
+
+
+class TaskPlacementError(Exception):
+
+    def __init__(self, task_id: ObjectId, requested: Dict[str, float]):
+        self.message = f'Requested resources of task [id: {str(task_id)}, resources: {requested}] ' \
+                       f'exceed capacity of every backend node'
+        super().__init__(self.message)
+
+    def __repr__(self):
+        return f'TaskPlacementError [message: {self.message}]'
+
+
+class ResourceScheduler:
+    # Usage of the nodes is kept in the database, service workers sharing it share capacity of the nodes as well.
+    # Tasks held back are woken by releases of this worker and re-read the usage every poll_interval seconds to
+    # notice releases of the other workers.
+
+    def __init__(self, nodes: List[NodeCapacity], poll_interval: float):
+        self.nodes = nodes
+        self.poll_interval = poll_interval
+        self._waiters: List[asyncio.Future] = []
+
+    async def init(self) -> None:
+        await node_repository.register_nodes([node.name for node in self.nodes], dict.fromkeys(RESOURCE_DIMENSIONS, 0))
+
+    @staticmethod
+    def _requested(resources: Optional[TesTaskResources]) -> Dict[str, float]:
+        # task without requested cores still occupies one, so unbounded number of tasks can not flood a node
+        return {
+            'cpu_cores': (resources.cpu_cores if resources else None) or 1,
+            'ram_gb': (resources.ram_gb if resources else None) or 0,
+            'disk_gb': (resources.disk_gb if resources else None) or 0
+        }
+
+    @staticmethod
+    def _in_zones(node: NodeCapacity, resources: Optional[TesTaskResources]) -> bool:
+        zones = resources.zones if resources else None
+        return not zones or bool(set(zones) & set(node.zones))
+
+    @staticmethod
+    def _used_limits(node: NodeCapacity, requested: Dict[str, float]) -> Dict[str, float]:
+        # highest usage of limited resources the requested ones still fit next to
+        return {dimension: getattr(node, dimension) - requested[dimension]
+                for dimension in RESOURCE_DIMENSIONS if getattr(node, dimension) is not None}
+
+    def _fits(self, node: NodeCapacity, requested: Dict[str, float], used: Dict[str, float]) -> bool:
+        return all(used.get(dimension, 0) <= limit for dimension, limit in self._used_limits(node, requested).items())
+
+    @staticmethod
+    def _remaining_after(node: NodeCapacity, requested: Dict[str, float], used: Dict[str, float]) -> Tuple[float, ...]:
+        # nodes with unlimited capacity are the last resort of best-fit placement
+        return tuple(float('inf') if getattr(node, dimension) is None
+                     else getattr(node, dimension) - used.get(dimension, 0) - requested[dimension]
+                     for dimension in RESOURCE_DIMENSIONS)
+
+    def _best_fit(self, requested: Dict[str, float], resources: Optional[TesTaskResources],
+                  usage: Dict[str, Dict[str, float]], avoided_nodes: Sequence[str] = ()) -> Optional[NodeCapacity]:
+        candidates = [node for node in self.nodes if node.name in usage
+                      and self._in_zones(node, resources) and self._fits(node, requested, usage[node.name])]
+        # avoided nodes (e.g. those the task already failed on) are used only when no other node fits
+        return min(candidates, key=lambda node: (node.name in avoided_nodes,
+                                                 self._remaining_after(node, requested, usage[node.name])),
+                   default=None)
+
+    def _can_ever_fit(self, requested: Dict[str, float], resources: Optional[TesTaskResources]) -> bool:
+        return any(self._in_zones(node, resources) and self._fits(node, requested, {}) for node in self.nodes)
+
+    def _node(self, node_name: str) -> Optional[NodeCapacity]:
+        return next((node for node in self.nodes if node.name == node_name), None)
+
+    async def placement(self, task_id: ObjectId) -> Optional[NodeCapacity]:
+        # placement is known to every service worker, not just to the one which placed the task
+        return (await node_repository.get_placement(task_id)).maybe(None, self._node)
+
+    async def acquire(self, task_id: ObjectId, resources: Optional[TesTaskResources],
+                      avoided_nodes: Sequence[str] = ()) -> NodeCapacity:
+        placed = await self.placement(task_id)
+        if placed:
+            return placed
+        requested = self._requested(resources)
+        if not self._can_ever_fit(requested, resources):
+            raise TaskPlacementError(task_id, requested)
+
+        while True:
+            node = self._best_fit(requested, resources, await node_repository.get_usage(), avoided_nodes)
+            if node:
+                claimed = await node_repository.claim(node.name, task_id, requested, self._used_limits(node, requested))
+                if claimed.is_just():
+                    logger.debug('Task placed [id: {}, node: {}, resources: {}]', task_id, node.name, requested)
+                    return node
+                # resources of the node were taken by another worker meanwhile, usage is read again
+                continue
+            logger.debug('Task held back until resources are released [id: {}, resources: {}]', task_id, requested)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait([waiter], timeout=self.poll_interval)
+            finally:
+                self._waiters.remove(waiter)
+
+    async def release(self, task_id: ObjectId) -> Optional[NodeCapacity]:
+        released = (await node_repository.release(task_id)).maybe(None, lambda node_name: node_name)
+        if released is None:
+            return None
+        # every held back task re-evaluates placement, smaller tasks may fit even when the first one does not
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        return self._node(released)
+
+    async def release_finished(self) -> None:
+        # placements of tasks which finished without releasing them, e.g. when processed by crashed service worker
+        placed_task_ids = await node_repository.get_placed_task_ids()
+        active_task_ids = set(await task_repository.get_active_task_ids(placed_task_ids)) if placed_task_ids else set()
+        for task_id in placed_task_ids:
+            if task_id not in active_task_ids and await self.release(task_id):
+                logger.warning(f'Released resources of task which is no longer processed [id: {str(task_id)}]')
+
+
+def get_configured_nodes() -> List[NodeCapacity]:
+    nodes = properties.pulsar.get('nodes', [])
+    return [NodeCapacity(**node) for node in nodes] if nodes\
+        else [NodeCapacity(name='default', url=properties.pulsar.url)]
+
+
+resource_scheduler = ResourceScheduler(get_configured_nodes(), properties.pulsar.placement_poll_interval)
@@ -0,0 +1,91 @@
+import gzip
+import math
+import time
+import shlex
+import asyncio
+from collections import Counter
+from typing import List, Sequence
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.config.properties import properties
+
+COMPRESSED_SUFFIX = '.gz'
+
+staged_bytes = metrics.counter('tesp_staging_bytes_total', 'Bytes of staged files before and after compression',
+                               ['direction', 'encoding'])
+compression_ratio = metrics.histogram('tesp_staging_compression_ratio', 'Compressed to original size of staged files',
+                                      ['direction'], buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1, 1.1))
+compression_duration = metrics.histogram('tesp_staging_compression_seconds',
+                                         'Time spent compressing or decompressing staged files', ['direction'])
+
+
+def sample_entropy(sample: bytes) -> float:
+    # Shannon entropy in bits per byte, text stays well below 6 while compressed or encrypted data gets close to 8
+    if not sample:
+        return 0.0
+    return -sum(count / len(sample) * math.log2(count / len(sample)) for count in Counter(sample).values())
+
+
+def _paths(paths: Sequence[str]) -> str:
+    return ' '.join(shlex.quote(path) for path in paths)
+
+
+class StagingCompression:
+    # Files staged between TESP API and Pulsar travel gzip compressed. Pulsar stores uploaded files as they are,
+    # therefore the job itself decompresses inputs before its first executor and compresses outputs after its last one
+
+    def __init__(self, enabled: bool, min_size: int, max_entropy: float, sample_size: int, level: int):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.max_entropy = max_entropy
+        self.sample_size = sample_size
+        self.level = level
+
+    def should_compress(self, content: bytes) -> bool:
+        return self.enabled and len(content) >= self.min_size and \
+            sample_entropy(content[:self.sample_size]) <= self.max_entropy
+
+    async def compress(self, content: bytes) -> bytes:
+        started = time.perf_counter()
+        compressed = await asyncio.to_thread(gzip.compress, content, self.level)
+        self._observe('upload', len(content), len(compressed), time.perf_counter() - started)
+        return compressed
+
+    async def decompress(self, compressed: bytes) -> bytes:
+        started = time.perf_counter()
+        content = await asyncio.to_thread(gzip.decompress, compressed)
+        self._observe('download', len(content), len(compressed), time.perf_counter() - started)
+        return content
+
+    @staticmethod
+    def _observe(direction: str, size: int, compressed_size: int, duration: float) -> None:
+        staged_bytes.inc(size, direction=direction, encoding='identity')
+        staged_bytes.inc(compressed_size, direction=direction, encoding='gzip')
+        compression_duration.observe(duration, direction=direction)
+        if size:
+            compression_ratio.observe(compressed_size / size, direction=direction)
+
+    def wrap_run_commands(self, run_commands: List[str], compressed_inputs: Sequence[str],
+                          compressed_outputs: Sequence[str]) -> List[str]:
+        # compressed inputs are staged next to their paths with the suffix, outputs missing after the last executor
+        # or smaller than min_size are left uncompressed, exit code of the run command is kept
+        if not run_commands or not (compressed_inputs or compressed_outputs):
+            return run_commands
+        run_commands = list(run_commands)
+        if compressed_inputs:
+            inputs = _paths([f'{path}{COMPRESSED_SUFFIX}' for path in compressed_inputs])
+            run_commands[0] = f'{{ gzip -d -f -- {inputs} && {run_commands[0]}; }}'
+        if compressed_outputs:
+            run_commands[-1] = f'{{ {run_commands[-1]} && {{ for f in {_paths(compressed_outputs)}; do ' \
+                               f'if [ -f "$f" ] && [ "$(wc -c < "$f")" -ge {self.min_size} ]; then ' \
+                               f'gzip -{self.level} -c -- "$f" > "$f{COMPRESSED_SUFFIX}"; fi; ' \
+                               f'done || true; }}; }}'
+        return run_commands
+
+
+staging_compression = StagingCompression(
+    properties.pulsar.compression.enabled,
+    properties.pulsar.compression.min_size,
+    properties.pulsar.compression.max_entropy,
+    properties.pulsar.compression.sample_size,
+    properties.pulsar.compression.level)
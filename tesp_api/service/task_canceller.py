@@ -0,0 +1,81 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+from pymonad.maybe import Just
+from bson.objectid import ObjectId
+
+from tesp_api.utils.functional import maybe_of
+from tesp_api.config.properties import properties
+from tesp_api.repository.model.task import TesTaskState
+from tesp_api.service.pulsar_service import pulsar_service
+from tesp_api.service.error import pulsar_event_handle_cancel
+from tesp_api.service.event_dispatcher import cancel_task_events
+from tesp_api.service.resource_scheduler import resource_scheduler
+from tesp_api.repository.task_repository import task_repository
+
+CANCELABLE_STATES = [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]
+
+
+class TaskCanceller:
+    # Tasks are canceled by one update, then a fixed number of workers stops their processing and erases their
+    # Pulsar jobs, so canceling thousands of tasks does not flood Pulsar. Canceled tasks are read by cursor into
+    # a bounded queue as the workers take them. Jobs left over at shutdown are erased by the reconciler.
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._feeders: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in [*self._feeders, *self._workers]:
+            worker.cancel()
+        await asyncio.gather(*self._feeders, *self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def cancel_tasks(self, search_query: Dict[str, Any], states: Optional[List[TesTaskState]]) -> Dict[str, int]:
+        states = [state for state in CANCELABLE_STATES if not states or state in states]
+        if not states:
+            return {'matched': 0, 'canceled': 0}
+        cancel_batch = ObjectId()
+        matched, canceled = await task_repository.cancel_tasks({**search_query, 'state': {'$in': states}}, cancel_batch)
+        if canceled:
+            feeder = asyncio.create_task(self._feed(cancel_batch))
+            self._feeders.add(feeder)
+            feeder.add_done_callback(self._feeders.discard)
+        logger.info(f'Tasks canceled [matched: {matched}, canceled: {canceled}, batch: {str(cancel_batch)}]')
+        return {'matched': matched, 'canceled': canceled}
+
+    async def _feed(self, cancel_batch: ObjectId) -> None:
+        try:
+            async for task in task_repository.find_canceled_tasks(cancel_batch):
+                await self._queue.put(task)
+        except Exception as error:
+            logger.error(f'Failed to read canceled tasks [batch: {str(cancel_batch)}, error: {error}]')
+
+    async def _work(self) -> None:
+        while True:
+            task = await self._queue.get()
+            try:
+                await self._stop_task(task)
+            except Exception as error:
+                logger.error(f'Failed to stop processing of canceled task [id: {str(task["_id"])}, error: {error}]')
+            finally:
+                self._queue.task_done()
+
+    async def _stop_task(self, task: Dict[str, Any]) -> None:
+        await cancel_task_events(task['_id'])
+        # task placed onto a node may have its job set up before it gets recorded
+        nodes = {node.name: node for node in resource_scheduler.nodes}
+        node = nodes.get(task.get('pulsar_job', {}).get('node')) or await resource_scheduler.placement(task['_id'])
+        await pulsar_event_handle_cancel(task['_id'], maybe_of(node).map(
+            lambda _node: pulsar_service.get_operations(Just(_node))))
+
+
+task_canceller = TaskCanceller(properties.bulk.cancel_concurrency, properties.bulk.cancel_queue_size)
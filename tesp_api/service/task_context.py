@@ -0,0 +1,42 @@
+from typing import Optional, Tuple
+
+from bson.objectid import ObjectId
+
+from tesp_api.utils.types import TransferUrl
+
+
+# Event payloads outlive their handlers while the task waits on the executor, so in-flight tasks are bounded by
+# the memory of their payloads. One slotted context per task is updated in place by the handlers instead of the
+# payload dict being copied and extended by every phase, immutable parts of it are shared.
+
+class StagedFile:
+    # shared files are not staged through Pulsar, inputs are mounted from their own paths read only and outputs are
+    # moved from the job directory to their destination
+    __slots__ = ('container_path', 'pulsar_path', 'url', 'compressed', 'shared')
+
+    def __init__(self, container_path: str, pulsar_path: str, url: Optional[TransferUrl] = None,
+                 compressed: bool = False, shared: bool = False):
+        self.container_path = container_path
+        self.pulsar_path = pulsar_path
+        self.url = url
+        self.compressed = compressed
+        self.shared = shared
+
+
+class TaskContext:
+    __slots__ = ('task_id', 'retry_delay', 'avoid_nodes', 'queued_at', 'call_cache_key', 'pulsar_operations',
+                 'outputs_directory', 'inputs', 'outputs')
+
+    def __init__(self, task_id: ObjectId, retry_delay: Optional[float] = None, avoid_nodes: Tuple[str, ...] = ()):
+        self.task_id = task_id
+        self.retry_delay = retry_delay
+        self.avoid_nodes = avoid_nodes
+        self.queued_at: Optional[float] = None
+        self.call_cache_key: Optional[str] = None
+        self.pulsar_operations = None
+        self.outputs_directory: Optional[str] = None
+        self.inputs: Tuple[StagedFile, ...] = ()
+        self.outputs: Tuple[StagedFile, ...] = ()
+
+    def __repr__(self):
+        return f'TaskContext [task_id: {str(self.task_id)}]'
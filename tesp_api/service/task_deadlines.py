@@ -0,0 +1,69 @@
+from typing import Dict, Optional
+
+from bson.objectid import ObjectId
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.timer_wheel import TimerWheel
+from tesp_api.config.properties import properties
+from tesp_api.service.task_context import TaskContext
+from tesp_api.service.event_dispatcher import dispatch_event
+
+TASK_DEADLINE_EXCEEDED = 'task_deadline_exceeded'
+EXECUTOR_TIMEOUT_EXCEEDED = 'executor_timeout_exceeded'
+
+expired_limits = metrics.counter('tesp_task_time_limits_exceeded_total', 'Tasks canceled for exceeding time limit',
+                                 ['limit'])
+
+
+class TaskDeadlines:
+    # time limits of tasks are timers of one shared wheel, expiry dispatches an event canceling the task. Timers
+    # outlive attempts of the task, the node its current attempt runs on is resolved only once they expire
+
+    def __init__(self, wheel: TimerWheel, deadline_tag: str, default_deadline: float,
+                 executor_timeout_tag: str, default_executor_timeout: float):
+        self.wheel = wheel
+        self.deadline_tag = deadline_tag
+        self.default_deadline = default_deadline
+        self.executor_timeout_tag = executor_timeout_tag
+        self.default_executor_timeout = default_executor_timeout
+
+    @staticmethod
+    def _seconds(tags: Optional[Dict[str, str]], tag: str, default: float) -> float:
+        try:
+            return float((tags or {}).get(tag, default))
+        except ValueError:
+            return default
+
+    def executor_timeout(self, tags: Optional[Dict[str, str]]) -> float:
+        return self._seconds(tags, self.executor_timeout_tag, self.default_executor_timeout)
+
+    def _expire(self, event_name: str, task_id: ObjectId) -> None:
+        expired_limits.inc(limit=event_name)
+        dispatch_event(event_name, TaskContext(task_id))
+
+    def start_task(self, task_id: ObjectId, tags: Optional[Dict[str, str]]) -> None:
+        # deadline spans all attempts of the task, therefore it is kept once started
+        deadline = self._seconds(tags, self.deadline_tag, self.default_deadline)
+        key = (str(task_id), TASK_DEADLINE_EXCEEDED)
+        if deadline > 0 and key not in self.wheel:
+            self.wheel.schedule(key, deadline, lambda: self._expire(TASK_DEADLINE_EXCEEDED, task_id))
+
+    def start_executor(self, task_id: ObjectId, timeout: float) -> None:
+        if timeout > 0:
+            self.wheel.schedule((str(task_id), EXECUTOR_TIMEOUT_EXCEEDED), timeout,
+                                lambda: self._expire(EXECUTOR_TIMEOUT_EXCEEDED, task_id))
+
+    def stop_executor(self, task_id: ObjectId) -> None:
+        self.wheel.cancel((str(task_id), EXECUTOR_TIMEOUT_EXCEEDED))
+
+    def clear(self, task_id: ObjectId) -> None:
+        self.wheel.cancel((str(task_id), TASK_DEADLINE_EXCEEDED))
+        self.stop_executor(task_id)
+
+
+task_deadlines = TaskDeadlines(
+    TimerWheel(properties.deadline.tick, properties.deadline.wheel_slots),
+    properties.deadline.deadline_tag,
+    properties.deadline.default_deadline,
+    properties.deadline.executor_timeout_tag,
+    properties.deadline.default_executor_timeout)
@@ -0,0 +1,113 @@
+import shutil
+import asyncio
+import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.resilience import RetryPolicy
+from tesp_api.config.properties import properties
+from tesp_api.repository.task_repository import task_repository
+from tesp_api.repository.model.task import TesTaskState, TesTaskLog
+
+ACTIVE_STATES = [TesTaskState.QUEUED, TesTaskState.INITIALIZING, TesTaskState.RUNNING]
+
+task_retries = metrics.counter('tesp_task_retries_total', 'Task attempts started after system error', ['error'])
+task_requeues = metrics.counter('tesp_task_requeues_total', 'Tasks queued again after shutdown interrupted them')
+
+
+class StagedInputs:
+    # inputs downloaded for the failed attempt are kept so the next attempt does not download them again
+
+    def __init__(self, enabled: bool, directory: str, max_size: int):
+        self.enabled = enabled
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    def _path(self, task_id: ObjectId, index: int) -> Path:
+        return self.directory / str(task_id) / f'input_{index}'
+
+    async def get(self, task_id: ObjectId, index: int) -> Optional[bytes]:
+        path = self._path(task_id, index)
+        if not self.enabled or not path.exists():
+            return None
+        return await asyncio.to_thread(path.read_bytes)
+
+    async def put(self, task_id: ObjectId, index: int, content: bytes) -> None:
+        if not self.enabled or len(content) > self.max_size:
+            return
+        path = self._path(task_id, index)
+        try:
+            await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(path.write_bytes, content)
+        except OSError as error:
+            logger.warning(f'Failed to keep staged input for retries [task_id: {str(task_id)}, error: {error}]')
+
+    async def discard(self, task_id: ObjectId) -> None:
+        if self.enabled:
+            await asyncio.to_thread(shutil.rmtree, self.directory / str(task_id), True)
+
+    async def discard_finished(self) -> None:
+        # inputs left behind by tasks whose processing was lost, e.g. on crash of the service worker
+        if not self.enabled or not self.directory.is_dir():
+            return
+        task_ids = [ObjectId(path.name) for path in self.directory.iterdir() if ObjectId.is_valid(path.name)]
+        active_task_ids = set(await task_repository.get_active_task_ids(task_ids)) if task_ids else set()
+        for task_id in task_ids:
+            if task_id not in active_task_ids:
+                await self.discard(task_id)
+
+
+task_retry_policy = RetryPolicy(
+    max_attempts=properties.task_retry.max_attempts,
+    base_delay=properties.task_retry.base_delay,
+    max_delay=properties.task_retry.max_delay)
+
+staged_inputs = StagedInputs(
+    properties.task_retry.stage_inputs and task_retry_policy.max_attempts > 1,
+    properties.task_retry.staging_directory,
+    properties.task_retry.max_staged_size)
+
+
+async def _queue_next_attempt(task_id: ObjectId, logs: List[TesTaskLog], system_log: str,
+                              fields: Dict[str, Any]) -> bool:
+    if logs:
+        logs[-1].end_time = logs[-1].end_time or datetime.datetime.now(datetime.timezone.utc)
+        logs[-1].system_logs = [*(logs[-1].system_logs or []), system_log]
+    logs.append(TesTaskLog(logs=[], outputs=[], system_logs=[]))
+    updated_task = await task_repository.update_task_view(
+        {'_id': task_id, 'state': {'$in': ACTIVE_STATES}},
+        {'$set': {'state': TesTaskState.QUEUED, 'logs': jsonable_encoder(logs), **fields}}, [])
+    return updated_task.is_just()
+
+
+async def prepare_task_retry(task_id: ObjectId, error: Exception) -> Optional[float]:
+    # moves task back to the queue with a new attempt log, returns delay the next attempt should start after
+    # or None if the task run out of attempts
+    task = await task_repository.get_task_view({'_id': task_id, 'state': {'$in': ACTIVE_STATES}}, ['logs'])
+    logs = task.maybe([], lambda _task: _task.logs or [])
+    if not logs or len(logs) >= task_retry_policy.max_attempts:
+        return None
+    delay = task_retry_policy.backoff(len(logs) - 1)
+    system_log = f'System error occurred, task will be retried [attempt: {len(logs) + 1}, ' \
+                 f'msg: {getattr(error, "message", str(error))}]'
+    if not await _queue_next_attempt(task_id, logs, system_log, {}):
+        return None
+    task_retries.inc(error=type(error).__name__)
+    return delay
+
+
+async def requeue_interrupted_task(task_id: ObjectId) -> bool:
+    # task is queued again with a new attempt log, marked to be resumed by the reconciler of any service worker
+    task = await task_repository.get_task_view({'_id': task_id, 'state': {'$in': ACTIVE_STATES}}, ['logs'])
+    if task.is_nothing():
+        return False
+    system_log = 'Task processing was interrupted by service shutdown, task was queued again'
+    if not await _queue_next_attempt(task_id, task.value.logs or [], system_log, {'requeued': True}):
+        return False
+    task_requeues.inc()
+    return True
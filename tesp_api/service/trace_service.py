@@ -0,0 +1,38 @@
+import json
+import asyncio
+from pathlib import Path
+
+from loguru import logger
+from bson.objectid import ObjectId
+
+from tesp_api.config.properties import properties
+from tesp_api.utils.tracing import tracer, TaskTrace
+from tesp_api.repository.task_repository import task_repository
+
+
+def export_trace(trace: TaskTrace, export_directory: str) -> None:
+    directory = Path(export_directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f'{trace.task_id}.json').write_text(json.dumps(trace.to_otlp_json('tesp-api')))
+
+
+async def store_trace_summary(task_id: ObjectId, trace: TaskTrace) -> None:
+    task = await task_repository.get_task_view({'_id': task_id}, ['logs'])
+    logs = task.maybe([], lambda _task: _task.logs or [])
+    if not logs:
+        return
+    metadata = {**(logs[-1].metadata or {}), **trace.summary()}
+    await task_repository.update_task_view(
+        {'_id': task_id}, {'$set': {f'logs.{len(logs) - 1}.metadata': metadata}}, [])
+
+
+async def complete_task_trace(task_id: ObjectId) -> None:
+    trace = tracer.pop_trace(task_id)
+    if trace is None:
+        return
+    try:
+        await store_trace_summary(task_id, trace)
+        if properties.tracing.export_directory:
+            await asyncio.to_thread(export_trace, trace, properties.tracing.export_directory)
+    except Exception as error:
+        logger.warning(f'Failed to store trace of task [id: {str(task_id)}, error: {error}]')
@@ -0,0 +1,330 @@
+import hmac
+import shutil
+import asyncio
+import hashlib
+import datetime
+from pathlib import Path
+from collections import deque
+from xml.etree import ElementTree
+from contextlib import asynccontextmanager
+from urllib.parse import quote, unquote, urlsplit
+from typing import Set, Dict, Any, List, Optional, AsyncIterator, Callable, Awaitable
+
+import aioftp
+import aiohttp
+from yarl import URL
+from loguru import logger
+
+from tesp_api.utils.types import TransferUrl
+from tesp_api.utils.functional import maybe_of
+
+TransferChunks = AsyncIterator[bytes]
+_END_OF_STREAM = object()
+
+
+async def chunked(content: bytes, chunk_size: int) -> TransferChunks:
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+async def regrouped(chunks: TransferChunks, part_size: int) -> TransferChunks:
+    part = bytearray()
+    async for chunk in chunks:
+        part += chunk
+        while len(part) >= part_size:
+            yield bytes(part[:part_size])
+            del part[:part_size]
+    if part:
+        yield bytes(part)
+
+
+async def buffered(chunks: TransferChunks, max_chunks: int) -> TransferChunks:
+    # decouples reading side of the transfer from the writing one, reader is suspended once buffer is full
+    queue = asyncio.Queue(max_chunks)
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(_END_OF_STREAM)
+        except Exception as error:
+            await queue.put(error)
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not _END_OF_STREAM:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def parallel_ranges(read_range: Callable[[int, int], Awaitable[bytes]], size: int,
+                          part_size: int, concurrency: int) -> TransferChunks:
+    # parts are yielded in order, at most `concurrency` of them are held in memory
+    pending = deque()
+    try:
+        for start in range(0, size, part_size):
+            pending.append(asyncio.ensure_future(read_range(start, min(start + part_size, size) - 1)))
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for part in pending:
+            part.cancel()
+
+
+class TransferBackend:
+
+    def __init__(self, chunk_size: int, part_size: int, max_concurrency: int):
+        self.chunk_size = chunk_size
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+
+    async def init(self, session: aiohttp.ClientSession) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def stat(self, url: TransferUrl) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def read(self, url: TransferUrl) -> TransferChunks:
+        raise NotImplementedError
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        raise NotImplementedError
+
+
+class FtpTransferBackend(TransferBackend):
+
+    def __init__(self, chunk_size: int, part_size: int, max_concurrency: int):
+        super().__init__(chunk_size, part_size, max_concurrency)
+        self._ftp_clients: Set[aioftp.Client] = set()
+
+    @asynccontextmanager
+    async def _ftp_client(self, ftp_url: TransferUrl):
+        async with aioftp.Client.context(
+                host=ftp_url.host, port=maybe_of(ftp_url.port).maybe(aioftp.DEFAULT_PORT, lambda x: int(x)),
+                user=maybe_of(ftp_url.user).maybe(aioftp.DEFAULT_USER, lambda x: x),
+                password=maybe_of(ftp_url.password).maybe(aioftp.DEFAULT_PASSWORD, lambda x: x)) as client:
+            self._ftp_clients.add(client)
+            try:
+                yield client
+            finally:
+                self._ftp_clients.discard(client)
+
+    def close(self) -> None:
+        # aborts transfers still in progress, their callers will fail with connection error
+        for client in list(self._ftp_clients):
+            client.close()
+        self._ftp_clients.clear()
+
+    async def stat(self, url: TransferUrl) -> Dict[str, Any]:
+        async with self._ftp_client(url) as client:
+            info = await client.stat(url.path)
+            return {'size': info.get('size'), 'modify': info.get('modify')}
+
+    async def read(self, url: TransferUrl) -> TransferChunks:
+        async with self._ftp_client(url) as client:
+            async with client.download_stream(url.path) as stream:
+                async for chunk in stream.iter_by_block(self.chunk_size):
+                    yield chunk
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        async with self._ftp_client(url) as client:
+            async with client.upload_stream(url.path) as stream:
+                async for chunk in chunks:
+                    await stream.write(chunk)
+
+
+class HttpTransferBackend(TransferBackend):
+
+    def __init__(self, chunk_size: int, part_size: int, max_concurrency: int):
+        super().__init__(chunk_size, part_size, max_concurrency)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def init(self, session: aiohttp.ClientSession) -> None:
+        self.session = session
+
+    def _request(self, method: str, url: TransferUrl, params: Dict[str, str] = None,
+                 headers: Dict[str, str] = None, data=None):
+        return self.session.request(method, str(url), params=params, headers=headers, data=data,
+                                    raise_for_status=True)
+
+    async def _head(self, url: TransferUrl) -> Dict[str, Any]:
+        async with self._request('HEAD', url) as response:
+            return {'size': response.content_length,
+                    'modify': response.headers.get('Last-Modified', response.headers.get('ETag')),
+                    'ranges': response.headers.get('Accept-Ranges') == 'bytes'}
+
+    async def stat(self, url: TransferUrl) -> Dict[str, Any]:
+        head = await self._head(url)
+        return {'size': head['size'], 'modify': head['modify']}
+
+    async def _read_range(self, url: TransferUrl, start: int, end: int) -> bytes:
+        async with self._request('GET', url, headers={'Range': f'bytes={start}-{end}'}) as response:
+            return await response.read()
+
+    async def read(self, url: TransferUrl) -> TransferChunks:
+        head = await self._head(url)
+        if head['ranges'] and head['size'] and head['size'] > self.part_size:
+            async for part in parallel_ranges(lambda start, end: self._read_range(url, start, end),
+                                              head['size'], self.part_size, self.max_concurrency):
+                yield part
+            return
+        async with self._request('GET', url) as response:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                yield chunk
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        async with self._request('PUT', url, data=chunks):
+            pass
+
+
+class S3TransferBackend(HttpTransferBackend):
+
+    def __init__(self, chunk_size: int, part_size: int, max_concurrency: int,
+                 endpoint_url: str, region: str, access_key: str, secret_key: str):
+        super().__init__(chunk_size, part_size, max_concurrency)
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+
+    def _signed_headers(self, method: str, path: str, params: Dict[str, str]) -> Dict[str, str]:
+        # AWS signature version 4, payloads are left unsigned so they can be streamed
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date, date = now.strftime('%Y%m%dT%H%M%SZ'), now.strftime('%Y%m%d')
+        headers = {'host': urlsplit(self.endpoint_url).netloc, 'x-amz-content-sha256': 'UNSIGNED-PAYLOAD',
+                   'x-amz-date': amz_date}
+        if not self.access_key:
+            return headers
+        canonical_query = '&'.join(f'{quote(key, safe="~")}={quote(value, safe="~")}'
+                                   for key, value in sorted(params.items()))
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method, path, canonical_query, *[f'{key}:{headers[key]}' for key in sorted(headers)], '',
+            signed_headers, 'UNSIGNED-PAYLOAD'])
+        scope = f'{date}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()])
+        signing_key = f'AWS4{self.secret_key}'.encode()
+        for scope_part in (date, self.region, 's3', 'aws4_request'):
+            signing_key = hmac.new(signing_key, scope_part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return {**headers, 'Authorization': f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+                                            f'SignedHeaders={signed_headers}, Signature={signature}'}
+
+    def _request(self, method: str, url: TransferUrl, params: Dict[str, str] = None,
+                 headers: Dict[str, str] = None, data=None):
+        # objects are addressed path-style, therefore any S3 compatible storage (e.g. MinIO) can be used
+        params = params or {}
+        path = quote(unquote(f'/{url.host}{url.path or "/"}'), safe='/~')
+        query = '&'.join(f'{quote(key, safe="~")}={quote(value, safe="~")}' for key, value in sorted(params.items()))
+        request_url = URL(f'{self.endpoint_url}{path}{"?" + query if query else ""}', encoded=True)
+        return self.session.request(method, request_url, data=data, raise_for_status=True,
+                                    headers={**(headers or {}), **self._signed_headers(method, path, params)})
+
+    async def _upload_part(self, url: TransferUrl, upload_id: str, part_number: int, part: bytes) -> str:
+        params = {'partNumber': str(part_number), 'uploadId': upload_id}
+        async with self._request('PUT', url, params=params, data=part) as response:
+            return response.headers['ETag']
+
+    async def _abort_upload(self, url: TransferUrl, upload_id: str) -> None:
+        try:
+            async with self._request('DELETE', url, params={'uploadId': upload_id}):
+                pass
+        except Exception as error:
+            logger.warning(f'Failed to abort multipart upload [url: {url.scheme}://{url.host}{url.path}, '
+                           f'upload_id: {upload_id}, error: {error}]')
+
+    async def _upload_parts(self, url: TransferUrl, upload_id: str, parts: TransferChunks) -> Dict[int, str]:
+        uploads: Dict[int, asyncio.Future] = {}
+        try:
+            async for part in parts:
+                uploads[len(uploads) + 1] = asyncio.ensure_future(
+                    self._upload_part(url, upload_id, len(uploads) + 1, part))
+                # bounds number of parts held in memory, first failed part fails whole upload
+                in_flight = [upload for upload in uploads.values() if not upload.done()]
+                if len(in_flight) >= self.max_concurrency:
+                    done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for upload in done:
+                        upload.result()
+            return {number: await upload for number, upload in uploads.items()}
+        finally:
+            for upload in uploads.values():
+                upload.cancel()
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        parts = regrouped(chunks, self.part_size)
+        first_part, second_part = await anext(parts, b''), await anext(parts, None)
+        if second_part is None:
+            async with self._request('PUT', url, data=first_part):
+                return
+
+        async def all_parts():
+            yield first_part
+            yield second_part
+            async for part in parts:
+                yield part
+        async with self._request('POST', url, params={'uploads': ''}) as response:
+            upload_id = ElementTree.fromstring(await response.read()).findtext('{*}UploadId')
+        try:
+            etags = await self._upload_parts(url, upload_id, all_parts())
+        except BaseException:
+            await self._abort_upload(url, upload_id)
+            raise
+        completed_parts = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                                  for number, etag in sorted(etags.items()))
+        async with self._request('POST', url, params={'uploadId': upload_id},
+                                 data=f'<CompleteMultipartUpload>{completed_parts}</CompleteMultipartUpload>'):
+            pass
+
+
+class FileTransferBackend(TransferBackend):
+    # file urls are paths on the host of TESP API, only those under allowed directories are accessible. With shared
+    # filesystem the same paths are visible to Pulsar nodes, files are then mounted into executors and moved out of
+    # job directories instead of being transferred
+
+    def __init__(self, chunk_size: int, part_size: int, max_concurrency: int,
+                 allowed_directories: List[str], shared: bool):
+        super().__init__(chunk_size, part_size, max_concurrency)
+        self.allowed_directories = [Path(directory).resolve() for directory in allowed_directories]
+        self.shared = shared
+
+    def path(self, url: TransferUrl) -> Path:
+        path = Path(unquote(url.path or '')).resolve()
+        if not any(path.is_relative_to(directory) for directory in self.allowed_directories):
+            raise PermissionError(f'Path is not within allowed directories [path: {path}]')
+        return path
+
+    async def stat(self, url: TransferUrl) -> Dict[str, Any]:
+        info = await asyncio.to_thread(self.path(url).stat)
+        return {'size': info.st_size, 'modify': info.st_mtime_ns}
+
+    async def read(self, url: TransferUrl) -> TransferChunks:
+        with await asyncio.to_thread(self.path(url).open, 'rb') as file:
+            while chunk := await asyncio.to_thread(file.read, self.chunk_size):
+                yield chunk
+
+    async def write(self, url: TransferUrl, chunks: TransferChunks) -> None:
+        path = self.path(url)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        with await asyncio.to_thread(path.open, 'wb') as file:
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+
+    async def share(self, url: TransferUrl) -> str:
+        # missing path would be created as empty directory by docker once mounted
+        path = self.path(url)
+        await asyncio.to_thread(path.stat)
+        return str(path)
+
+    async def move(self, source_path: str, url: TransferUrl) -> None:
+        # renamed on the same device, otherwise copied by sendfile (or streamed where not supported) and removed
+        path = self.path(url)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        await asyncio.to_thread(shutil.move, source_path, str(path))
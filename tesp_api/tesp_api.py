@@ -1,18 +1,37 @@
 import asyncio
 
+from loguru import logger
 from pydantic.error_wrappers import ValidationError
 from starlette.responses import RedirectResponse
 from fastapi import FastAPI, APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 import tesp_api.service.event_actions
 from tesp_api.api.api import api_router
 from tesp_api.api.error import api_handle_error
-from tesp_api.config.log_config import logg_configure
+from tesp_api.config.log_config import logg_configure, logg_shutdown
+from tesp_api.utils.metrics import metrics
+from tesp_api.utils.functional import maybe_of
+from tesp_api.utils.loop_watchdog import LoopWatchdog
 from tesp_api.config.properties import properties
+from tesp_api.service.pulsar_service import pulsar_service
+from tesp_api.service.task_context import TaskContext
+from tesp_api.service.error import pulsar_event_handle_interrupt
 from tesp_api.repository.task_repository import task_repository
+from tesp_api.repository.call_cache_repository import call_cache_repository
+from tesp_api.repository.node_repository import node_repository
+from tesp_api.service.file_transfer_service import file_transfer_service
+from tesp_api.service.job_reconciler import job_reconciler
+from tesp_api.service.task_deadlines import task_deadlines
+from tesp_api.service.task_canceller import task_canceller
+from tesp_api.service.resource_scheduler import resource_scheduler
+from tesp_api.service.fair_share_scheduler import fair_share_scheduler
+from tesp_api.service.event_dispatcher import open_admission, close_admission, is_admission_open, drain_events,\
+    dispatch_event
 
 root_router = APIRouter()
 app = FastAPI(title="Tesp API", docs_url="/swagger-ui.html")
+loop_watchdog = LoopWatchdog(properties.watchdog.interval, properties.watchdog.lag_threshold)
 
 
 @root_router.get("/", status_code=307, include_in_schema=False)
@@ -20,11 +39,57 @@ async def get_root() -> RedirectResponse:
     return RedirectResponse(url="swagger-ui.html")
 
 
+@root_router.get("/health/ready", include_in_schema=False)
+async def get_readiness() -> JSONResponse:
+    return JSONResponse({'ready': True}) if is_admission_open() \
+        else JSONResponse({'ready': False}, status_code=503)
+
+
+@root_router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.expose())
+
+
 @app.on_event("startup")
 async def startup_event():
     logg_configure()
     await task_repository.init()
-    asyncio.get_event_loop().set_debug(properties.logging.level == "DEBUG")
+    await node_repository.init()
+    await resource_scheduler.init()
+    if properties.call_cache.enabled:
+        await call_cache_repository.init()
+    await pulsar_service.init()
+    await file_transfer_service.init()
+    asyncio.get_event_loop().set_debug(properties.watchdog.asyncio_debug)
+    if properties.watchdog.enabled:
+        loop_watchdog.start()
+    await fair_share_scheduler.start(lambda task_id: dispatch_event('queued_task', TaskContext(task_id)))
+    job_reconciler.start()
+    task_deadlines.wheel.start()
+    task_canceller.start()
+    open_admission()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    close_admission()
+    await fair_share_scheduler.stop()
+    await job_reconciler.stop()
+    logger.info(f'Shutting down, draining in-flight events [timeout: {properties.shutdown.drain_timeout}s]')
+    interrupted_events = await drain_events(properties.shutdown.drain_timeout)
+    await asyncio.gather(*[
+        pulsar_event_handle_interrupt(context.task_id, event_name, maybe_of(context.pulsar_operations))
+        for event_name, context in interrupted_events if isinstance(context, TaskContext)])
+    await task_deadlines.wheel.stop()
+    await task_canceller.stop()
+    loop_watchdog.stop()
+    await file_transfer_service.close()
+    await pulsar_service.close()
+    await task_repository.write_coalescer.close()
+    task_repository.close()
+    node_repository.close()
+    call_cache_repository.close()
+    logg_shutdown()
 
 
 @app.exception_handler(ValidationError)
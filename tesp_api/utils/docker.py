@@ -1,9 +1,11 @@
-from typing import Dict, List
+import shlex
+from typing import Dict, List, Sequence
 
 from pymonad.maybe import Nothing, Maybe, Just
 
-from tesp_api.repository.model.task import TesTaskExecutor
+from tesp_api.repository.model.task import TesTaskExecutor, TesTaskResources
 from tesp_api.utils.functional import get_else_throw, maybe_of
+from tesp_api.service.task_context import StagedFile
 
 
 class DockerRunCommandBuilder:
@@ -12,9 +14,16 @@ class DockerRunCommandBuilder:
         self._docker_image: Maybe[str] = Nothing
         self._volumes: Dict[str, str] = {}
         self._command: Maybe[str] = Nothing
+        self._resource_flags: List[str] = []
 
-    def with_volume(self, host_path: str, container_path: str):
-        self._volumes[host_path] = container_path
+    def with_volume(self, host_path: str, container_path: str, read_only: bool = False):
+        self._volumes[host_path] = f'{container_path}:ro' if read_only else container_path
+        return self
+
+    def with_resources(self, cpu_cores: Maybe[int] = Nothing, ram_gb: Maybe[float] = Nothing):
+        self._resource_flags = [
+            *cpu_cores.maybe([], lambda x: [f'--cpus={x}']),
+            *ram_gb.maybe([], lambda x: [f'--memory={int(x * 1024)}m'])]
         return self
 
     def with_image(self, docker_image: str):
@@ -35,27 +44,38 @@ class DockerRunCommandBuilder:
     def reset(self) -> None:
         self._docker_image = Nothing
         self._volumes = {}
+        self._command = Nothing
+        self._resource_flags = []
         return self
 
     def get_run_command(self) -> str:
         volumes_str = " ".join(map(lambda v_paths: f'-v {v_paths[0]}:{v_paths[1]}', self._volumes.items()))
         docker_image = get_else_throw(self._docker_image, ValueError('Docker image is not set'))
         command_str = self._command.maybe("", lambda x: x)
-        run_command = f'docker run {volumes_str} {docker_image} {command_str}'
+        resources_str = " ".join(self._resource_flags)
+        run_command = f'docker run {resources_str} {volumes_str} {docker_image} {command_str}'
         self.reset()
         return run_command
 
 
-def docker_run_command(executor: TesTaskExecutor, input_confs: List[dict], output_confs: List[dict]) -> str:
+def docker_run_command(executor: TesTaskExecutor, inputs: Sequence[StagedFile], outputs: Sequence[StagedFile],
+                       resources: Maybe[TesTaskResources] = Nothing) -> str:
     command_builder = DockerRunCommandBuilder()\
         .with_image(executor.image) \
+        .with_resources(
+            resources.bind(lambda x: maybe_of(x.cpu_cores)),
+            resources.bind(lambda x: maybe_of(x.ram_gb))) \
         .with_command(
             list(map(lambda x: str(x), executor.command)),
             maybe_of(executor.stdin).map(lambda x: str(x)),
             maybe_of(executor.stdout).map(lambda x: str(x)),
             maybe_of(executor.stderr).map(lambda x: str(x)))
-    [command_builder.with_volume(input_conf['pulsar_path'], input_conf['container_path'])
-     for input_conf in input_confs]
-    [command_builder.with_volume(output_conf['pulsar_path'], output_conf['container_path'])
-     for output_conf in output_confs]
+    [command_builder.with_volume(staged_file.pulsar_path, staged_file.container_path, staged_file.shared)
+     for staged_file in inputs]
+    [command_builder.with_volume(staged_file.pulsar_path, staged_file.container_path)
+     for staged_file in outputs]
     return command_builder.get_run_command()
+
+
+def docker_pull_command(images: List[str]) -> str:
+    return " && ".join(f'docker pull {shlex.quote(image)}' for image in images)
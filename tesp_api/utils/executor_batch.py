@@ -0,0 +1,47 @@
+import base64
+import shlex
+import datetime
+from typing import List
+
+from tesp_api.repository.model.task import TesTaskExecutorLog
+
+BATCH_SCRIPT_FILE = 'tesp_executors.sh'
+BATCH_MANIFEST_FILE = 'tesp_executors_manifest.tsv'
+TIMESTAMP_COMMAND = 'date -u +%Y-%m-%dT%H:%M:%SZ'
+
+
+def executors_batch_script(run_commands: List[str], manifest_path: str) -> str:
+    # runs executors one by one and stops on first failure, each executor appends a manifest line with its
+    # index, exit code, start and end time and base64 encoded stdout and stderr separated by tabs
+    manifest = shlex.quote(manifest_path)
+    lines = ['#!/bin/sh', f': > {manifest}']
+    for index, run_command in enumerate(run_commands):
+        stdout, stderr = shlex.quote(f'{manifest_path}.{index}.stdout'), shlex.quote(f'{manifest_path}.{index}.stderr')
+        lines.extend([
+            f'start_time=$({TIMESTAMP_COMMAND})',
+            f'{run_command} > {stdout} 2> {stderr}',
+            'exit_code=$?',
+            f'end_time=$({TIMESTAMP_COMMAND})',
+            f'printf "%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n" {index} "$exit_code" "$start_time" "$end_time" '
+            f'"$(base64 < {stdout} | tr -d \'\\n\')" "$(base64 < {stderr} | tr -d \'\\n\')" >> {manifest}',
+            f'rm -f {stdout} {stderr}',
+            '[ "$exit_code" -eq 0 ] || exit 0'])
+    return '\n'.join(lines) + '\n'
+
+
+def _parse_timestamp(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+def parse_batch_manifest(manifest: bytes) -> List[TesTaskExecutorLog]:
+    executor_logs: List[TesTaskExecutorLog] = []
+    for line in manifest.decode().splitlines():
+        if not line.strip():
+            continue
+        _index, exit_code, start_time, end_time, stdout, stderr = line.split('\t')
+        executor_logs.append(TesTaskExecutorLog(
+            start_time=_parse_timestamp(start_time), end_time=_parse_timestamp(end_time),
+            stdout=base64.b64decode(stdout).decode(errors='replace'),
+            stderr=base64.b64decode(stderr).decode(errors='replace'),
+            exit_code=int(exit_code)))
+    return executor_logs
@@ -0,0 +1,73 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from typing import Optional
+
+from loguru import logger
+
+from tesp_api.utils.metrics import metrics
+
+loop_lag = metrics.histogram(
+    'tesp_event_loop_lag_seconds', 'Delay of event loop heartbeat callbacks behind their schedule',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+slow_callbacks = metrics.counter('tesp_event_loop_blocked_total', 'Number of times event loop was blocked')
+
+
+class LoopWatchdog:
+    # Heartbeat coroutine measures how late the loop wakes it up, while a separate thread samples the loop
+    # thread stack once the heartbeat is overdue. Costs one wake up per interval instead of loop debug mode.
+
+    def __init__(self, interval: float, lag_threshold: float, max_samples: int = 3):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.max_samples = max_samples
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    async def _beat(self):
+        while True:
+            scheduled = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            loop_lag.observe(max(0.0, now - scheduled))
+            self._last_beat = now
+
+    def _loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return ''.join(traceback.format_stack(frame)) if frame else '<loop thread stack not available>'
+
+    def _watch(self):
+        samples = 0
+        while not self._stopped.wait(self.interval):
+            blocked_for = time.monotonic() - self._last_beat - self.interval
+            if blocked_for < self.lag_threshold:
+                samples = 0
+                continue
+            if samples == 0:
+                slow_callbacks.inc()
+            if samples < self.max_samples:
+                samples += 1
+                logger.warning(f'Event loop is blocked [blocked_for: {blocked_for:.3f}s, sample: {samples}]\n'
+                               f'{self._loop_stack()}')
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,124 @@
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple, Sequence
+
+LabelValues = Tuple[str, ...]
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+
+
+def _format_labels(label_names: Sequence[str], label_values: LabelValues, extra: str = '') -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    labels.extend([extra] if extra else [])
+    return f'{{{",".join(labels)}}}' if labels else ''
+
+
+def _format_value(value: float) -> str:
+    return '+Inf' if value == math.inf else repr(float(value))
+
+
+class Metric(ABC):
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+    def expose(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.metric_type}',
+                          *self.samples()])
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        super().__init__(name, description, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        label_values = self._label_values(labels)
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}'
+                for label_values, value in self._values.items()]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._label_values(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        label_values = self._label_values(labels)
+        counts = self._counts.setdefault(label_values, [0] * len(self.buckets))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        self._sums[label_values] = self._sums.get(label_values, 0) + value
+
+    def count(self, **labels: str) -> int:
+        return self._counts.get(self._label_values(labels), [0])[-1]
+
+    def samples(self) -> List[str]:
+        samples = []
+        for label_values, counts in self._counts.items():
+            for bound, count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(self.label_names, label_values, f'le="{_format_value(bound)}"')
+                samples.append(f'{self.name}_bucket{bucket_labels} {count}')
+            samples.append(f'{self.name}_sum{_format_labels(self.label_names, label_values)} '
+                           f'{_format_value(self._sums[label_values])}')
+            samples.append(f'{self.name}_count{_format_labels(self.label_names, label_values)} {counts[-1]}')
+        return samples
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, label_names, buckets))
+
+    def expose(self) -> str:
+        # Prometheus text exposition format
+        return '\n'.join(metric.expose() for metric in self._metrics.values()) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,127 @@
+import time
+import random
+import asyncio
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class CircuitBreakerOpenError(Exception):
+
+    def __init__(self, name: str):
+        self.message = f'Circuit breaker [name: {name}] is open, call was rejected without being executed'
+        super().__init__(self.message)
+
+    def __repr__(self):
+        return f'CircuitBreakerOpenError [message: {self.message}]'
+
+
+class RetryPolicy:
+
+    def __init__(self, max_attempts: int = 1, base_delay: float = 0.0, max_delay: float = 0.0,
+                 retry_on: Tuple[Type[Exception], ...] = (Exception,)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def backoff(self, attempt: int) -> float:
+        # "full jitter" exponential backoff, spreads retries of many concurrent callers over time
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, operation: Callable[[], Awaitable[T]],
+                  should_retry: Optional[Callable[[Exception], Awaitable[bool]]] = None) -> T:
+        for attempt in range(0, self.max_attempts):
+            try:
+                return await operation()
+            except self.retry_on as error:
+                if attempt + 1 >= self.max_attempts or isinstance(error, CircuitBreakerOpenError):
+                    raise error
+                if should_retry and not await should_retry(error):
+                    raise error
+                delay = self.backoff(attempt)
+                logger.debug('Retrying failed operation [attempt: {}, delay: {:.3f}s, error: {}]',
+                             attempt + 1, delay, error)
+                await asyncio.sleep(delay)
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreakerState(str, Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreakerState.CLOSED
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        match self.state:
+            case CircuitBreakerState.OPEN if self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = CircuitBreakerState.HALF_OPEN
+                self._probe_in_flight = True
+            case CircuitBreakerState.OPEN:
+                raise CircuitBreakerOpenError(self.name)
+            case CircuitBreakerState.HALF_OPEN if self._probe_in_flight:
+                raise CircuitBreakerOpenError(self.name)
+            case CircuitBreakerState.HALF_OPEN:
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != CircuitBreakerState.CLOSED:
+            logger.info(f'Circuit breaker closed [name: {self.name}]')
+        self.state = CircuitBreakerState.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == CircuitBreakerState.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != CircuitBreakerState.OPEN:
+                logger.warning(f'Circuit breaker opened [name: {self.name}, failures: {self._failures}]')
+            self.state = CircuitBreakerState.OPEN
+            self._opened_at = self._clock()
+
+    async def call(self, operation: Callable[[], Awaitable[T]],
+                   failure_on: Tuple[Type[Exception], ...] = (Exception,)) -> T:
+        self.before_call()
+        try:
+            result = await operation()
+        except failure_on as error:
+            self.record_failure()
+            raise error
+        except BaseException as error:
+            # error not caused by the guarded resource (e.g. cancellation), frees probe slot only
+            self._probe_in_flight = False
+            raise error
+        self.record_success()
+        return result
+
+
+class CircuitBreakerRegistry(Dict[str, CircuitBreaker]):
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        super().__init__()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def get_breaker(self, name: str) -> CircuitBreaker:
+        if name not in self:
+            self[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+        return self[name]
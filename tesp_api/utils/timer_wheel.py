@@ -0,0 +1,69 @@
+import math
+import asyncio
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+
+class TimerWheel:
+    # Timers are hashed into slots of the wheel by the tick they expire at, timers expiring after more than one
+    # revolution simply stay in their slot until their tick comes. Single driver task advances the wheel once per
+    # tick, so scheduling and canceling is O(1) and pending timers cost no sleeping coroutines.
+
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self._slots: List[Dict[Hashable, Tuple[int, Callable[[], None]]]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, int] = {}
+        self._position = 0
+        self._driver: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._driver = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._driver:
+            self._driver.cancel()
+            await asyncio.gather(self._driver, return_exceptions=True)
+            self._driver = None
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], None]) -> None:
+        # timer fires no sooner than after delay and at most one tick later, rescheduling replaces the timer
+        self.cancel(key)
+        expiry = self._position + max(1, math.ceil(delay / self.tick))
+        slot = expiry % len(self._slots)
+        self._slots[slot][key] = (expiry, callback)
+        self._timers[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._timers.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def advance(self) -> None:
+        self._position += 1
+        slot = self._slots[self._position % len(self._slots)]
+        expired = [(key, callback) for key, (expiry, callback) in slot.items() if expiry <= self._position]
+        for key, callback in expired:
+            del slot[key]
+            del self._timers[key]
+            try:
+                callback()
+            except Exception as error:
+                logger.error(f'Timer callback failed [key: {key}, error: {error}]')
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time() - self._position * self.tick
+        while True:
+            await asyncio.sleep(started + (self._position + 1) * self.tick - loop.time())
+            # ticks missed while the loop was blocked are caught up at once
+            while self._position < int((loop.time() - started) / self.tick):
+                self.advance()
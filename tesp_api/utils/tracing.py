@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+from functools import wraps
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Awaitable
+
+from tesp_api.config.properties import properties
+
+SPAN_STATUS_UNSET = 0
+SPAN_STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_span_id', 'start_time_ns', 'end_time_ns', 'attributes', 'status')
+
+    def __init__(self, name: str, parent_span_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = SPAN_STATUS_UNSET
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_time_ns or time.time_ns()) - self.start_time_ns) / 1e6
+
+
+class TaskTrace:
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        # trace id is derived from task id so traces are easy to look up by task
+        self.trace_id = task_id.rjust(32, '0')[-32:]
+        self.spans: List[Span] = []
+
+    def summary(self) -> Dict[str, str]:
+        durations: Dict[str, float] = {}
+        for span in self.spans:
+            key = f'span_{span.name.replace(".", "_")}_ms'
+            durations[key] = durations.get(key, 0) + span.duration_ms
+        return {'trace_id': self.trace_id, **{key: str(round(value)) for key, value in durations.items()}}
+
+    def to_otlp_json(self, service_name: str) -> Dict[str, Any]:
+        def attribute(key: str, value: Any) -> Dict[str, Any]:
+            match value:
+                case bool(): return {'key': key, 'value': {'boolValue': value}}
+                case int(): return {'key': key, 'value': {'intValue': str(value)}}
+                case float(): return {'key': key, 'value': {'doubleValue': value}}
+                case _: return {'key': key, 'value': {'stringValue': str(value)}}
+
+        return {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', service_name)]},
+            'scopeSpans': [{'scope': {'name': 'tesp_api'}, 'spans': [{
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                **({'parentSpanId': span.parent_span_id} if span.parent_span_id else {}),
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': str(span.start_time_ns),
+                'endTimeUnixNano': str(span.end_time_ns or time.time_ns()),
+                'attributes': [attribute('tesp.task_id', self.task_id),
+                               *[attribute(key, value) for key, value in span.attributes.items()]],
+                'status': {'code': span.status}
+            } for span in self.spans]}]
+        }]}
+
+
+_current_trace: ContextVar[Optional[TaskTrace]] = ContextVar('current_trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class TaskTracer:
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._traces: Dict[str, TaskTrace] = {}
+        # innermost open span of each asyncio task, context of other tasks is not reachable from outside
+        self._task_spans: Dict[asyncio.Task, Span] = {}
+
+    @contextmanager
+    def activate(self, task_id):
+        # binds spans created by the current asyncio task and tasks it spawns to the trace of given task
+        if not self.enabled:
+            yield None
+            return
+        trace = self._traces.setdefault(str(task_id), TaskTrace(str(task_id)))
+        # events are dispatched from within spans of previous phase, yet each phase starts as a root span
+        trace_token, span_token = _current_trace.set(trace), _current_span.set(None)
+        try:
+            yield trace
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(name, parent.span_id if parent else None, attributes)
+        trace.spans.append(span)
+        token = _current_span.set(span)
+        task = asyncio.current_task()
+        task_parent, self._task_spans[task] = self._task_spans.get(task), span
+        try:
+            yield span
+        except BaseException as error:
+            span.status = SPAN_STATUS_ERROR
+            span.attributes['exception.message'] = str(error)
+            raise
+        finally:
+            span.end_time_ns = time.time_ns()
+            _current_span.reset(token)
+            if task_parent:
+                self._task_spans[task] = task_parent
+            else:
+                self._task_spans.pop(task, None)
+
+    def task_span(self, task: asyncio.Task) -> Optional[Span]:
+        return self._task_spans.get(task)
+
+    def pop_trace(self, task_id) -> Optional[TaskTrace]:
+        return self._traces.pop(str(task_id), None)
+
+
+async def traced(name: str, awaitable: Awaitable, **attributes: Any):
+    with tracer.span(name, **attributes):
+        return await awaitable
+
+
+def traced_phase(phase: str):
+    # decorates event handlers, each handler invocation becomes one phase span of the task trace
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(event):
+            _event_name, context = event
+            with tracer.activate(context.task_id), tracer.span(f'phase.{phase}'):
+                return await handler(event)
+        return wrapper
+    return decorator
+
+
+tracer = TaskTracer(properties.tracing.enabled)
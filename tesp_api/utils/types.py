@@ -1,6 +1,14 @@
+from pydantic import errors
 from pydantic.networks import AnyUrl
 
 
-class FtpUrl(AnyUrl):
-    allowed_schemes = {'ftp'}
-    host_required = True
+class TransferUrl(AnyUrl):
+    # bucket of the s3 urls is their host, file urls are paths without one
+    allowed_schemes = {'file', 'ftp', 'http', 'https', 's3'}
+    host_required = False
+
+    @classmethod
+    def validate_host(cls, parts):
+        if parts['scheme'] != 'file' and not any(parts[part] for part in ('domain', 'ipv4', 'ipv6')):
+            raise errors.UrlHostError()
+        return super().validate_host(parts)
@@ -0,0 +1,26 @@
+import asyncio
+
+from tesp_api.service import call_cache
+from tesp_api.repository.model.task import RegisteredTesTask
+
+
+def task(command: str, input_url: str = 'ftp://ftp.example.org/in.txt') -> RegisteredTesTask:
+    return RegisteredTesTask(
+        executors=[{'image': 'ubuntu:20.04', 'command': [command]}],
+        inputs=[{'url': input_url, 'path': '/data/in.txt', 'type': 'FILE'}],
+        outputs=[{'url': 'ftp://ftp.example.org/out.txt', 'path': '/data/out.txt', 'type': 'FILE'}])
+
+
+def test_call_cache_key_depends_on_task_spec_and_input_fingerprints(monkeypatch):
+    fingerprints = {'/in.txt': {'size': 10, 'modify': '20261019101010'}}
+
+    async def stat_file(url):
+        return fingerprints[url.path]
+    monkeypatch.setattr(call_cache.file_transfer_service, 'stat_file', stat_file)
+
+    key = asyncio.run(call_cache.call_cache_key(task('md5sum /data/in.txt')))
+    assert key == asyncio.run(call_cache.call_cache_key(task('md5sum /data/in.txt')))
+    assert key != asyncio.run(call_cache.call_cache_key(task('wc -l /data/in.txt')))
+
+    fingerprints['/in.txt'] = {'size': 12, 'modify': '20261019111111'}
+    assert key != asyncio.run(call_cache.call_cache_key(task('md5sum /data/in.txt')))
@@ -0,0 +1,24 @@
+from pymonad.maybe import Just
+
+from tesp_api.utils.docker import docker_run_command, DockerRunCommandBuilder
+from tesp_api.service.task_context import StagedFile
+from tesp_api.repository.model.task import TesTaskExecutor, TesTaskResources
+
+
+def test_run_commands_do_not_share_volumes_or_resources():
+    executor = TesTaskExecutor(image='alpine', command=['md5sum', '/data/file'], stdout='/data/out')
+    first = docker_run_command(executor, [StagedFile('/data/file', '/staging/1/inputs/file')],
+                               [StagedFile('/data/out', '/staging/1/outputs/out')],
+                               Just(TesTaskResources(cpu_cores=2)))
+    second = docker_run_command(executor, [StagedFile('/data/file', '/staging/2/inputs/file')], [])
+
+    assert first == 'docker run --cpus=2 -v /staging/1/inputs/file:/data/file -v /staging/1/outputs/out:/data/out ' \
+                    'alpine sh -c "md5sum /data/file 1>/data/out"'
+    assert second == 'docker run  -v /staging/2/inputs/file:/data/file alpine sh -c "md5sum /data/file 1>/data/out"'
+
+
+def test_reset_builder_keeps_no_command_of_previous_task():
+    builder = DockerRunCommandBuilder().with_image('alpine').with_volume('/staging/1/inputs/file', '/data/file')
+    builder.with_command(['md5sum', '/data/file']).reset()
+
+    assert builder.with_image('busybox').get_run_command() == 'docker run   busybox '
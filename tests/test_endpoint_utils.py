@@ -0,0 +1,53 @@
+import pytest
+from bson.objectid import ObjectId
+from pymonad.maybe import Just
+
+from tesp_api.api.error import InvalidRequestError
+from tesp_api.repository.model.task import TesTaskView
+from tesp_api.api.model.request_models import TesTasksFilterModel
+from tesp_api.api.endpoints.endpoint_utils import encode_page_token, decode_page_token, get_list_filter_query, \
+    get_tasks_filter_query, task_etag, tasks_etag, etag_matches
+
+
+def test_page_token_round_trip():
+    last_id, list_filter = ObjectId(), {'state': 'QUEUED', 'tag_key': ['PROJECT_GROUP']}
+    assert decode_page_token(encode_page_token(last_id, list_filter), {}) == (Just(last_id), list_filter)
+
+
+def test_page_token_rejects_different_filter():
+    page_token = encode_page_token(ObjectId(), {'state': 'QUEUED'})
+    with pytest.raises(InvalidRequestError):
+        decode_page_token(page_token, {'state': 'RUNNING'})
+
+
+def test_page_token_rejects_garbage():
+    with pytest.raises(InvalidRequestError):
+        decode_page_token('not-a-token', {})
+
+
+def test_list_filter_query_zips_tag_keys_and_values():
+    assert get_list_filter_query({'name_prefix': 'a.b', 'tag_key': ['A', 'B'], 'tag_value': ['x']}) == {
+        'name': {'$regex': '^a\\.b'}, 'tags.A': 'x', 'tags.B': {'$exists': True}}
+
+
+def test_list_filter_query_rejects_operator_tag_key():
+    with pytest.raises(InvalidRequestError):
+        get_list_filter_query({'tag_key': ['$where']})
+
+
+def test_tasks_filter_query_combines_ids_with_list_filter_and_refuses_empty_filter():
+    task_id = ObjectId()
+    assert get_tasks_filter_query(TesTasksFilterModel(ids=[str(task_id)], tag_key=['A'], tag_value=['x'])) == {
+        '_id': {'$in': [task_id]}, 'tags.A': 'x'}
+    with pytest.raises(InvalidRequestError):
+        get_tasks_filter_query(TesTasksFilterModel(tag_value=['x']))
+
+
+def test_etags_change_with_versions_and_view_and_match_weakly():
+    task_id = ObjectId()
+    etag = tasks_etag([(task_id, 1)], False, TesTaskView.MINIMAL)
+    assert etag != tasks_etag([(task_id, 2)], False, TesTaskView.MINIMAL)
+    assert etag != tasks_etag([(task_id, 1)], True, TesTaskView.MINIMAL)
+    assert etag != tasks_etag([(task_id, 1)], False, TesTaskView.FULL)
+    assert etag_matches(f'"other", W/{etag}', etag) and etag_matches('*', etag)
+    assert not etag_matches(None, task_etag(1, None)) and not etag_matches(task_etag(1, None), task_etag(2, None))
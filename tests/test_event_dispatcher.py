@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymonad.maybe import Just
+from pymonad.promise import Promise
+
+from tesp_api.service import task_retry
+from tesp_api.service import error as error_module
+from tesp_api.api.endpoints import task_endpoints
+from tesp_api.service.event_handler import local_handler
+from tesp_api.service.task_context import TaskContext
+from tesp_api.service.error import pulsar_event_handle_interrupt
+from tesp_api.repository.model.task import TesTaskLog
+from tesp_api.service.event_dispatcher import dispatch_event, drain_events, open_admission, close_admission, \
+    ensure_admission_open, EventAdmissionClosedError
+
+
+def test_tasks_are_refused_while_admission_is_closed():
+    close_admission()
+    with pytest.raises(EventAdmissionClosedError):
+        ensure_admission_open()
+    app = FastAPI()
+    app.include_router(task_endpoints.router, prefix='/v1')
+
+    with TestClient(app) as client:
+        response = client.post('/v1/tasks', json={'executors': [{'image': 'alpine', 'command': ['true']}]})
+
+    assert response.status_code == 503
+    open_admission()
+    ensure_admission_open()
+    close_admission()
+
+
+def test_drain_waits_for_follow_up_events_and_cancels_stuck_ones_at_deadline():
+    finished = []
+
+    @local_handler.register(event_name='test_drain_first')
+    async def first(event):
+        await asyncio.sleep(0.01)
+        dispatch_event('test_drain_follow_up', event[1])
+
+    @local_handler.register(event_name='test_drain_follow_up')
+    async def follow_up(event):
+        await asyncio.sleep(0.01)
+        finished.append(event[1].task_id)
+
+    @local_handler.register(event_name='test_drain_stuck')
+    async def stuck(event):
+        await asyncio.sleep(60)
+
+    drained, stuck_context = TaskContext(ObjectId()), TaskContext(ObjectId())
+
+    async def drain():
+        dispatch_event('test_drain_first', drained)
+        dispatch_event('test_drain_stuck', stuck_context)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        unfinished = await drain_events(0.3)
+        return unfinished, loop.time() - started
+
+    unfinished, elapsed = asyncio.run(drain())
+    assert finished == [drained.task_id]
+    assert unfinished == [('test_drain_stuck', stuck_context)] and elapsed < 1
+
+
+def test_interrupted_task_job_is_erased_and_task_queued_again_with_new_attempt(monkeypatch):
+    task_id, erased, released, updates = ObjectId(), [], [], []
+
+    class RepositoryStub:
+        async def forget_pulsar_job(self, _task_id):
+            pass
+
+        async def get_task_view(self, search_query, projection):
+            return Just(SimpleNamespace(logs=[TesTaskLog(logs=[], outputs=[], system_logs=[])]))
+
+        async def update_task_view(self, search_query, update_query, projection):
+            updates.append((search_query, update_query))
+            return Just({})
+
+    class OperationsStub:
+        def erase_job(self, job_id):
+            return Promise(lambda resolve, reject: resolve(job_id)).map(erased.append)
+
+    async def release(_task_id):
+        released.append(_task_id)
+    monkeypatch.setattr(error_module, 'task_repository', RepositoryStub())
+    monkeypatch.setattr(task_retry, 'task_repository', RepositoryStub())
+    monkeypatch.setattr(error_module.resource_scheduler, 'release', release)
+
+    async def interrupt():
+        await pulsar_event_handle_interrupt(task_id, 'run_task', Just(OperationsStub()))
+    asyncio.run(interrupt())
+
+    assert erased == [str(task_id)] and released == [task_id]
+    assert updates[0][0]['_id'] == task_id and updates[0][1]['$set']['state'] == 'QUEUED'
+    assert updates[0][1]['$set']['requeued'] is True and len(updates[0][1]['$set']['logs']) == 2
+    assert updates[0][1]['$set']['logs'][0]['system_logs'] == \
+           ['Task processing was interrupted by service shutdown, task was queued again']
@@ -0,0 +1,23 @@
+import subprocess
+
+from tesp_api.utils.executor_batch import executors_batch_script, parse_batch_manifest
+
+
+def run_batch(tmp_path, run_commands):
+    manifest_path = tmp_path / 'manifest.tsv'
+    script_path = tmp_path / 'script.sh'
+    script_path.write_text(executors_batch_script(run_commands, str(manifest_path)))
+    subprocess.run(['sh', str(script_path)], check=True)
+    return parse_batch_manifest(manifest_path.read_bytes())
+
+
+def test_batch_runs_all_executors(tmp_path):
+    executor_logs = run_batch(tmp_path, ['echo first', 'sh -c "echo second; echo oops >&2"'])
+    assert [(log.exit_code, log.stdout, log.stderr) for log in executor_logs] == [
+        (0, 'first\n', ''), (0, 'second\n', 'oops\n')]
+    assert all(log.start_time <= log.end_time for log in executor_logs)
+
+
+def test_batch_stops_on_first_failure(tmp_path):
+    executor_logs = run_batch(tmp_path, ['echo first', 'sh -c "exit 3"', 'echo never'])
+    assert [log.exit_code for log in executor_logs] == [0, 3]
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+from pymonad.maybe import Just
+
+from tesp_api.service import fair_share_scheduler as scheduler_module
+from tesp_api.service.fair_share_scheduler import FairShareScheduler
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.repository.model.task import TesTaskState
+
+
+class QueueStub:
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    def queued(self, group=None):
+        return [task for task in self.tasks
+                if 'slot' not in task['queue'] and group in (None, task['queue']['group'])]
+
+    async def release_finished_slots(self):
+        return 0
+
+    async def get_slot_holders(self):
+        return [task for task in self.tasks if 'slot' in task['queue']]
+
+    async def claim_slot(self, task_id, slot):
+        task = next(task for task in self.tasks if task['_id'] == task_id)
+        task['queue']['slot'] = slot
+        return Just(task)
+
+    async def release_slot(self, task_id):
+        for task in self.tasks:
+            if task['_id'] == task_id:
+                task['queue'].pop('slot', None)
+
+    async def get_queue_summary(self):
+        groups = {task['queue']['group'] for task in self.queued()}
+        return [{'group': group, 'depth': len(self.queued(group)),
+                 'oldest': min(task['creation_time'] for task in self.queued(group))}
+                for group in groups]
+
+    async def get_queue_heads(self, group):
+        queued = self.queued(group)
+        return [max(queued, key=lambda task: (task['queue']['priority'], [-ord(c) for c in task['creation_time']])),
+                min(queued, key=lambda task: task['creation_time'])] if queued else []
+
+
+def queued_task(group: str, priority: int, minute: int) -> dict:
+    return {'_id': ObjectId(), 'queue': {'group': group, 'priority': priority},
+            'creation_time': f'2026-10-19T10:{minute:02d}:00+00:00'}
+
+
+def test_slots_are_shared_between_groups_by_weight_and_priority(monkeypatch):
+    sweep = [queued_task('sweep', 0, minute) for minute in range(10)]
+    urgent, regular = queued_task('lab', 5, 30), queued_task('lab', 0, 20)
+    queue = QueueStub([*sweep, regular, urgent])
+    monkeypatch.setattr(scheduler_module, 'task_repository', queue)
+    scheduler = FairShareScheduler(3, 'PROJECT_GROUP', 'PRIORITY', {'sweep': 2}, 0, 60)
+    dispatched = []
+    scheduler._dispatch = dispatched.append
+
+    asyncio.run(scheduler._schedule())
+    assert dispatched == [sweep[0]['_id'], urgent['_id'], sweep[1]['_id']]
+
+    asyncio.run(scheduler._schedule())
+    assert len(dispatched) == 3
+    asyncio.run(scheduler.release(urgent['_id']))
+    queue.tasks.remove(urgent)
+    asyncio.run(scheduler._schedule())
+    assert dispatched[-1] == regular['_id']
+
+
+def test_waiting_raises_priority_of_old_tasks(monkeypatch):
+    old, new = queued_task('lab', 0, 0), queued_task('lab', 5, 59)
+    monkeypatch.setattr(scheduler_module, 'task_repository', QueueStub([old, new]))
+    scheduler = FairShareScheduler(1, 'PROJECT_GROUP', 'PRIORITY', {}, 1, 60)
+    dispatched = []
+    scheduler._dispatch = dispatched.append
+
+    asyncio.run(scheduler._schedule())
+    assert dispatched == [old['_id']]
+
+
+def test_schedulers_of_service_workers_sharing_queue_never_dispatch_task_twice(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    repository = TaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    monkeypatch.setattr(scheduler_module, 'task_repository', repository)
+    tasks = [{**queued_task('lab', 0, minute), 'state': TesTaskState.QUEUED} for minute in range(6)]
+    workers = [FairShareScheduler(4, 'PROJECT_GROUP', 'PRIORITY', {}, 0, 60) for _ in range(2)]
+    dispatched = [[], []]
+    for worker, worker_dispatched in zip(workers, dispatched):
+        worker._dispatch = worker_dispatched.append
+        worker._wakeup = asyncio.Event()
+
+    async def schedule():
+        await repository._create_indexes()
+        await repository._tasks.insert_many(tasks)
+        for _ in range(3):
+            await asyncio.gather(*[worker._schedule() for worker in workers])
+        first = dispatched[0][0] if dispatched[0] else dispatched[1][0]
+        await repository._tasks.update_one({'_id': first}, {'$set': {'state': TesTaskState.COMPLETE}})
+        for _ in range(3):
+            await asyncio.gather(*[worker._schedule() for worker in workers])
+    asyncio.run(schedule())
+
+    all_dispatched = dispatched[0] + dispatched[1]
+    assert len(all_dispatched) == len(set(all_dispatched)) == 5
+    assert sorted(all_dispatched) == [task['_id'] for task in tasks[:5]]
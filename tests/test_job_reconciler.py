@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+
+import pytest
+from bson.objectid import ObjectId
+from pymonad.maybe import Just, Nothing
+
+from tesp_api.service import job_reconciler as reconciler_module
+from tesp_api.service.job_reconciler import JobReconciler
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.service.resource_scheduler import NodeCapacity
+
+
+class RepositoryStub:
+
+    def __init__(self, tasks):
+        self.tasks = {task['_id']: task for task in tasks}
+        self.failed = []
+
+    @staticmethod
+    def stale_tasks_query(unprocessed_since):
+        return {}
+
+    async def get_stale_tasks(self, unprocessed_since, limit):
+        return [task for task in self.tasks.values()
+                if task['state'] in ('INITIALIZING', 'RUNNING') and not task.get('heartbeat')][:limit]
+
+    async def update_task_view(self, search_query, update_query, projection):
+        task = self.tasks[search_query['_id']]
+        if task['state'] != search_query['state']:
+            return Nothing
+        task['state'] = update_query['$set']['state']
+        self.failed.append(task['_id'])
+        return Just(task)
+
+    async def get_orphaned_jobs(self, unprocessed_since, limit):
+        return [task for task in self.tasks.values() if 'pulsar_job' in task and not task.get('heartbeat')
+                and task['state'] not in ('QUEUED', 'INITIALIZING', 'RUNNING')][:limit]
+
+    async def forget_pulsar_job(self, task_id):
+        del self.tasks[task_id]['pulsar_job']
+
+    async def record_failed_erase(self, task_id, now):
+        pass
+
+    async def claim_requeued_task(self):
+        return Nothing
+
+
+class OperationsStub:
+
+    def __init__(self, unreachable_jobs):
+        self.unreachable_jobs = unreachable_jobs
+        self.erased = []
+
+    async def erase_job(self, job_id):
+        if job_id in self.unreachable_jobs:
+            raise ConnectionError('refused')
+        self.erased.append(job_id)
+
+
+async def release_nothing():
+    pass
+
+
+def task(state: str, node: str = None) -> dict:
+    return {'_id': ObjectId(), 'state': state, **({'pulsar_job': {'node': node}} if node else {})}
+
+
+def test_jobs_of_finished_and_lost_tasks_are_erased(monkeypatch):
+    canceled, unreachable, processed, lost = task('CANCELED', 'node-1'), task('COMPLETE', 'node-1'), \
+        task('RUNNING', 'node-1'), task('RUNNING', 'node-1')
+    processed['heartbeat'] = True
+    repository = RepositoryStub([canceled, unreachable, processed, lost, task('COMPLETE')])
+    operations = OperationsStub([unreachable['_id']])
+    monkeypatch.setattr(reconciler_module, 'task_repository', repository)
+    monkeypatch.setattr(reconciler_module.pulsar_service, 'get_operations', lambda node: operations)
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'nodes', [NodeCapacity(name='node-1')])
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'release_finished', release_nothing)
+
+    asyncio.run(JobReconciler(60, 10, 1000, 3600, 30).reconcile())
+    assert repository.failed == [lost['_id']]
+    assert operations.erased == [canceled['_id'], lost['_id']]
+    assert 'pulsar_job' in unreachable and 'pulsar_job' in processed
+
+
+class MongomockTaskRepository(TaskRepository):
+
+    def update_task_view(self, search_query, update_query, projection):
+        # all positional operator of system log push is not supported by mongomock
+        return super().update_task_view(search_query, {'$set': update_query['$set']}, projection)
+
+
+def test_tasks_are_stale_only_once_their_worker_stops_refreshing_heartbeat(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    repository = MongomockTaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    monkeypatch.setattr(reconciler_module, 'task_repository', repository)
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'nodes', [])
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'release_finished', release_nothing)
+    long_ago = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=2)).isoformat()
+    # long running task of another worker, task of crashed worker and task claimed by crashed worker
+    other_worker, crashed_worker, claimed = [
+        {'_id': ObjectId(), 'state': state, 'creation_time': long_ago, 'queue': queue}
+        for state, queue in (('RUNNING', {}), ('RUNNING', {}), ('QUEUED', {'slot': 0}))]
+    waiting = {'_id': ObjectId(), 'state': 'QUEUED', 'creation_time': long_ago, 'queue': {}}
+
+    async def reconcile():
+        await repository._tasks.insert_many([other_worker, crashed_worker, claimed, waiting])
+        await repository.refresh_heartbeats([other_worker['_id']], datetime.datetime.now(datetime.timezone.utc))
+        await JobReconciler(60, 10, 1000, 3600, 30).reconcile()
+        return {task['_id']: task['state'] for task in await repository._tasks.find({}).to_list(None)}
+
+    states = asyncio.run(reconcile())
+    assert states == {other_worker['_id']: 'RUNNING', crashed_worker['_id']: 'SYSTEM_ERROR',
+                      claimed['_id']: 'SYSTEM_ERROR', waiting['_id']: 'QUEUED'}
+
+
+def test_jobs_failing_to_be_erased_do_not_keep_others_waiting(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    repository = MongomockTaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    unreachable, reachable = [task('COMPLETE', 'node-1') for _ in range(2)], task('COMPLETE', 'node-1')
+    operations = OperationsStub([job['_id'] for job in unreachable])
+    monkeypatch.setattr(reconciler_module, 'task_repository', repository)
+    monkeypatch.setattr(reconciler_module.pulsar_service, 'get_operations', lambda node: operations)
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'nodes', [NodeCapacity(name='node-1')])
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'release_finished', release_nothing)
+
+    async def reconcile():
+        repository.write_coalescer.start(repository._tasks)
+        await repository._tasks.insert_many([*unreachable, reachable])
+        # no limit of erase rate, batch is smaller than the number of orphaned jobs
+        for _ in range(2):
+            await JobReconciler(60, 2, 0, 3600, 30).reconcile()
+        await repository.write_coalescer.close()
+        return await repository._tasks.find_one({'_id': reachable['_id']})
+
+    erased = asyncio.run(reconcile())
+    assert operations.erased == [reachable['_id']] and 'pulsar_job' not in erased
+
+
+def test_task_requeued_by_shutting_down_worker_is_resumed_once(monkeypatch):
+    mongomock_motor = pytest.importorskip('mongomock_motor')
+    repository = MongomockTaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    submitted = []
+    monkeypatch.setattr(reconciler_module, 'task_repository', repository)
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'nodes', [])
+    monkeypatch.setattr(reconciler_module.resource_scheduler, 'release_finished', release_nothing)
+    monkeypatch.setattr(reconciler_module.fair_share_scheduler, 'submit', submitted.append)
+    requeued, canceled = {'_id': ObjectId(), 'state': 'QUEUED', 'requeued': True}, \
+        {'_id': ObjectId(), 'state': 'CANCELED', 'requeued': True}
+
+    async def reconcile():
+        await repository._tasks.insert_many([requeued, canceled])
+        for _ in range(2):
+            await JobReconciler(60, 10, 1000, 3600, 30).reconcile()
+        return await repository._tasks.find_one({'_id': requeued['_id']})
+
+    resumed = asyncio.run(reconcile())
+    assert submitted == [requeued['_id']] and resumed['state'] == 'QUEUED' and 'requeued' not in resumed
+
+
+def test_worker_refreshes_heartbeat_of_tasks_it_processes(monkeypatch):
+    refreshed = []
+
+    class HeartbeatRepositoryStub:
+        async def refresh_heartbeats(self, task_ids, now):
+            refreshed.append(task_ids)
+    processed = ObjectId()
+    monkeypatch.setattr(reconciler_module, 'task_repository', HeartbeatRepositoryStub())
+    monkeypatch.setattr(reconciler_module, 'in_flight_task_ids', lambda: [processed, processed])
+
+    asyncio.run(JobReconciler(60, 10, 1000, 3600, 30).heartbeat())
+    assert refreshed == [[processed]]
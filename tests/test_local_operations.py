@@ -0,0 +1,66 @@
+import asyncio
+from pathlib import Path
+
+from bson.objectid import ObjectId
+from pymonad.maybe import Just
+
+from tesp_api.service.local_operations import LocalOperations
+from tesp_api.service.pulsar_operations import DataType
+
+
+async def wait(promise):
+    return await promise
+
+
+def test_job_stages_files_and_reports_exit_code_with_output_tail(tmp_path):
+    operations = LocalOperations(str(tmp_path), max_output_size=8)
+    job_id = ObjectId()
+
+    async def run():
+        job = await operations.setup_job(job_id)
+        input_path = await operations.upload(job_id, DataType.INPUT, 'data/in.txt', Just('hello'))
+        output_path = await operations.upload(job_id, DataType.OUTPUT, 'out.txt')
+        status = await operations.run_job(
+            job_id, f'cat {input_path} > {output_path}; echo 0123456789abcdef; echo failed >&2; exit 3')
+        output = await operations.download_output(job_id, 'out.txt')
+        await operations.erase_job(job_id)
+        return job, status, output
+
+    job, status, output = asyncio.run(run())
+    assert job['outputs_directory'] == str(tmp_path / str(job_id) / 'outputs')
+    assert status['returncode'] == 3 and status['stderr'] == 'failed\n'
+    assert status['stdout'] == '[output truncated to last 8 bytes]\n9abcdef\n'
+    assert output == b'hello' and not (tmp_path / str(job_id)).exists()
+
+
+def test_erasing_job_kills_its_running_process(tmp_path):
+    operations = LocalOperations(str(tmp_path), max_output_size=1024)
+    job_id = ObjectId()
+
+    async def run():
+        await operations.setup_job(job_id)
+        job = asyncio.create_task(wait(operations.run_job(job_id, 'echo started; sleep 30')))
+        await asyncio.sleep(0.2)
+        await operations.erase_job(job_id)
+        return await asyncio.wait_for(job, 5)
+
+    status = asyncio.run(run())
+    assert status['returncode'] == -9 and status['stdout'] == 'started\n'
+
+
+def test_canceled_run_kills_its_process(tmp_path):
+    operations = LocalOperations(str(tmp_path), max_output_size=1024)
+    job_id, pid_file = ObjectId(), tmp_path / 'pid'
+
+    async def run():
+        await operations.setup_job(job_id)
+        job = asyncio.create_task(wait(operations.run_job(job_id, f'sleep 30 & echo $! > {pid_file}; wait')))
+        await asyncio.sleep(0.2)
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    stat = Path('/proc') / pid_file.read_text().strip() / 'stat'
+    # killed process is gone or left as zombie until reaped by init
+    assert not stat.exists() or stat.read_text().split()[2] == 'Z'
@@ -0,0 +1,81 @@
+import time
+import logging
+import threading
+
+from loguru import logger
+
+from tesp_api.config.log_config import RateLimitFilter, InterceptLogHandler, BackgroundStreamSink, dropped_records
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limit_filter_drops_only_limited_low_level_records():
+    clock = FakeClock()
+    rate_limit = RateLimitFilter({'noisy': 2}, clock=clock)
+    debug, warning = logger.level('DEBUG'), logger.level('WARNING')
+    assert [rate_limit({'name': 'noisy', 'level': debug}) for _ in range(3)] == [True, True, False]
+    assert rate_limit({'name': 'noisy', 'level': warning})
+    assert rate_limit({'name': 'quiet', 'level': debug})
+    clock.now = 0.5
+    assert rate_limit({'name': 'noisy', 'level': debug})
+    assert rate_limit.dropped == {'noisy': 1}
+    assert dropped_records.value(reason='rate_limit', logger='noisy') >= 1
+
+
+def test_intercepted_records_keep_their_origin():
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record), level='INFO')
+    stdlib_logger = logging.getLogger('tests.intercepted')
+    stdlib_logger.handlers, stdlib_logger.propagate = [InterceptLogHandler()], False
+    stdlib_logger.setLevel(logging.INFO)
+    try:
+        stdlib_logger.info('intercepted %s', 'message')
+    finally:
+        logger.remove(handler_id)
+    assert [(record['name'], record['function'], record['message'], record['level'].name) for record in records] == \
+           [('tests.intercepted', 'test_intercepted_records_keep_their_origin', 'intercepted message', 'INFO')]
+
+
+class BlockedStream:
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.written = []
+
+    def write(self, message):
+        self.released.wait()
+        self.written.append(str(message))
+
+    def flush(self):
+        pass
+
+
+class Message(str):
+
+    def __new__(cls, text, level):
+        message = super().__new__(cls, text)
+        message.record = {'name': 'tests.sink', 'level': logger.level(level)}
+        return message
+
+
+def test_full_background_sink_drops_only_records_below_warning():
+    stream = BlockedStream()
+    sink = BackgroundStreamSink(stream, max_buffered=1)
+    dropped_before = dropped_records.value(reason='buffer_full', logger='tests.sink')
+    sink(Message('written\n', 'INFO'))
+    while not sink._buffer.empty():
+        time.sleep(0.001)
+    sink(Message('buffered\n', 'INFO'))
+    sink(Message('dropped\n', 'DEBUG'))
+    threading.Timer(0.05, stream.released.set).start()
+    sink(Message('kept\n', 'WARNING'))
+    sink.stop()
+    assert stream.written == ['written\n', 'buffered\n', 'kept\n'] and sink.dropped == 1
+    assert dropped_records.value(reason='buffer_full', logger='tests.sink') == dropped_before + 1
@@ -0,0 +1,18 @@
+import time
+import asyncio
+
+from tesp_api.utils.loop_watchdog import LoopWatchdog, slow_callbacks
+
+
+def test_watchdog_detects_blocked_loop():
+    async def block_loop():
+        watchdog = LoopWatchdog(interval=0.02, lag_threshold=0.1)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+        watchdog.stop()
+
+    blocked_before = slow_callbacks.value()
+    asyncio.run(block_loop())
+    assert slow_callbacks.value() == blocked_before + 1
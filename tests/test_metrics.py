@@ -0,0 +1,17 @@
+from tesp_api.utils.metrics import MetricsRegistry
+
+
+def test_metrics_exposition():
+    registry = MetricsRegistry()
+    registry.counter('pulls_total', 'Pulls', ['node']).inc(2, node='a')
+    registry.histogram('latency_seconds', 'Latency', buckets=[1, 5]).observe(3)
+    assert registry.expose().splitlines() == [
+        '# HELP pulls_total Pulls', '# TYPE pulls_total counter', 'pulls_total{node="a"} 2.0',
+        '# HELP latency_seconds Latency', '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="1.0"} 0', 'latency_seconds_bucket{le="5.0"} 1',
+        'latency_seconds_bucket{le="+Inf"} 1', 'latency_seconds_sum 3.0', 'latency_seconds_count 1']
+
+
+def test_registry_returns_already_registered_metric():
+    registry = MetricsRegistry()
+    assert registry.gauge('depth', 'Depth') is registry.gauge('depth', 'Depth')
@@ -0,0 +1,14 @@
+from pymonad.maybe import Just
+
+from tesp_api.config.properties import properties
+from tesp_api.service.pulsar_service import PulsarService
+from tesp_api.service.resource_scheduler import NodeCapacity
+
+
+def test_nodes_without_url_are_served_by_default_pulsar():
+    pulsar_service = PulsarService()
+    node = pulsar_service.get_operations(Just(NodeCapacity(name='gpu', url='http://gpu:8913')))
+    default = pulsar_service.get_operations(Just(NodeCapacity(name='cpu')))
+
+    assert node.base_url == 'http://gpu:8913'
+    assert default.base_url == properties.pulsar.url and default is pulsar_service.get_operations()
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from tesp_api.utils.resilience import RetryPolicy, CircuitBreaker, CircuitBreakerState, CircuitBreakerOpenError
+
+
+class FlakyOperation:
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError()
+        return self.calls
+
+
+def test_retry_policy_retries_until_success():
+    operation = FlakyOperation(failures=2)
+    policy = RetryPolicy(max_attempts=3, retry_on=(ConnectionError,))
+    assert asyncio.run(policy.run(operation)) == 3
+
+
+def test_retry_policy_gives_up_after_max_attempts():
+    operation = FlakyOperation(failures=5)
+    policy = RetryPolicy(max_attempts=3, retry_on=(ConnectionError,))
+    with pytest.raises(ConnectionError):
+        asyncio.run(policy.run(operation))
+    assert operation.calls == 3
+
+
+def test_retry_policy_respects_should_retry():
+    async def never(_error): return False
+    operation = FlakyOperation(failures=1)
+    policy = RetryPolicy(max_attempts=3, retry_on=(ConnectionError,))
+    with pytest.raises(ConnectionError):
+        asyncio.run(policy.run(operation, should_retry=never))
+    assert operation.calls == 1
+
+
+def test_retry_policy_backoff_is_bounded():
+    policy = RetryPolicy(max_attempts=10, base_delay=0.5, max_delay=2)
+    assert all(0 <= policy.backoff(attempt) <= 2 for attempt in range(0, 10))
+
+
+def test_circuit_breaker_opens_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker('pulsar', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    for _ in range(0, 2):
+        with pytest.raises(ConnectionError):
+            asyncio.run(breaker.call(FlakyOperation(failures=1)))
+    assert breaker.state == CircuitBreakerState.OPEN
+    with pytest.raises(CircuitBreakerOpenError):
+        asyncio.run(breaker.call(FlakyOperation(failures=0)))
+
+    now[0] = 10.0
+    assert asyncio.run(breaker.call(FlakyOperation(failures=0))) == 1
+    assert breaker.state == CircuitBreakerState.CLOSED
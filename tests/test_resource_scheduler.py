@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+
+from tesp_api.repository.model.task import TesTaskResources
+from tesp_api.repository.node_repository import NodeRepository
+from tesp_api.service import resource_scheduler as scheduler_module
+from tesp_api.service.resource_scheduler import ResourceScheduler, NodeCapacity, TaskPlacementError, \
+    RESOURCE_DIMENSIONS
+
+mongomock_motor = pytest.importorskip('mongomock_motor')
+
+
+def nodes():
+    return [NodeCapacity(name='small', cpu_cores=2, ram_gb=4, zones=['eu']),
+            NodeCapacity(name='large', cpu_cores=8, ram_gb=32, zones=['us'])]
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    repository = NodeRepository()
+    repository._nodes = mongomock_motor.AsyncMongoMockClient().tesp['nodes']
+    monkeypatch.setattr(scheduler_module, 'node_repository', repository)
+    return repository
+
+
+def scheduler(poll_interval: float = 60):
+    _scheduler = ResourceScheduler(nodes(), poll_interval)
+    return _scheduler
+
+
+def test_best_fit_prefers_tightest_node(repository):
+    async def place():
+        _scheduler = scheduler()
+        await _scheduler.init()
+        small = await _scheduler.acquire(ObjectId(), TesTaskResources(cpu_cores=2, ram_gb=2))
+        large = await _scheduler.acquire(ObjectId(), TesTaskResources(cpu_cores=1, ram_gb=1))
+        zoned = await _scheduler.acquire(ObjectId(), TesTaskResources(cpu_cores=1, zones=['us']))
+        return small.name, large.name, zoned.name
+    assert asyncio.run(place()) == ('small', 'large', 'large')
+
+
+def test_task_exceeding_every_node_is_rejected(repository):
+    with pytest.raises(TaskPlacementError):
+        asyncio.run(scheduler().acquire(ObjectId(), TesTaskResources(cpu_cores=4, zones=['eu'])))
+
+
+def test_task_is_held_back_until_resources_are_released(repository):
+    async def place():
+        _scheduler = scheduler()
+        await _scheduler.init()
+        first_id, second_id = ObjectId(), ObjectId()
+        await _scheduler.acquire(first_id, TesTaskResources(cpu_cores=8))
+        held_back = asyncio.create_task(_scheduler.acquire(second_id, TesTaskResources(cpu_cores=8)))
+        await asyncio.sleep(0.01)
+        assert not held_back.done()
+        await _scheduler.release(first_id)
+        return (await held_back).name
+    assert asyncio.run(place()) == 'large'
+
+
+def test_retried_task_avoids_node_it_failed_on_when_possible(repository):
+    async def place():
+        _scheduler = scheduler()
+        await _scheduler.init()
+        retried = await _scheduler.acquire(ObjectId(), TesTaskResources(cpu_cores=1), ['small'])
+        only_option = await _scheduler.acquire(ObjectId(), TesTaskResources(cpu_cores=1, zones=['eu']), ['small'])
+        return retried.name, only_option.name
+    assert asyncio.run(place()) == ('large', 'small')
+
+
+def test_service_workers_share_capacity_and_placements_of_nodes(repository):
+    # every worker has its own scheduler, tasks are placed concurrently by both of them
+    async def place():
+        workers = [scheduler(poll_interval=0.01), scheduler(poll_interval=0.01)]
+        await workers[0].init()
+        await workers[1].init()
+        task_ids = [ObjectId() for _ in range(6)]
+        placing = [asyncio.create_task(workers[index % 2].acquire(task_id, TesTaskResources(cpu_cores=2)))
+                   for index, task_id in enumerate(task_ids)]
+        await asyncio.sleep(0.05)
+        placed = [task_id for task_id, task in zip(task_ids, placing) if task.done()]
+        usage = await repository.get_usage()
+        # placement is known to the other worker, which releases it and so lets the held back task in
+        other_worker_placement = await workers[1].placement(placed[0])
+        await workers[1].release(placed[0])
+        await asyncio.wait_for(asyncio.gather(*placing), 1)
+        return placed, usage, other_worker_placement
+
+    placed, usage, other_worker_placement = asyncio.run(place())
+    assert len(placed) == 5 and other_worker_placement is not None
+    assert usage == {'small': {'cpu_cores': 2, 'ram_gb': 0, 'disk_gb': 0},
+                     'large': {'cpu_cores': 8, 'ram_gb': 0, 'disk_gb': 0}}
+    assert set(RESOURCE_DIMENSIONS) == set(usage['small'])
+
+
+def test_resources_of_tasks_finished_without_release_are_released(repository, monkeypatch):
+    running, finished = ObjectId(), ObjectId()
+
+    class TaskRepositoryStub:
+        async def get_active_task_ids(self, task_ids):
+            return [task_id for task_id in task_ids if task_id == running]
+    monkeypatch.setattr(scheduler_module, 'task_repository', TaskRepositoryStub())
+
+    async def release():
+        _scheduler = scheduler()
+        await _scheduler.init()
+        await _scheduler.acquire(running, TesTaskResources(cpu_cores=1))
+        await _scheduler.acquire(finished, TesTaskResources(cpu_cores=1))
+        await _scheduler.release_finished()
+        return await _scheduler.placement(running), await _scheduler.placement(finished), \
+            await repository.get_usage()
+
+    running_placement, finished_placement, usage = asyncio.run(release())
+    assert running_placement is not None and finished_placement is None
+    assert usage[running_placement.name]['cpu_cores'] == 1 and sum(node['cpu_cores'] for node in usage.values()) == 1
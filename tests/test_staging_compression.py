@@ -0,0 +1,60 @@
+import os
+import gzip
+import asyncio
+import subprocess
+
+from bson.objectid import ObjectId
+
+from tesp_api.service.event_actions import download_compressed_output
+from tesp_api.service.pulsar_operations import PulsarOperationsError
+from tesp_api.service.staging_compression import StagingCompression
+
+
+def test_only_large_low_entropy_inputs_are_compressed():
+    compression = StagingCompression(True, min_size=1024, max_entropy=6.5, sample_size=4096, level=6)
+    assert compression.should_compress(b'ACGT' * 1024)
+    assert not compression.should_compress(b'ACGT' * 16)
+    assert not compression.should_compress(os.urandom(8192))
+
+
+def test_job_decompresses_inputs_and_compresses_outputs_keeping_exit_code(tmp_path):
+    compression = StagingCompression(True, min_size=0, max_entropy=8, sample_size=4096, level=6)
+    staged_input, output = tmp_path / 'input', tmp_path / 'output'
+    staged_input.with_suffix('.gz').write_bytes(gzip.compress(b'ACGT' * 64))
+
+    first, last = compression.wrap_run_commands(
+        [f'cat {staged_input} > {output}', 'exit 3'], [str(staged_input)], [str(output), str(tmp_path / 'missing')])
+    assert subprocess.run(['sh', '-c', first]).returncode == 0
+    assert subprocess.run(['sh', '-c', last]).returncode == 3
+    assert not (tmp_path / 'output.gz').exists()
+
+    _, last = compression.wrap_run_commands(['true', 'true'], [], [str(output), str(tmp_path / 'missing')])
+    assert subprocess.run(['sh', '-c', last]).returncode == 0
+    assert gzip.decompress((tmp_path / 'output.gz').read_bytes()) == b'ACGT' * 64
+    assert not (tmp_path / 'missing.gz').exists()
+
+
+def test_outputs_below_min_size_stay_uncompressed_and_are_downloaded_raw(tmp_path):
+    compression = StagingCompression(True, min_size=1024, max_entropy=8, sample_size=4096, level=6)
+    small, large = tmp_path / 'small', tmp_path / 'large'
+    small.write_bytes(b'ACGT' * 16)
+    large.write_bytes(b'ACGT' * 1024)
+
+    _, last = compression.wrap_run_commands(['true', 'true'], [], [str(small), str(large)])
+    assert subprocess.run(['sh', '-c', last]).returncode == 0
+    assert not (tmp_path / 'small.gz').exists() and (tmp_path / 'large.gz').exists()
+
+    class OperationsStub:
+
+        def download_output(self, job_id, file_name):
+            async def download():
+                try:
+                    return (tmp_path / file_name).read_bytes()
+                except FileNotFoundError as error:
+                    raise PulsarOperationsError(error)
+            return download()
+
+    async def download(file_name):
+        return await download_compressed_output(OperationsStub(), ObjectId(), file_name)
+    assert asyncio.run(download('small')) == b'ACGT' * 16
+    assert asyncio.run(download('large')) == b'ACGT' * 1024
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+from pymonad.maybe import Nothing
+
+from tesp_api.service import error as error_module
+from tesp_api.service import task_canceller as canceller_module
+from tesp_api.service.task_canceller import TaskCanceller
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.repository.model.task import TesTaskState
+
+mongomock_motor = pytest.importorskip('mongomock_motor')
+
+
+def test_tasks_matching_filter_are_canceled_by_one_update_and_stopped_through_bounded_queue(monkeypatch):
+    repository = TaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    canceller = TaskCanceller(concurrency=2, queue_size=3)
+    stopped, queue_sizes, updates = [], [], []
+
+    async def cancel_task_events(task_id):
+        queue_sizes.append(canceller._queue.qsize())
+        await asyncio.sleep(0)
+
+    async def handle_cancel(task_id, pulsar_operations):
+        stopped.append(task_id)
+
+    update_many = repository._tasks.update_many
+
+    async def counted_update_many(search_query, update_query):
+        updates.append(search_query)
+        return await update_many(search_query, update_query)
+    repository._tasks.update_many = counted_update_many
+    monkeypatch.setattr(canceller_module, 'task_repository', repository)
+    monkeypatch.setattr(canceller_module, 'cancel_task_events', cancel_task_events)
+    monkeypatch.setattr(canceller_module, 'pulsar_event_handle_cancel', handle_cancel)
+
+    async def placement(task_id):
+        return None
+    monkeypatch.setattr(canceller_module.resource_scheduler, 'placement', placement)
+
+    sweep = [{'_id': ObjectId(), 'state': TesTaskState.RUNNING, 'tags': {'PROJECT_GROUP': 'sweep'}} for _ in range(20)]
+    finished = {'_id': ObjectId(), 'state': TesTaskState.COMPLETE, 'tags': {'PROJECT_GROUP': 'sweep'}}
+    other = {'_id': ObjectId(), 'state': TesTaskState.RUNNING, 'tags': {'PROJECT_GROUP': 'lab'}}
+
+    async def cancel():
+        await repository._tasks.insert_many([*sweep, finished, other])
+        canceller.start()
+        counts = await canceller.cancel_tasks({'tags.PROJECT_GROUP': 'sweep'}, None)
+        while len(stopped) < len(sweep):
+            await asyncio.sleep(0.01)
+        await canceller.stop()
+        return counts, {task['_id']: task['state'] for task in await repository._tasks.find({}).to_list(None)}
+
+    counts, states = asyncio.run(cancel())
+    assert counts == {'matched': 20, 'canceled': 20}
+    assert len(updates) == 1 and '_id' not in updates[0]
+    assert sorted(stopped) == [task['_id'] for task in sweep] and max(queue_sizes) <= 3
+    assert {states[task['_id']] for task in sweep} == {TesTaskState.CANCELED}
+    assert states[finished['_id']] == TesTaskState.COMPLETE and states[other['_id']] == TesTaskState.RUNNING
+
+
+def test_failing_poll_of_task_canceled_by_another_worker_keeps_it_canceled(monkeypatch):
+    repository = TaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    monkeypatch.setattr(error_module, 'task_repository', repository)
+    canceled, running = ObjectId(), ObjectId()
+
+    async def fail():
+        await repository._tasks.insert_many([{'_id': canceled, 'state': TesTaskState.CANCELED},
+                                             {'_id': running, 'state': TesTaskState.RUNNING}])
+        for task_id in (canceled, running):
+            await error_module.repo_update_error_task_promise(task_id, TesTaskState.SYSTEM_ERROR, Nothing)
+        return {task['_id']: task['state'] for task in await repository._tasks.find({}).to_list(None)}
+
+    states = asyncio.run(fail())
+    assert states == {canceled: TesTaskState.CANCELED, running: TesTaskState.SYSTEM_ERROR}
@@ -0,0 +1,45 @@
+import asyncio
+
+from bson.objectid import ObjectId
+
+from tesp_api.service import event_actions
+from tesp_api.service.event_handler import local_handler
+from tesp_api.service.resource_scheduler import NodeCapacity
+from tesp_api.service.task_deadlines import TaskDeadlines, TASK_DEADLINE_EXCEEDED
+from tesp_api.utils.timer_wheel import TimerWheel
+
+
+def test_expired_deadline_cancels_job_on_node_of_current_attempt(monkeypatch):
+    task_id, expired, canceled = ObjectId(), [], []
+    placements = {str(task_id): NodeCapacity(name='node-1')}
+
+    async def handle_timeout(_task_id, event_name, pulsar_operations):
+        canceled.append((event_name, pulsar_operations.maybe(None, lambda operations: operations)))
+
+    async def cancel_task_events(_task_id):
+        pass
+    async def placement(_task_id):
+        return placements.get(str(_task_id))
+    monkeypatch.setattr(event_actions.resource_scheduler, 'placement', placement)
+    monkeypatch.setattr(event_actions.pulsar_service, 'get_operations', lambda node: f'operations of {node.value.name}')
+    monkeypatch.setattr(event_actions, 'pulsar_event_handle_timeout', handle_timeout)
+    monkeypatch.setattr(event_actions, 'cancel_task_events', cancel_task_events)
+    monkeypatch.setattr(
+        'tesp_api.service.task_deadlines.dispatch_event', lambda event_name, context: expired.append(context))
+
+    deadlines = TaskDeadlines(TimerWheel(0.01, 8), 'DEADLINE_SECONDS', 0, 'EXECUTOR_TIMEOUT_SECONDS', 0)
+
+    async def run():
+        deadlines.wheel.start()
+        deadlines.start_task(task_id, {'DEADLINE_SECONDS': '0.05'})
+        # task is retried on another node while its deadline is running
+        placements[str(task_id)] = NodeCapacity(name='node-2')
+        deadlines.start_task(task_id, {'DEADLINE_SECONDS': '0.05'})
+        while not expired:
+            await asyncio.sleep(0.01)
+        await deadlines.wheel.stop()
+        await local_handler.handle((TASK_DEADLINE_EXCEEDED, expired[0]))
+    asyncio.run(run())
+
+    assert [context.task_id for context in expired] == [task_id]
+    assert canceled == [(TASK_DEADLINE_EXCEEDED, 'operations of node-2')]
@@ -0,0 +1,90 @@
+import asyncio
+
+from bson.objectid import ObjectId
+from pymonad.maybe import Just, Nothing
+
+from tesp_api.service import task_retry
+from tesp_api.utils.resilience import RetryPolicy
+from tesp_api.service.task_retry import prepare_task_retry, StagedInputs, ACTIVE_STATES
+from tesp_api.service.pulsar_operations import PulsarOperationsError
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskLog, TesTaskState
+
+
+class RepositoryStub:
+
+    def __init__(self, attempts: int, state: TesTaskState = TesTaskState.RUNNING):
+        self.logs = [TesTaskLog(logs=[], outputs=[], system_logs=[]) for _ in range(attempts)]
+        self.state = state
+        self.updates = []
+
+    async def get_task_view(self, search_query, projection):
+        return Just(RegisteredTesTask.construct(logs=list(self.logs))) \
+            if self.state in search_query['state']['$in'] else Nothing
+
+    async def update_task_view(self, search_query, update_query, projection):
+        self.updates.append((search_query, update_query))
+        return Just(RegisteredTesTask.construct()) if self.state in search_query['state']['$in'] else Nothing
+
+
+def prepare(monkeypatch, repository: RepositoryStub):
+    monkeypatch.setattr(task_retry, 'task_repository', repository)
+    monkeypatch.setattr(task_retry, 'task_retry_policy', RetryPolicy(max_attempts=3, base_delay=10, max_delay=300))
+
+    async def retry():
+        return await prepare_task_retry(ObjectId(), PulsarOperationsError(ConnectionError('refused')))
+    return asyncio.run(retry())
+
+
+def test_failed_attempt_is_closed_and_task_requeued_with_new_log(monkeypatch):
+    repository = RepositoryStub(attempts=1)
+    delay = prepare(monkeypatch, repository)
+
+    search_query, update_query = repository.updates[0]
+    logs = update_query['$set']['logs']
+    assert 0 < delay <= 300 and search_query['state'] == {'$in': ACTIVE_STATES}
+    assert update_query['$set']['state'] == TesTaskState.QUEUED and len(logs) == 2
+    assert logs[0]['end_time'] is not None and 'task will be retried [attempt: 2' in logs[0]['system_logs'][0]
+    assert logs[1] == {'logs': [], 'outputs': [], 'system_logs': [], 'start_time': None, 'end_time': None,
+                       'metadata': None}
+
+
+def test_task_is_not_retried_once_attempts_are_exhausted_or_it_left_active_states(monkeypatch):
+    exhausted = RepositoryStub(attempts=3)
+    canceled = RepositoryStub(attempts=1, state=TesTaskState.CANCELED)
+
+    assert prepare(monkeypatch, exhausted) is None and exhausted.updates == []
+    assert prepare(monkeypatch, canceled) is None
+
+
+def test_staged_inputs_are_reused_by_next_attempt_and_discarded(tmp_path):
+    staged_inputs, disabled = StagedInputs(True, str(tmp_path), 8), StagedInputs(False, str(tmp_path / 'disabled'), 8)
+    task_id = ObjectId()
+
+    async def stage():
+        await staged_inputs.put(task_id, 0, b'input')
+        await staged_inputs.put(task_id, 1, b'too large input')
+        await disabled.put(task_id, 0, b'input')
+        reused = await staged_inputs.get(task_id, 0), await staged_inputs.get(task_id, 1), \
+            await disabled.get(task_id, 0)
+        await staged_inputs.discard(task_id)
+        return reused, await staged_inputs.get(task_id, 0)
+
+    reused, discarded = asyncio.run(stage())
+    assert reused == (b'input', None, None) and discarded is None
+    assert not (tmp_path / str(task_id)).exists() and not (tmp_path / 'disabled').exists()
+
+
+def test_staged_inputs_of_tasks_no_longer_processed_are_discarded(tmp_path, monkeypatch):
+    staged_inputs, running, lost = StagedInputs(True, str(tmp_path), 8), ObjectId(), ObjectId()
+
+    class TaskRepositoryStub:
+        async def get_active_task_ids(self, task_ids):
+            return [task_id for task_id in task_ids if task_id == running]
+    monkeypatch.setattr(task_retry, 'task_repository', TaskRepositoryStub())
+
+    async def stage():
+        await staged_inputs.put(running, 0, b'input')
+        await staged_inputs.put(lost, 0, b'input')
+        await staged_inputs.discard_finished()
+    asyncio.run(stage())
+    assert (tmp_path / str(running)).exists() and not (tmp_path / str(lost)).exists()
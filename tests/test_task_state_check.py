@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from bson.objectid import ObjectId
+from pymonad.maybe import Just, Nothing
+from pymonad.promise import Promise
+
+from tesp_api.service.error import TaskNotFoundError
+from tesp_api.repository import task_repository_utils
+from tesp_api.repository.model.task import TesTaskState
+
+
+class RepositoryStub:
+
+    def __init__(self, state):
+        self.state = state
+        self.queries = []
+
+    def get_task_view(self, search_query, projection):
+        self.queries.append((search_query, projection))
+        found = Just({'_id': search_query['_id']}) if search_query['state'] == self.state else Nothing
+        return Promise(lambda resolve, reject: resolve(found))
+
+
+def ensure_running(monkeypatch, state):
+    repository = RepositoryStub(state)
+    monkeypatch.setattr(task_repository_utils, 'task_repository', repository)
+
+    async def ensure():
+        return await task_repository_utils.ensure_task_state(ObjectId(), TesTaskState.RUNNING)
+    asyncio.run(ensure())
+    return repository
+
+
+def test_running_task_passes_state_check_by_projection_read(monkeypatch):
+    repository = ensure_running(monkeypatch, TesTaskState.RUNNING)
+    assert repository.queries[0][0]['state'] == TesTaskState.RUNNING and repository.queries[0][1] == []
+
+
+def test_task_canceled_between_executors_fails_state_check(monkeypatch):
+    with pytest.raises(TaskNotFoundError):
+        ensure_running(monkeypatch, TesTaskState.CANCELED)
@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from tesp_api.api.endpoints import task_endpoints
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.repository.model.task import TesTaskState
+
+
+class CursorStub:
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class CollectionStub:
+
+    def __init__(self):
+        self.pipelines = []
+
+    async def count_documents(self, query):
+        return 2 if query['state'] == TesTaskState.RUNNING else 0
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        if '$percentile' in str(pipeline):
+            return CursorStub([{'count': 3, 'p50': 1.5, 'p90': 9.0, 'p99': 12.0}])
+        return CursorStub([{'_id': 'alice-lab', 'count': 4}])
+
+
+def test_duration_percentiles_are_estimated_by_database_without_collecting_durations():
+    repository = TaskRepository()
+    repository._tasks = CollectionStub()
+    window_start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+    async def get_stats():
+        return await repository.get_task_stats(['PROJECT_GROUP'], window_start)
+    stats = asyncio.run(get_stats())
+
+    assert stats['durations'] == {'count': 3, 'p50': 1.5, 'p90': 9.0, 'p99': 12.0}
+    assert stats['states'][TesTaskState.RUNNING] == 2 and stats['tags'] == {'PROJECT_GROUP': {'alice-lab': 4}}
+    durations_pipeline = next(pipeline for pipeline in repository._tasks.pipelines if '$percentile' in str(pipeline))
+    group = next(stage['$group'] for stage in durations_pipeline if '$group' in stage)
+    assert group['percentiles']['$percentile']['p'] == [0.5, 0.9, 0.99]
+    assert '$push' not in str(durations_pipeline) and '$sort' not in str(durations_pipeline)
+
+
+def test_stats_endpoint_refuses_not_indexed_tag_keys(monkeypatch):
+    async def get_task_stats(tag_keys, window_start):
+        return {'states': {state: 0 for state in TesTaskState}, 'durations': {'count': 0}, 'tags': {
+            tag_key: {} for tag_key in tag_keys}}
+    monkeypatch.setattr(task_endpoints.task_repository, 'get_task_stats', get_task_stats)
+    app = FastAPI()
+    app.include_router(task_endpoints.router, prefix='/v1')
+
+    with TestClient(app) as client:
+        indexed = client.get('/v1/tasks:stats', params={'tag_key': 'PROJECT_GROUP', 'window_hours': 1})
+        not_indexed = client.get('/v1/tasks:stats', params={'tag_key': 'OWNER'})
+
+    assert indexed.status_code == 200 and indexed.json()['tags'] == {'PROJECT_GROUP': {}}
+    assert not_indexed.status_code == 400
+
+
+def test_duration_percentiles_are_estimated_from_histogram_before_mongodb_7():
+    class HistogramCollectionStub(CollectionStub):
+        def aggregate(self, pipeline):
+            self.pipelines.append(pipeline)
+            if '$bucket' in str(pipeline):
+                # durations 1..10 and 100 seconds
+                return CursorStub([{'_id': 5, 'count': 10, 'min': 1.0, 'max': 10.0},
+                                   {'_id': 60, 'count': 1, 'min': 100.0, 'max': 100.0}])
+            return CursorStub([])
+
+    repository = TaskRepository()
+    repository._tasks = HistogramCollectionStub()
+    repository._percentile_supported = False
+    window_start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+    async def get_stats():
+        return await repository.get_task_stats([], window_start)
+    durations = asyncio.run(get_stats())['durations']
+
+    assert durations['count'] == 11 and durations['p99'] == 100.0
+    assert abs(durations['p50'] - (1 + 0.55 * 9)) < 1e-9 and durations['p50'] <= durations['p90'] <= 10.0
+    assert '$percentile' not in str(repository._tasks.pipelines) and '$push' not in str(repository._tasks.pipelines)
@@ -0,0 +1,43 @@
+import asyncio
+import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from tesp_api.api.endpoints.endpoint_utils import task_etag
+from tesp_api.repository.task_repository import TaskRepository
+from tesp_api.repository.model.task import RegisteredTesTask, TesTaskExecutor, TesTaskState, TesTaskLog, TesTaskView
+
+mongomock_motor = pytest.importorskip('mongomock_motor')
+
+
+def test_etag_changes_after_every_repository_write():
+    repository = TaskRepository()
+    repository._tasks = mongomock_motor.AsyncMongoMockClient().tesp['tasks']
+    task = RegisteredTesTask(
+        executors=[TesTaskExecutor(image='alpine', command=['true'])], state=TesTaskState.QUEUED,
+        logs=[TesTaskLog(logs=[], outputs=[], system_logs=[])],
+        creation_time=datetime.datetime.now(datetime.timezone.utc).isoformat())
+
+    async def write():
+        repository.write_coalescer.start(repository._tasks)
+        task_id = await repository.create_task(task)
+
+        async def etag():
+            version = await repository.get_task_version({'_id': task_id})
+            return task_etag(version.value, TesTaskView.FULL)
+        etags = [await etag()]
+        await repository.update_task({'_id': task_id}, {'$set': {'name': 'updated'}})
+        etags.append(await etag())
+        await repository.update_task_view({'_id': task_id}, {'$set': {'state': TesTaskState.RUNNING}}, [])
+        etags.append(await etag())
+        await repository.update_task_view_later({'_id': task_id}, [{'$set': {'description': 'coalesced'}}])
+        await repository.write_coalescer.settle(task_id)
+        etags.append(await etag())
+        await repository.cancel_tasks({'_id': task_id, 'state': TesTaskState.RUNNING}, ObjectId())
+        etags.append(await etag())
+        await repository.write_coalescer.close()
+        return etags
+
+    etags = asyncio.run(write())
+    assert len(set(etags)) == len(etags) == 5
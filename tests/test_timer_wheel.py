@@ -0,0 +1,20 @@
+from tesp_api.utils.timer_wheel import TimerWheel
+
+
+def test_timers_fire_at_their_tick_across_revolutions():
+    wheel, fired = TimerWheel(tick=1, slots=4), []
+    wheel.schedule('short', 2, lambda: fired.append('short'))
+    wheel.schedule('long', 9, lambda: fired.append('long'))
+    wheel.schedule('canceled', 1, lambda: fired.append('canceled'))
+    wheel.schedule('rescheduled', 1, lambda: fired.append('rescheduled'))
+    wheel.cancel('canceled')
+    wheel.schedule('rescheduled', 3, lambda: fired.append('rescheduled'))
+
+    ticks = []
+    for tick in range(1, 10):
+        wheel.advance()
+        ticks.append((tick, list(fired)))
+        fired.clear()
+
+    assert [(tick, names) for tick, names in ticks if names] == [(2, ['short']), (3, ['rescheduled']), (9, ['long'])]
+    assert len(wheel) == 0
@@ -0,0 +1,29 @@
+import asyncio
+
+from tesp_api.utils.tracing import TaskTracer, SPAN_STATUS_ERROR
+
+
+def test_spans_are_recorded_within_active_trace():
+    tracer = TaskTracer()
+
+    async def traced_work():
+        with tracer.activate('6256a3b8c0e3ab1bb4a6ac1e'), tracer.span('phase.run'):
+            with tracer.span('pulsar.request', **{'http.method': 'GET'}):
+                await asyncio.sleep(0)
+            try:
+                with tracer.span('ftp.upload'):
+                    raise ConnectionError('refused')
+            except ConnectionError:
+                pass
+        with tracer.span('outside.trace') as span:
+            assert span is None
+
+    asyncio.run(traced_work())
+    trace = tracer.pop_trace('6256a3b8c0e3ab1bb4a6ac1e')
+    phase, request, upload = trace.spans
+    assert (phase.parent_span_id, request.parent_span_id, upload.parent_span_id) == \
+           (None, phase.span_id, phase.span_id)
+    assert upload.status == SPAN_STATUS_ERROR
+    assert set(trace.summary()) == {'trace_id', 'span_phase_run_ms', 'span_pulsar_request_ms', 'span_ftp_upload_ms'}
+    otlp_spans = trace.to_otlp_json('tesp-api')['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert [span['traceId'] for span in otlp_spans] == ['000000006256a3b8c0e3ab1bb4a6ac1e'] * 3
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from pydantic import parse_obj_as
+
+from tesp_api.utils.types import TransferUrl
+from tesp_api.service.transfer_backends import chunked, regrouped, buffered, parallel_ranges, FileTransferBackend
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_chunks_are_regrouped_into_parts():
+    parts = asyncio.run(collect(regrouped(chunked(b'0123456789', 3), 4)))
+    assert parts == [b'0123', b'4567', b'89']
+
+
+def test_buffered_stream_propagates_reader_errors():
+    async def failing_chunks():
+        yield b'first'
+        raise ConnectionResetError('storage went away')
+
+    async def read():
+        received = []
+        try:
+            async for chunk in buffered(failing_chunks(), 2):
+                received.append(chunk)
+        except ConnectionResetError:
+            return received
+    assert asyncio.run(read()) == [b'first']
+
+
+def test_parallel_ranges_are_yielded_in_order_with_bounded_concurrency():
+    content = bytes(range(100))
+    in_flight, max_in_flight = 0, 0
+
+    async def read_range(start: int, end: int) -> bytes:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # later ranges finish first
+        await asyncio.sleep((100 - start) / 10000)
+        in_flight -= 1
+        return content[start:end + 1]
+
+    parts = asyncio.run(collect(parallel_ranges(read_range, len(content), 30, 3)))
+    assert b''.join(parts) == content and len(parts) == 4
+    assert max_in_flight == 3
+
+
+def test_file_urls_are_confined_to_allowed_directories_and_outputs_are_moved(tmp_path):
+    data, job = tmp_path / 'data', tmp_path / 'job'
+    data.mkdir(), job.mkdir()
+    (job / 'out').write_bytes(b'result')
+    backend = FileTransferBackend(4, 8, 2, allowed_directories=[str(data)], shared=True)
+
+    async def stage():
+        await backend.write(parse_obj_as(TransferUrl, f'file://{data}/in%20put'), chunked(b'0123456789', 3))
+        content = b''.join(await collect(backend.read(parse_obj_as(TransferUrl, f'file://{data}/in%20put'))))
+        await backend.move(str(job / 'out'), parse_obj_as(TransferUrl, f'file://{data}/results/out'))
+        return content
+    assert asyncio.run(stage()) == b'0123456789'
+    assert (data / 'results' / 'out').read_bytes() == b'result' and not (job / 'out').exists()
+    with pytest.raises(PermissionError):
+        backend.path(parse_obj_as(TransferUrl, f'file://{data}/../job/out'))
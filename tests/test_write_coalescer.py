@@ -0,0 +1,57 @@
+import asyncio
+
+from tesp_api.repository.write_coalescer import WriteCoalescer
+
+
+class CollectionStub:
+
+    def __init__(self):
+        self.bulk_writes = []
+
+    async def bulk_write(self, requests, ordered):
+        await asyncio.sleep(0)
+        self.bulk_writes.append([request._filter['_id'] for request in requests])
+
+
+def test_updates_are_flushed_in_bounded_batches_before_readers_continue():
+    collection = CollectionStub()
+
+    async def write():
+        coalescer = WriteCoalescer(window=10, max_batch=3, max_pending=4)
+        coalescer.start(collection)
+        for document_id in range(4):
+            await coalescer.submit(document_id, {'_id': document_id}, {'$set': {'written': True}})
+        # batch is full, buffer is not, submitting of the fifth update waits for the flush
+        fifth = asyncio.create_task(coalescer.submit(4, {'_id': 4}, {'$set': {'written': True}}))
+        await coalescer.settle(1)
+        flushed_before_fifth = [list(batch) for batch in collection.bulk_writes]
+        await fifth
+        await coalescer.close()
+        return flushed_before_fifth
+
+    assert asyncio.run(write()) == [[0, 1, 2], [3]]
+    assert collection.bulk_writes == [[0, 1, 2], [3], [4]]
+
+
+def test_readers_of_documents_whose_updates_were_lost_get_the_bulk_write_error():
+    class FailingCollectionStub:
+        async def bulk_write(self, requests, ordered):
+            raise ConnectionError('connection lost')
+
+    async def write():
+        coalescer = WriteCoalescer(window=10, max_batch=2, max_pending=4)
+        coalescer.start(FailingCollectionStub())
+        await coalescer.submit(0, {'_id': 0}, {'$set': {'written': True}})
+        await coalescer.submit(1, {'_id': 1}, {'$set': {'written': True}})
+        errors = []
+        for document_id in (0, 0, 2):
+            try:
+                await coalescer.settle(document_id)
+                errors.append(None)
+            except ConnectionError as error:
+                errors.append(str(error))
+        await coalescer.close()
+        return errors
+
+    # error is raised to first reader only, documents of other batches are unaffected
+    assert asyncio.run(write()) == ['connection lost', None, None]